@@ -0,0 +1,116 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Validade assumida quando o token não é um JWT com `exp`
+TOKEN_TTL_PADRAO = int(os.environ.get("SICAP_TOKEN_TTL", "600"))
+# Renova o token um pouco antes de expirar
+TOKEN_MARGEM = 60
+# Tokens guardados (um por credencial); além disso sai o usado há mais tempo
+TOKEN_CACHE_MAX = int(os.environ.get("SICAP_TOKEN_CACHE_MAX", "256"))
+
+# Chave aleatória por processo: o hash das credenciais não serve fora daqui
+_CHAVE_HASH = secrets.token_bytes(32)
+
+
+def chave_credenciais(usuario, senha):
+    msg = f"{usuario}\0{senha}".encode("utf-8")
+    return hmac.new(_CHAVE_HASH, msg, hashlib.sha256).hexdigest()
+
+
+def expiracao_jwt(token):
+    """Retorna o `exp` (epoch) de um JWT, ou None se não for possível ler."""
+    try:
+        partes = str(token).split(".")
+        if len(partes) != 3:
+            return None
+        corpo = partes[1] + "=" * (-len(partes[1]) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(corpo)).get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+
+class _Voo:
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.token = None
+        self.erro = None
+
+
+class TokenCache:
+    """Cache de tokens do SICAP por usuário.
+
+    A chave é um HMAC das credenciais (a senha nunca fica guardada). Chamadas
+    simultâneas para o mesmo usuário compartilham um único login em andamento;
+    falhas de login não são cacheadas. A cada login novo saem os tokens
+    vencidos e, acima de `maximo`, os usados há mais tempo (LRU).
+    """
+
+    def __init__(self, login, ttl_padrao=TOKEN_TTL_PADRAO, margem=TOKEN_MARGEM, maximo=TOKEN_CACHE_MAX):
+        self._login = login
+        self._ttl_padrao = ttl_padrao
+        self._margem = margem
+        self._maximo = maximo
+        self._tokens = OrderedDict()
+        self._voos = {}
+        self._lock = threading.Lock()
+
+    def obter(self, usuario, senha):
+        chave = chave_credenciais(usuario, senha)
+        with self._lock:
+            item = self._tokens.get(chave)
+            if item and item[1] - self._margem > time.time():
+                self._tokens.move_to_end(chave)
+                logging.info(f"Reutilizando token em cache para usuario: {usuario}")
+                return item[0]
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+
+        if not lider:
+            voo.pronto.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.token
+
+        try:
+            token = self._login(usuario, senha)
+            exp = expiracao_jwt(token) or (time.time() + self._ttl_padrao)
+            with self._lock:
+                self._tokens[chave] = (token, exp)
+                self._tokens.move_to_end(chave)
+                self._despejar()
+            voo.token = token
+            return token
+        except Exception as e:
+            voo.erro = e
+            raise
+        finally:
+            with self._lock:
+                self._voos.pop(chave, None)
+            voo.pronto.set()
+
+    def _despejar(self):
+        # chamado com o lock
+        limite = time.time() + self._margem
+        for chave in [c for c, (_, exp) in self._tokens.items() if exp <= limite]:
+            del self._tokens[chave]
+        while len(self._tokens) > self._maximo:
+            self._tokens.popitem(last=False)
+
+    def invalidar(self, usuario, senha, token=None):
+        # com `token`, só remove se ainda for o mesmo (outro job pode já ter renovado)
+        chave = chave_credenciais(usuario, senha)
+        with self._lock:
+            item = self._tokens.get(chave)
+            if item and (token is None or item[0] == token):
+                del self._tokens[chave]
@@ -0,0 +1,274 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .reader import PlanilhaLida, ler_planilha
+except ImportError:
+    from reader import PlanilhaLida, ler_planilha
+
+# pyarrow é opcional; sem ele o cache fica desligado e toda leitura abre o Excel
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+
+# Abas 600/610 já lidas, guardadas em Arrow IPC (lidas com memory-map) e
+# indexadas pelo SHA-256 do arquivo: reenviar a mesma planilha depois de
+# corrigir o mapeamentos.json não passa de novo pelo parser do Excel.
+# As abas guardam dados pessoais dos prestadores: o cache só liga com uma
+# pasta configurada, criada com permissão 0700 e arquivos 0600.
+#
+# Configuração via ambiente:
+#   SICAP_CACHE_PLANILHAS      pasta do cache (vazio ou "0": desligado, o padrão)
+#   SICAP_CACHE_PLANILHAS_MB   tamanho máximo; sai primeiro o que foi usado há mais tempo
+CACHE_DIR = os.environ.get("SICAP_CACHE_PLANILHAS", "")
+CACHE_MAX_BYTES = int(float(os.environ.get("SICAP_CACHE_PLANILHAS_MB", "512")) * 1024 * 1024)
+
+# Entra na chave: mudar quando o formato gravado ou o resultado de
+# reader.ler_planilha mudar para a mesma planilha
+VERSAO = 1
+
+# Colunas object guardam um código de tipo por célula e uma coluna Arrow por
+# tipo presente; assim str, int, float, datetime e NaN voltam exatamente como
+# o parser deixou (um CPF numérico continua int, uma data em texto continua str)
+_NULO, _STR, _INT, _FLOAT, _DATA, _BOOL = range(6)
+_CODIGOS = {str: _STR, int: _INT, float: _FLOAT, datetime: _DATA, bool: _BOOL}
+_INT64 = (-(2 ** 63), 2 ** 63 - 1)
+
+
+class _NaoSuportado(Exception):
+    pass
+
+
+def sha256_origem(origem) -> str:
+    """SHA-256 de um caminho, bytes ou arquivo aberto (volta ao início depois)."""
+    h = hashlib.sha256()
+    if isinstance(origem, (bytes, bytearray)):
+        h.update(origem)
+    elif isinstance(origem, io.BytesIO):
+        h.update(origem.getbuffer())
+    elif hasattr(origem, "read"):
+        posicao = origem.tell()
+        for bloco in iter(lambda: origem.read(1024 * 1024), b""):
+            h.update(bloco)
+        origem.seek(posicao)
+    else:
+        with open(origem, "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(bloco)
+    return h.hexdigest()
+
+
+def _tipo_arrow(codigo):
+    return {
+        _STR: pa.string(), _INT: pa.int64(), _FLOAT: pa.float64(), _DATA: pa.timestamp("us"), _BOOL: pa.bool_(),
+    }[codigo]
+
+
+def _codificar_objetos(valores, prefixo):
+    codigos = np.empty(len(valores), dtype=np.int8)
+    por_tipo = {}
+    for k, v in enumerate(valores):
+        if v is None:
+            codigos[k] = _NULO
+            continue
+        codigo = _CODIGOS.get(type(v))
+        if codigo is None:
+            raise _NaoSuportado(f"célula do tipo {type(v).__name__}")
+        if codigo == _INT and not _INT64[0] <= v <= _INT64[1]:
+            raise _NaoSuportado("inteiro fora do int64")
+        if codigo == _DATA and v.tzinfo is not None:
+            raise _NaoSuportado("data com fuso horário")
+        codigos[k] = codigo
+        lista = por_tipo.get(codigo)
+        if lista is None:
+            lista = por_tipo[codigo] = [None] * len(valores)
+        lista[k] = v
+    colunas = {prefixo: pa.array(codigos)}
+    for codigo, lista in por_tipo.items():
+        colunas[f"{prefixo}_{codigo}"] = pa.array(lista, type=_tipo_arrow(codigo))
+    return colunas, sorted(por_tipo)
+
+
+def _decodificar_objetos(tabela, prefixo, tipos_presentes):
+    codigos = tabela.column(prefixo).to_numpy()
+    listas = {codigo: tabela.column(f"{prefixo}_{codigo}").to_pylist() for codigo in tipos_presentes}
+    valores = np.empty(len(codigos), dtype=object)
+    for codigo, lista in listas.items():
+        for k in np.flatnonzero(codigos == codigo):
+            valores[k] = lista[k]
+    return valores
+
+
+def _frame_para_tabela(df, extra=None):
+    colunas, descricao = {}, []
+    for i, nome in enumerate(df.columns):
+        serie = df.iloc[:, i]
+        prefixo = f"c{i}"
+        dtype = serie.dtype
+        if dtype == object:
+            novas, presentes = _codificar_objetos(serie.tolist(), prefixo)
+            colunas.update(novas)
+            descricao.append({"nome": nome, "dtype": "object", "tipos": presentes})
+        elif isinstance(dtype, pd.StringDtype):
+            colunas[prefixo] = pa.array(serie.to_numpy(dtype=object, na_value=None), type=pa.string())
+            descricao.append({"nome": nome, "dtype": str(dtype)})
+        elif isinstance(dtype, np.dtype) and dtype.kind in "biufM":
+            colunas[prefixo] = pa.array(serie.to_numpy())
+            descricao.append({"nome": nome, "dtype": dtype.str})
+        else:
+            raise _NaoSuportado(f"coluna {nome!r} com dtype {dtype}")
+    metadados = {"colunas": descricao, "linhas": len(df), "extra": extra or {}}
+    try:
+        json_meta = json.dumps(metadados, ensure_ascii=False)
+    except (TypeError, ValueError) as e:
+        raise _NaoSuportado(f"metadados: {e}")
+    tabela = pa.table(colunas) if colunas else pa.table({})
+    return tabela.replace_schema_metadata({"sicap": json_meta})
+
+
+def _tabela_para_frame(tabela):
+    metadados = json.loads(tabela.schema.metadata[b"sicap"])
+    dados = {}
+    for i, coluna in enumerate(metadados["colunas"]):
+        prefixo = f"c{i}"
+        if coluna["dtype"] == "object":
+            dados[i] = pd.Series(_decodificar_objetos(tabela, prefixo, coluna["tipos"]), dtype=object)
+        elif coluna["dtype"] in ("str", "string"):
+            dados[i] = pd.Series(tabela.column(prefixo).to_pylist(), dtype=coluna["dtype"])
+        else:
+            # numéricos saem direto do arquivo mapeado em memória
+            dados[i] = pd.Series(tabela.column(prefixo).to_numpy(), dtype=np.dtype(coluna["dtype"]))
+    if not metadados["colunas"]:
+        return pd.DataFrame(index=range(metadados["linhas"])), metadados["extra"]
+    df = pd.DataFrame(dados, index=pd.RangeIndex(metadados["linhas"]))
+    df.columns = [c["nome"] for c in metadados["colunas"]]
+    return df, metadados["extra"]
+
+
+class CachePlanilhas:
+    """Cache em disco das abas lidas por `ler_planilha`, com despejo LRU.
+
+    Cada entrada é uma pasta `<chave>/` com `600.arrow` e `610.arrow`; a
+    chave junta o SHA-256 do arquivo, os campos pedidos e `VERSAO`. A pasta
+    é gravada com outro nome e renomeada no fim, então leitores (inclusive
+    de outros processos) nunca veem uma entrada pela metade. Usar uma
+    entrada atualiza o mtime dela, que decide a ordem de despejo.
+
+    Qualquer falha do cache vira leitura normal do Excel.
+    """
+
+    def __init__(self, pasta=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.pasta = pasta
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self):
+        return pa is not None and self.pasta not in ("", "0") and self.max_bytes > 0
+
+    def chave(self, origem, esperado, sha256=None) -> str:
+        # uploads já chegam com o SHA-256 calculado na recepção
+        base = json.dumps([VERSAO, sha256 or sha256_origem(origem), esperado], sort_keys=True)
+        return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+    def obter(self, chave):
+        entrada = os.path.join(self.pasta, chave)
+        try:
+            tabelas = {}
+            for aba in ("600", "610"):
+                with pa.memory_map(os.path.join(entrada, f"{aba}.arrow")) as arquivo:
+                    tabelas[aba] = pa_ipc.open_file(arquivo).read_all()
+            empresa, _ = _tabela_para_frame(tabelas["600"])
+            prestadores, extra = _tabela_para_frame(tabelas["610"])
+            os.utime(entrada)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Entrada do cache de planilhas ignorada ({chave[:12]}): {e}")
+            return None
+        return PlanilhaLida(
+            empresa, prestadores, extra["colunas"], extra["cabecalho"], extra["backend"],
+            extra["perfil"], False, do_cache=True,
+        )
+
+    def guardar(self, chave, planilha: PlanilhaLida):
+        extra = {
+            "colunas": planilha.colunas,
+            "cabecalho": planilha.cabecalho,
+            "backend": planilha.backend,
+            "perfil": planilha.perfil,
+        }
+        try:
+            tabelas = {"600": _frame_para_tabela(planilha.empresa), "610": _frame_para_tabela(planilha.prestadores, extra)}
+        except _NaoSuportado as e:
+            logging.info(f"Planilha fora do cache ({chave[:12]}): {e}")
+            return
+        os.makedirs(self.pasta, mode=0o700, exist_ok=True)
+        temporaria = os.path.join(self.pasta, f".{chave}.{uuid.uuid4().hex}")
+        try:
+            os.makedirs(temporaria, mode=0o700)
+            for aba, tabela in tabelas.items():
+                descritor = os.open(os.path.join(temporaria, f"{aba}.arrow"), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with open(descritor, "wb") as arquivo, pa_ipc.new_file(arquivo, tabela.schema) as escritor:
+                    escritor.write_table(tabela)
+            os.rename(temporaria, os.path.join(self.pasta, chave))
+        except OSError:
+            # outro processo gravou a mesma planilha antes
+            shutil.rmtree(temporaria, ignore_errors=True)
+            return
+        self.despejar()
+
+    def despejar(self):
+        """Remove as entradas usadas há mais tempo até o cache caber em `max_bytes`."""
+        with self._lock:
+            entradas, total = [], 0
+            with os.scandir(self.pasta) as itens:
+                for item in itens:
+                    if item.name.startswith(".") or not item.is_dir():
+                        continue
+                    try:
+                        tamanho = sum(f.stat().st_size for f in os.scandir(item.path))
+                        entradas.append((item.stat().st_mtime, tamanho, item.path))
+                    except FileNotFoundError:
+                        continue
+                    total += tamanho
+            for _, tamanho, caminho in sorted(entradas):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(caminho, ignore_errors=True)
+                total -= tamanho
+
+    def ler(self, origem, esperado, sha256=None, **kwargs) -> PlanilhaLida:
+        """`ler_planilha(origem, esperado, **kwargs)`, passando pelo cache.
+
+        `sha256`, quando já conhecido (uploads), evita ler o arquivo de novo
+        só para montar a chave.
+        """
+        if not self.ativo:
+            return ler_planilha(origem, esperado, **kwargs)
+        try:
+            chave = self.chave(origem, esperado, sha256)
+        except OSError:
+            return ler_planilha(origem, esperado, **kwargs)
+        planilha = self.obter(chave)
+        if planilha is not None:
+            logging.info(f"Planilha lida do cache ({chave[:12]})")
+            return planilha
+        planilha = ler_planilha(origem, esperado, **kwargs)
+        try:
+            self.guardar(chave, planilha)
+        except Exception as e:
+            logging.warning(f"Falha ao gravar no cache de planilhas: {e}")
+        return planilha
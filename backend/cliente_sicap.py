@@ -0,0 +1,177 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# Configuração via ambiente (segundos, exceto as contagens):
+#   SICAP_TIMEOUT_CONEXAO    tempo para abrir a conexão
+#   SICAP_TIMEOUT_LOGIN      tempo de leitura da resposta do login
+#   SICAP_TIMEOUT_ENVIO      tempo de leitura da resposta do envio da folha
+#   SICAP_TENTATIVAS         tentativas por chamada (1 = sem repetição)
+#   SICAP_BACKOFF_BASE/MAX   espera exponencial com jitter entre tentativas
+#   SICAP_CIRCUITO_FALHAS    falhas seguidas que abrem o circuito
+#   SICAP_CIRCUITO_ESPERA    tempo com o circuito aberto antes de testar de novo
+TIMEOUT_CONEXAO = float(os.environ.get("SICAP_TIMEOUT_CONEXAO", "5"))
+TIMEOUT_LOGIN = float(os.environ.get("SICAP_TIMEOUT_LOGIN", "30"))
+TIMEOUT_ENVIO = float(os.environ.get("SICAP_TIMEOUT_ENVIO", "120"))
+TENTATIVAS = int(os.environ.get("SICAP_TENTATIVAS", "3"))
+BACKOFF_BASE = float(os.environ.get("SICAP_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("SICAP_BACKOFF_MAX", "8"))
+CIRCUITO_FALHAS = int(os.environ.get("SICAP_CIRCUITO_FALHAS", "5"))
+CIRCUITO_ESPERA = float(os.environ.get("SICAP_CIRCUITO_ESPERA", "30"))
+
+# Status que indicam SICAP com problema (contam para o circuito)
+STATUS_FALHA = (500, 502, 503, 504)
+# Chamadas idempotentes (login) repetem nesses status
+STATUS_REPETIR = (429, 500, 502, 503, 504)
+# Envio da folha não é idempotente: só repete quando o SICAP garante que
+# não processou o pedido. 503 fica de fora: atrás de proxy ou balanceador ele
+# também vem depois de o pedido ter chegado, e por isso interpretar_resposta
+# o trata como "a folha pode ter sido recebida"
+STATUS_REPETIR_NAO_IDEMPOTENTE = (429,)
+
+
+class SicapIndisponivel(ConnectionError):
+    pass
+
+
+def conexao_nao_estabelecida(erro):
+    # o pedido nem saiu: repetir é seguro mesmo para POST não idempotente.
+    # Timeout de leitura ou conexão caída depois do envio não entram: o
+    # SICAP pode ter recebido e processado o pedido.
+    if isinstance(erro, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(erro, requests.exceptions.ConnectionError):
+        causa = erro.args[0] if erro.args else None
+        motivo = getattr(causa, "reason", causa)
+        return isinstance(motivo, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+def espera_backoff(tentativa, base=BACKOFF_BASE, maximo=BACKOFF_MAX):
+    # "full jitter": sorteia entre 0 e o teto exponencial
+    return random.uniform(0, min(maximo, base * (2 ** tentativa)))
+
+
+class Circuito:
+    """Circuit breaker: `fechado` -> `aberto` após `falhas` seguidas; depois de
+    `espera` segundos deixa passar uma chamada de teste (`meio_aberto`)."""
+
+    def __init__(self, falhas=CIRCUITO_FALHAS, espera=CIRCUITO_ESPERA):
+        self.falhas = falhas
+        self.espera = espera
+        self._estado = "fechado"
+        self._falhas_seguidas = 0
+        self._aberto_em = 0.0
+        self._teste_em_andamento = False
+        self._ultimo_erro = None
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self._estado == "fechado":
+                return
+            restante = self.espera - (time.time() - self._aberto_em)
+            if self._estado == "aberto" and restante <= 0:
+                self._estado = "meio_aberto"
+                self._teste_em_andamento = False
+            if self._estado == "meio_aberto" and not self._teste_em_andamento:
+                self._teste_em_andamento = True
+                return
+        raise SicapIndisponivel(
+            f"SICAP indisponível no momento ({self._ultimo_erro}). "
+            f"Tente novamente em {max(1, int(restante))}s."
+        )
+
+    def sucesso(self):
+        with self._lock:
+            if self._estado != "fechado":
+                logging.info("SICAP respondeu; circuito fechado.")
+            self._estado = "fechado"
+            self._falhas_seguidas = 0
+            self._teste_em_andamento = False
+
+    def desistir(self):
+        # a chamada de teste terminou sem resposta do SICAP (erro local, ex.:
+        # lendo o corpo do spool): nem sucesso nem falha, libera outro teste
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def falha(self, motivo):
+        with self._lock:
+            self._falhas_seguidas += 1
+            self._ultimo_erro = motivo
+            self._teste_em_andamento = False
+            if self._estado == "meio_aberto" or self._falhas_seguidas >= self.falhas:
+                if self._estado != "aberto":
+                    logging.warning(f"Circuito do SICAP aberto após {self._falhas_seguidas} falha(s): {motivo}")
+                self._estado = "aberto"
+                self._aberto_em = time.time()
+
+    def info(self):
+        with self._lock:
+            info = {
+                "estado": self._estado,
+                "falhas_seguidas": self._falhas_seguidas,
+                "ultimo_erro": self._ultimo_erro,
+            }
+            if self._estado == "aberto":
+                info["reabre_em"] = round(max(0.0, self.espera - (time.time() - self._aberto_em)), 1)
+            return info
+
+
+class ClienteSicap:
+    """POSTs ao SICAP com timeouts separados, backoff e circuit breaker.
+
+    A sessão reaproveita conexões entre chamadas. `idempotente=False` restringe
+    as repetições aos casos em que o SICAP certamente não recebeu o pedido.
+    """
+
+    def __init__(self, tentativas=TENTATIVAS, circuito=None):
+        self.tentativas = max(1, tentativas)
+        self.circuito = circuito or Circuito()
+        self._sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self._sessao.mount("https://", adaptador)
+        self._sessao.mount("http://", adaptador)
+
+    def post(self, url, timeout_leitura, idempotente=True, **kwargs):
+        repetir_status = STATUS_REPETIR if idempotente else STATUS_REPETIR_NAO_IDEMPOTENTE
+        for tentativa in range(self.tentativas):
+            self.circuito.permitir()
+            ultima = tentativa == self.tentativas - 1
+            try:
+                r = self._sessao.post(url, timeout=(TIMEOUT_CONEXAO, timeout_leitura), **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.circuito.falha(type(e).__name__)
+                seguro = idempotente or conexao_nao_estabelecida(e)
+                if ultima or not seguro:
+                    raise
+                espera = espera_backoff(tentativa)
+                logging.warning(f"Falha de conexão com o SICAP ({type(e).__name__}); nova tentativa em {espera:.1f}s.")
+                time.sleep(espera)
+                continue
+            except BaseException:
+                self.circuito.desistir()
+                raise
+
+            if r.status_code in STATUS_FALHA:
+                self.circuito.falha(f"HTTP {r.status_code}")
+            else:
+                self.circuito.sucesso()
+            if ultima or r.status_code not in repetir_status:
+                return r
+            espera = espera_backoff(tentativa)
+            retry_after = r.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                espera = min(BACKOFF_MAX, float(retry_after))
+            logging.warning(f"SICAP respondeu {r.status_code}; nova tentativa em {espera:.1f}s.")
+            time.sleep(espera)
+
+    def info(self):
+        return {**self.circuito.info(), "tentativas": self.tentativas}
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+# Conversão das colunas da 610 para o formato do SICAP, por coluna inteira:
+# operações `.str` vetorizadas, formatos de data explícitos e caminhos diretos
+# para células que já chegam como número ou data.
+
+# Data enviada quando a célula está vazia ou não é uma data
+DATA_PADRAO = "1900-01-01T00:00:00"
+FORMATO_DATA = "%Y-%m-%dT00:00:00"
+
+# Formatos aceitos para datas digitadas como texto, na ordem de tentativa
+# (dia antes do mês, como nas planilhas; ISO com o ano na frente)
+FORMATOS_DATA = (
+    "%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y",
+)
+
+# Data serial do Excel: dias desde 30/12/1899 (até 31/12/9999)
+_ORIGEM_EXCEL = pd.Timestamp("1899-12-30")
+_SERIAL_MAX = 2958465
+
+
+# tipo de cada célula de uma coluna object, como array (para máscaras)
+_tipos = np.frompyfunc(type, 1, 1)
+
+
+def _valores_de_texto(textos):
+    # regras de parse_money para cada texto distinto (folhas repetem muito o mesmo valor)
+    codigos, unicos = pd.factorize(textos)
+    t = pd.Series(unicos, dtype="str").str.replace("R$", "", regex=False).str.strip()
+    virgula = t.str.rfind(",").to_numpy()
+    ponto = t.str.rfind(".").to_numpy()
+    milhar_ponto = (virgula >= 0) & (ponto >= 0) & (virgula > ponto)  # "1.234,56"
+    milhar_virgula = (virgula >= 0) & (ponto >= 0) & (virgula < ponto)  # "1,234.56"
+    so_virgula = (virgula >= 0) & (ponto < 0)  # "1234,5"
+    t = t.to_numpy(dtype=object)
+    if milhar_ponto.any():
+        t[milhar_ponto] = pd.Series(t[milhar_ponto], dtype="str").str.replace(".", "", regex=False).str.replace(",", ".", regex=False).to_numpy(dtype=object)
+    if milhar_virgula.any():
+        t[milhar_virgula] = pd.Series(t[milhar_virgula], dtype="str").str.replace(",", "", regex=False).to_numpy(dtype=object)
+    if so_virgula.any():
+        t[so_virgula] = pd.Series(t[so_virgula], dtype="str").str.replace(",", ".", regex=False).to_numpy(dtype=object)
+    # float() levanta o mesmo erro de parse_money para texto inválido
+    return np.array([float(v) for v in t], dtype=np.float64)[codigos]
+
+
+def converter_valores(serie) -> pd.Series:
+    """`serie.apply(parse_money)` vetorizado, com as mesmas regras.
+
+    Vazio vira 0.0; número vira float; texto perde "R$" e, se tiver vírgula e
+    ponto, o que vier por último é o separador decimal ("1.234,56" e
+    "1,234.56"); só vírgula é decimal ("1234,5").
+    """
+    serie = pd.Series(serie)
+    if pd.api.types.is_bool_dtype(serie.dtype) or pd.api.types.is_numeric_dtype(serie.dtype):
+        return serie.astype(np.float64).fillna(0.0)
+
+    resultado = np.zeros(len(serie), dtype=np.float64)
+    valores = serie.to_numpy(dtype=object)
+    vazio = serie.isna().to_numpy()
+    texto = ~vazio & (_tipos(valores) == str)
+    outros = ~vazio & ~texto
+    if texto.any():
+        resultado[texto] = _valores_de_texto(valores[texto])
+    if outros.any():
+        resultado[outros] = [float(v) for v in valores[outros]]
+    return pd.Series(resultado, index=serie.index)
+
+
+def _datas_de_texto(texto):
+    """datetime64 de cada texto, tentando `FORMATOS_DATA` em ordem (uma vez por texto distinto).
+
+    O que nenhum formato reconhece ainda passa pelo `pd.to_datetime` com
+    dia antes do mês, como antes da vetorização ("1980", "1980/01/02").
+    """
+    codigos, unicos = pd.factorize(texto.str.strip().to_numpy(dtype=object))
+    datas = np.full(len(unicos), np.datetime64("NaT"), dtype="datetime64[us]")
+    faltando = np.arange(len(unicos))
+    for formato in FORMATOS_DATA:
+        if not len(faltando):
+            break
+        lidas = pd.to_datetime(pd.Series(unicos[faltando], dtype=object), format=formato, errors="coerce")
+        ok = lidas.notna().to_numpy()
+        datas[faltando[ok]] = lidas[ok].to_numpy(dtype="datetime64[us]")
+        faltando = faltando[~ok]
+    if len(faltando):
+        lidas = pd.to_datetime(pd.Series(unicos[faltando], dtype=object), format="mixed", dayfirst=True, errors="coerce")
+        ok = lidas.notna().to_numpy()
+        datas[faltando[ok]] = lidas[ok].to_numpy(dtype="datetime64[us]")
+    return np.where(codigos >= 0, datas[codigos], np.datetime64("NaT"))
+
+def _datas_de_serial(numeros):
+    numeros = np.asarray(numeros, dtype=np.float64)
+    validos = np.isfinite(numeros) & (numeros >= 1) & (numeros <= _SERIAL_MAX)
+    dias = np.where(validos, np.floor(numeros), 0).astype("int64")
+    datas = _ORIGEM_EXCEL.to_datetime64() + dias.astype("timedelta64[D]")
+    return np.where(validos, datas.astype("datetime64[us]"), np.datetime64("NaT"))
+
+
+def ler_datas(serie) -> np.ndarray:
+    """datetime64 de cada célula; vazio ou inválido vira NaT.
+
+    Células datetime passam direto; número é data serial do Excel; texto é
+    lido pelos `FORMATOS_DATA` explícitos.
+    """
+    serie = pd.Series(serie)
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return serie.to_numpy(dtype="datetime64[us]")
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        return _datas_de_serial(serie.to_numpy(dtype=np.float64, na_value=np.nan))
+    valores = serie.to_numpy(dtype=object)
+    datas = np.full(len(valores), np.datetime64("NaT"), dtype="datetime64[us]")
+    vazio = serie.isna().to_numpy()
+    tipos = _tipos(valores)
+    texto = ~vazio & (tipos == str)
+    numero = ~vazio & ((tipos == int) | (tipos == float))
+    data = ~vazio & ~texto & ~numero
+    if texto.any():
+        datas[texto] = _datas_de_texto(serie[texto].astype(object))
+    if numero.any():
+        datas[numero] = _datas_de_serial(valores[numero].astype(np.float64))
+    if data.any():
+        datas[data] = pd.to_datetime(pd.Series(valores[data]), errors="coerce").to_numpy(dtype="datetime64[us]")
+    return datas
+
+
+def formatar_datas(datas, index, formato=FORMATO_DATA, padrao=DATA_PADRAO) -> pd.Series:
+    # formatação uma vez por data distinta; NaT vira `padrao`
+    codigos, unicas = pd.factorize(datas)
+    textos = np.array([d.strftime(formato) for d in pd.DatetimeIndex(unicas)] + [padrao], dtype=object)
+    return pd.Series(textos[codigos], index=index)
+
+
+def converter_texto(serie) -> pd.Series:
+    """Texto sem espaços nas pontas; vazio vira "" (e não "nan").
+
+    Número inteiro guardado como float (coluna numérica com células vazias)
+    sai sem o ".0": 709802069560792.0 -> "709802069560792".
+    """
+    serie = pd.Series(serie)
+    if isinstance(serie.dtype, pd.StringDtype):
+        return serie.str.strip().fillna("")
+    vazio = serie.isna().to_numpy()
+    resultado = np.full(len(serie), "", dtype=object)
+
+    if pd.api.types.is_float_dtype(serie.dtype):
+        numeros = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+        inteiro = ~vazio & np.isfinite(numeros) & (numeros == np.floor(numeros)) & (np.abs(numeros) < 2 ** 63)
+        resultado[inteiro] = numeros[inteiro].astype(np.int64).astype(str).astype(object)
+        resto = ~vazio & ~inteiro
+        resultado[resto] = serie[resto].astype(str).to_numpy(dtype=object)
+        return pd.Series(resultado, index=serie.index)
+    if pd.api.types.is_integer_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+        return serie.astype(str)
+
+    valores = serie.to_numpy(dtype=object)
+    tipos = _tipos(valores)
+    texto = ~vazio & (tipos == str)
+    flutuante = ~vazio & (tipos == float)
+    outros = ~vazio & ~texto & ~flutuante
+    if texto.any():
+        resultado[texto] = serie[texto].astype(object).str.strip().to_numpy(dtype=object)
+    if flutuante.any():
+        resultado[flutuante] = converter_texto(valores[flutuante].astype(np.float64)).to_numpy()
+    if outros.any():
+        resultado[outros] = pd.Series(valores[outros], dtype=object).astype(str).str.strip().to_numpy(dtype=object)
+    return pd.Series(resultado, index=serie.index)
+
+
+def converter_cpf(serie) -> pd.Series:
+    """Só os dígitos, com zeros à esquerda até 11 (o Excel perde o zero do número)."""
+    return converter_texto(serie).str.replace(r'\D', '', regex=True).str.zfill(11)
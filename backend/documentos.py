@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# Validação de CPF e CNS por coluna inteira: os dígitos viram uma matriz de
+# inteiros e os dígitos verificadores saem de produtos matriciais.
+
+# Linha do Excel da primeira linha de dados (a 1 é o cabeçalho)
+PRIMEIRA_LINHA_DADOS = 2
+
+_PESOS_CPF_D1 = np.arange(10, 1, -1)   # 10..2 sobre os 9 primeiros dígitos
+_PESOS_CPF_D2 = np.arange(11, 2, -1)   # 11..3 sobre os 9 primeiros (+2 * d1)
+_PESOS_CNS = np.arange(15, 0, -1)      # 15..1 sobre os 15 dígitos
+
+# CNS definitivo começa com 1 ou 2; provisório com 7, 8 ou 9
+_INICIO_CNS = np.array([1, 2, 7, 8, 9])
+
+# Textos que `astype(str)` produz para célula vazia
+_VAZIOS = ("", "nan", "None", "NaT", "<NA>")
+
+
+def _matriz_digitos(serie, largura):
+    """Remove o que não é dígito e devolve `(matriz n x largura, tamanho_ok)`.
+
+    Linhas com quantidade de dígitos diferente de `largura` ficam zeradas na
+    matriz e com `tamanho_ok` False.
+    """
+    digitos = pd.Series(serie).astype(str).str.replace(r'\D', '', regex=True)
+    tamanho_ok = ((digitos.str.len() == largura) & digitos.str.isascii()).to_numpy(dtype=bool)
+    matriz = np.zeros((len(digitos), largura), dtype=np.int64)
+    if tamanho_ok.any():
+        bruto = "".join(digitos[tamanho_ok].tolist()).encode("ascii")
+        matriz[tamanho_ok] = np.frombuffer(bruto, dtype=np.uint8).reshape(-1, largura) - ord("0")
+    return matriz, tamanho_ok
+
+
+def _digito_cpf(soma):
+    resto = (soma * 10) % 11
+    return np.where(resto < 10, resto, 0)
+
+
+def cpfs_invalidos(serie) -> np.ndarray:
+    """Máscara booleana dos CPFs inválidos; mesmo critério do `is_valid_cpf` original
+    (benchmarks/referencia.py)."""
+    m, ok = _matriz_digitos(serie, 11)
+    base = m[:, :9]
+    d1 = _digito_cpf(base @ _PESOS_CPF_D1)
+    d2 = _digito_cpf(base @ _PESOS_CPF_D2 + 2 * d1)
+    repetido = (m == m[:, :1]).all(axis=1)
+    validos = ok & ~repetido & (m[:, 9] == d1) & (m[:, 10] == d2)
+    return ~validos
+
+
+def cns_invalidos(serie, aceitar_vazio=True) -> np.ndarray:
+    """Máscara booleana dos CNS (Cartão Nacional de Saúde) inválidos.
+
+    O CNS tem 15 dígitos, começa com 1, 2, 7, 8 ou 9 e a soma dos dígitos
+    ponderados de 15 a 1 é múltipla de 11. Com `aceitar_vazio`, células em
+    branco não contam como erro.
+    """
+    serie = pd.Series(serie)
+    # coluna numérica com células vazias vira float: "709802069560792.0"
+    texto = serie.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+    m, ok = _matriz_digitos(texto, 15)
+    validos = ok & np.isin(m[:, 0], _INICIO_CNS) & ((m @ _PESOS_CNS) % 11 == 0)
+    if aceitar_vazio:
+        vazio = serie.isna().to_numpy() | texto.isin(_VAZIOS).to_numpy()
+        validos |= vazio
+    return ~validos
+
+
+def linhas_excel(mascara, indice) -> list:
+    """Números de linha do Excel das posições marcadas em `mascara`."""
+    return [int(i) + PRIMEIRA_LINHA_DADOS for i in np.asarray(indice)[np.asarray(mascara, dtype=bool)]]
@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from contextlib import contextmanager
+
+try:
+    from .auth import chave_credenciais
+    from .jobs import JOBS_DB
+except ImportError:
+    from auth import chave_credenciais
+    from jobs import JOBS_DB
+
+# Configuração via ambiente:
+#   SICAP_IDEMPOTENCIA_TTL   segundos em que um envio bem-sucedido é reaproveitado
+#   SICAP_IDEMPOTENCIA_MAX   quantidade máxima de resultados guardados (LRU)
+IDEMPOTENCIA_TTL = int(os.environ.get("SICAP_IDEMPOTENCIA_TTL", "900"))
+IDEMPOTENCIA_MAX = int(os.environ.get("SICAP_IDEMPOTENCIA_MAX", "256"))
+
+# Intervalo de consulta ao banco enquanto outro worker processa a mesma chave
+INTERVALO_CONSULTA = 0.5
+
+# Uma linha por chave_envio na tabela envios
+_FILTRO = "sha256 = ? AND prestacao = ? AND mes = ? AND credenciais = ?"
+
+CANCELADO = "Processamento original cancelado: todos os clientes desconectaram."
+INTERROMPIDO = "Processamento interrompido em outro worker. Envie a planilha novamente."
+
+
+def chave_envio(sha256, prestacao_id, mes, usuario, senha):
+    """Chave de idempotência de um upload.
+
+    O NumNotaFiscal sai da aba 600 do próprio arquivo, então o SHA-256 já o
+    determina. As credenciais entram (como HMAC) para que um resultado em
+    cache nunca dispense o login de outro usuário; com o gunicorn, a chave do
+    HMAC vem do processo mestre (preload_app) e é a mesma em todos os workers.
+    """
+    return (
+        sha256,
+        str(prestacao_id or "").strip(),
+        str(mes or "").strip().lower(),
+        chave_credenciais(usuario, senha),
+    )
+
+
+async def _nunca_desconecta():
+    return False
+
+
+class EmAndamento:
+    """Um processamento em execução e quem está esperando por ele."""
+
+    def __init__(self, future, job_id=None):
+        self.future = future
+        self.job_id = job_id
+        self.clientes = []
+
+    def anexar(self, desconectado=None):
+        # sem `desconectado` (ex.: um job), o processamento nunca é cancelado
+        self.clientes.append(desconectado or _nunca_desconecta)
+
+    async def desconectado(self):
+        # só cancela quando todos os interessados foram embora
+        for cliente in list(self.clientes):
+            if not await cliente():
+                return False
+        return True
+
+
+class Idempotencia:
+    """Processamentos em andamento e resultados recentes, por `chave_envio`.
+
+    O estado fica na tabela `envios` do banco dos jobs, compartilhada pelos
+    workers do gunicorn: a reserva de uma chave é atômica (BEGIN IMMEDIATE),
+    então o mesmo upload chegando a dois workers é enviado uma vez só. Os
+    resultados com status "sucesso" ficam guardados por `ttl` segundos, com
+    no máximo `maximo` linhas (a menos usada sai primeiro).
+
+    Quem chega enquanto outro worker processa a mesma chave recebe um
+    `EmAndamento` cujo future é resolvido por uma thread que consulta o banco.
+    """
+
+    def __init__(self, caminho=JOBS_DB, ttl=IDEMPOTENCIA_TTL, maximo=IDEMPOTENCIA_MAX, recuperar=True):
+        self.caminho = caminho
+        self.ttl = ttl
+        self.maximo = maximo
+        # como em JobStore: com o gunicorn, só o mestre libera as reservas
+        # deixadas por uma execução anterior
+        self.recuperar = recuperar
+        # futures deste processo (originais e acompanhamentos de outros workers)
+        self._locais = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transacao(self):
+        # BEGIN IMMEDIATE: ler e gravar a reserva sem outro worker no meio
+        conn = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _ler(self):
+        # só leitura: no modo WAL não espera o lock de escrita dos outros workers
+        conn = sqlite3.connect(self.caminho, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def inicializar(self):
+        with self._transacao() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS envios (
+                    sha256 TEXT NOT NULL,
+                    prestacao TEXT NOT NULL,
+                    mes TEXT NOT NULL,
+                    credenciais TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    job_id TEXT,
+                    pid INTEGER,
+                    resultado TEXT,
+                    guardado_em REAL NOT NULL,
+                    usado_em REAL NOT NULL,
+                    UNIQUE (sha256, prestacao, mes, credenciais)
+                )
+            """)
+        if self.recuperar:
+            self.liberar()
+
+    def liberar(self, pid=None):
+        """Desfaz as reservas em andamento (só as do processo `pid`, se
+        informado), de processos que saíram sem concluir. Retorna quantas."""
+        filtro, parametros = "", ()
+        if pid is not None:
+            filtro, parametros = " AND pid = ?", (pid,)
+        with self._transacao() as conn:
+            return conn.execute("DELETE FROM envios WHERE status = 'em_andamento'" + filtro, parametros).rowcount
+
+    def reservar(self, chave):
+        """Reserva `chave` para quem chama, se ninguém já a tiver.
+
+        Retorna `(resultado, entrada)`: o sucesso recente guardado, ou o
+        `EmAndamento` de quem já está processando. `(None, None)` quer dizer
+        que a reserva é de quem chamou, que segue com `registrar` (ou
+        `desistir`, se não conseguir submeter o processamento).
+        """
+        with self._lock:
+            entrada = self._locais.get(chave)
+        if entrada is not None:
+            return None, entrada
+        agora = time.time()
+        with self._transacao() as conn:
+            linha = conn.execute("SELECT * FROM envios WHERE " + _FILTRO, chave).fetchone()
+            if linha is not None:
+                if linha["status"] == "sucesso" and agora - linha["guardado_em"] <= self.ttl:
+                    conn.execute("UPDATE envios SET usado_em = ? WHERE " + _FILTRO, (agora,) + chave)
+                    return json.loads(linha["resultado"]), None
+                if linha["status"] == "em_andamento":
+                    return None, self._acompanhar(chave, linha["job_id"])
+            conn.execute(
+                "INSERT OR REPLACE INTO envios (sha256, prestacao, mes, credenciais, status, pid, guardado_em, usado_em) "
+                "VALUES (?, ?, ?, ?, 'em_andamento', ?, ?, ?)",
+                chave + (os.getpid(), agora, agora),
+            )
+        return None, None
+
+    def desistir(self, chave):
+        # reserva feita, mas o processamento não chegou a ser submetido
+        with self._transacao() as conn:
+            conn.execute(
+                "DELETE FROM envios WHERE " + _FILTRO + " AND status = 'em_andamento' AND pid = ?",
+                chave + (os.getpid(),),
+            )
+
+    def registrar(self, chave, future, job_id=None) -> EmAndamento:
+        """Processamento submetido para uma chave reservada por `reservar`."""
+        entrada = EmAndamento(future, job_id)
+        with self._lock:
+            self._locais[chave] = entrada
+        if job_id:
+            with self._transacao() as conn:
+                conn.execute("UPDATE envios SET job_id = ? WHERE " + _FILTRO, (job_id,) + chave)
+        future.add_done_callback(lambda f: self._concluir(chave, entrada, f))
+        return entrada
+
+    def _concluir(self, chave, entrada, future):
+        if future.cancelled():
+            resultado = {"status": "erro", "mensagem": CANCELADO}
+        elif future.exception() is not None:
+            resultado = {"status": "erro", "mensagem": f"Erro interno: {future.exception()}"}
+        else:
+            resultado = future.result()
+        sucesso = isinstance(resultado, dict) and resultado.get("status") == "sucesso"
+        agora = time.time()
+        try:
+            with self._transacao() as conn:
+                # falhas ficam só para quem está esperando em outro worker;
+                # a próxima reserva da chave as substitui
+                conn.execute(
+                    "UPDATE envios SET status = ?, resultado = ?, guardado_em = ?, usado_em = ?, pid = NULL "
+                    "WHERE " + _FILTRO + " AND status = 'em_andamento' AND pid = ?",
+                    ("sucesso" if sucesso else "falhou", json.dumps(resultado, ensure_ascii=False, default=str),
+                     agora, agora) + chave + (os.getpid(),),
+                )
+                conn.execute(
+                    "DELETE FROM envios WHERE status != 'em_andamento' AND guardado_em < ?", (agora - self.ttl,)
+                )
+                conn.execute(
+                    "DELETE FROM envios WHERE status = 'sucesso' AND rowid NOT IN "
+                    "(SELECT rowid FROM envios WHERE status = 'sucesso' ORDER BY usado_em DESC LIMIT ?)",
+                    (self.maximo,),
+                )
+        except Exception as e:
+            logging.warning(f"Falha ao gravar o resultado da idempotência: {e}")
+        finally:
+            with self._lock:
+                if self._locais.get(chave) is entrada:
+                    del self._locais[chave]
+
+    def _acompanhar(self, chave, job_id):
+        # processamento de outro worker: um future local, resolvido quando a
+        # linha sai de "em_andamento"; os interessados deste processo dividem
+        # a mesma consulta
+        with self._lock:
+            entrada = self._locais.get(chave)
+            if entrada is not None:
+                return entrada
+            entrada = self._locais[chave] = EmAndamento(Future(), job_id)
+        threading.Thread(target=self._consultar, args=(chave, entrada), daemon=True).start()
+        return entrada
+
+    def _consultar(self, chave, entrada):
+        resultado = None
+        try:
+            while not entrada.future.cancelled():
+                time.sleep(INTERVALO_CONSULTA)
+                with self._ler() as conn:
+                    linha = conn.execute("SELECT status, resultado FROM envios WHERE " + _FILTRO, chave).fetchone()
+                if linha is None:
+                    # o worker dono saiu sem concluir (liberar)
+                    resultado = {"status": "erro", "mensagem": INTERROMPIDO}
+                    break
+                if linha["status"] != "em_andamento":
+                    resultado = json.loads(linha["resultado"])
+                    break
+        except Exception as e:
+            resultado = {"status": "erro", "mensagem": f"Erro interno: {e}"}
+        finally:
+            with self._lock:
+                if self._locais.get(chave) is entrada:
+                    del self._locais[chave]
+        if resultado is not None:
+            try:
+                entrada.future.set_result(resultado)
+            except InvalidStateError:
+                pass  # cancelado enquanto consultava
+
+    def info(self):
+        with self._ler() as conn:
+            em_andamento = conn.execute("SELECT COUNT(*) FROM envios WHERE status = 'em_andamento'").fetchone()[0]
+            guardados = conn.execute(
+                "SELECT COUNT(*) FROM envios WHERE status = 'sucesso' AND guardado_em >= ?", (time.time() - self.ttl,)
+            ).fetchone()[0]
+        return {
+            "em_andamento": em_andamento,
+            "resultados_em_cache": guardados,
+            "ttl": self.ttl,
+            "maximo": self.maximo,
+        }
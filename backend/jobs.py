@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+# Banco local dos jobs assíncronos; sobrevive ao restart do worker
+JOBS_DB = os.environ.get("SICAP_JOBS_DB") or (
+    "/tmp/sicap_jobs.db" if os.name != 'nt' else os.path.join(os.path.dirname(__file__), "jobs.db")
+)
+
+# Etapas reportadas por processar_planilha, na ordem
+ETAPAS = ("leitura", "mapeamento", "validacao", "login", "envio")
+
+STATUS_FINAIS = ("concluido", "interrompido")
+
+# Jobs mais antigos que isso são apagados na inicialização
+RETENCAO_DIAS = int(os.environ.get("SICAP_JOBS_RETENCAO_DIAS", "7"))
+
+
+def _item_evento(linha):
+    item = {"etapa": linha["etapa"], "em": linha["em"]}
+    if linha["arquivo"] is not None:
+        item["arquivo"] = linha["arquivo"]
+    return item
+
+
+class JobStore:
+    """Persistência dos jobs de `/api/jobs` em SQLite.
+
+    Cada operação abre a própria conexão, então a mesma instância pode ser
+    usada pelo event loop, pelas threads do pool e por processos filhos.
+    """
+
+    def __init__(self, caminho=JOBS_DB, recuperar=True):
+        self.caminho = caminho
+        # com vários workers (gunicorn), só o processo mestre recupera jobs
+        # órfãos na inicialização; os workers não mexem nos jobs dos outros
+        self.recuperar = recuperar
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def inicializar(self):
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    etapa TEXT,
+                    arquivo TEXT,
+                    resultado TEXT,
+                    criado_em REAL NOT NULL,
+                    atualizado_em REAL NOT NULL,
+                    pid INTEGER
+                )
+            """)
+            # uma linha por etapa: vários processos do mesmo lote registram
+            # progresso ao mesmo tempo só com INSERT, sem ler e regravar nada
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS eventos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    etapa TEXT NOT NULL,
+                    arquivo TEXT,
+                    em REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS eventos_job ON eventos (job_id, id)")
+            if self.recuperar:
+                conn.execute("DELETE FROM jobs WHERE criado_em < ?", (time.time() - RETENCAO_DIAS * 86400,))
+                conn.execute("DELETE FROM eventos WHERE job_id NOT IN (SELECT id FROM jobs)")
+        if self.recuperar:
+            self.interromper()
+
+    def interromper(self, pid=None):
+        """Marca como interrompidos os jobs não concluídos (só os do processo
+        `pid`, se informado). Retorna quantos foram marcados."""
+        # jobs que estavam rodando quando o processo caiu não têm como
+        # continuar: o upload temporário já não existe
+        filtro, parametros = "", ()
+        if pid is not None:
+            filtro, parametros = " AND pid = ?", (pid,)
+        with self._conectar() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'interrompido', atualizado_em = ?, resultado = ? "
+                "WHERE status NOT IN ('concluido', 'interrompido')" + filtro,
+                (time.time(), json.dumps({
+                    "status": "erro",
+                    "mensagem": "Processamento interrompido por reinício do servidor. Envie a planilha novamente.",
+                }, ensure_ascii=False)) + parametros,
+            )
+            return cursor.rowcount
+
+    def criar(self, arquivo):
+        job_id = uuid.uuid4().hex
+        agora = time.time()
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, arquivo, criado_em, atualizado_em, pid) VALUES (?, 'na_fila', ?, ?, ?, ?)",
+                (job_id, arquivo, agora, agora, os.getpid()),
+            )
+        return job_id
+
+    def registrar_etapa(self, job_id, etapa, arquivo=None):
+        # `arquivo` identifica a planilha nos jobs de lote
+        agora = time.time()
+        with self._conectar() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'executando', etapa = ?, atualizado_em = ? "
+                "WHERE id = ? AND status NOT IN ('concluido', 'interrompido')",
+                (etapa, agora, job_id),
+            )
+            if cursor.rowcount:
+                conn.execute(
+                    "INSERT INTO eventos (job_id, etapa, arquivo, em) VALUES (?, ?, ?, ?)",
+                    (job_id, etapa, arquivo, agora),
+                )
+
+    def eventos(self, job_id, apos=0):
+        """Etapas registradas depois do evento `apos`: lista de `(id, item)`."""
+        with self._conectar() as conn:
+            linhas = conn.execute(
+                "SELECT id, etapa, arquivo, em FROM eventos WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, apos),
+            ).fetchall()
+        return [(l["id"], _item_evento(l)) for l in linhas]
+
+    def concluir(self, job_id, resultado):
+        with self._conectar() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'concluido', resultado = ?, atualizado_em = ? WHERE id = ?",
+                (json.dumps(resultado, ensure_ascii=False, default=str), time.time(), job_id),
+            )
+
+    def remover(self, job_id):
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            conn.execute("DELETE FROM eventos WHERE job_id = ?", (job_id,))
+
+    def obter(self, job_id):
+        with self._conectar() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            eventos = conn.execute(
+                "SELECT etapa, arquivo, em FROM eventos WHERE job_id = ? ORDER BY id", (job_id,)
+            ).fetchall()
+        job = dict(row)
+        job.pop("pid", None)
+        job["historico"] = [_item_evento(e) for e in eventos]
+        job["resultado"] = json.loads(job["resultado"]) if job["resultado"] else None
+        return job
+
+
+class ProgressoJob:
+    """Callback de progresso serializável, para funcionar também no pool de processos."""
+
+    def __init__(self, job_id, caminho=JOBS_DB, arquivo=None):
+        self.job_id = job_id
+        self.caminho = caminho
+        self.arquivo = arquivo
+
+    def __call__(self, etapa):
+        JobStore(self.caminho).registrar_etapa(self.job_id, etapa, self.arquivo)
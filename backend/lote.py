@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import time
+import zipfile
+
+try:
+    from .jobs import JobStore, ProgressoJob
+    from .metricas import Medicao, registrar_resultado
+    from .processor import TOKENS, com_metricas, enviar_com_token, erro_interno, interpretar_resposta, preparar_planilha
+    from .serializacao import json_bytes
+    from .uploads import copiar_upload
+    from .workers import PoolProcessamento
+except ImportError:
+    from jobs import JobStore, ProgressoJob
+    from metricas import Medicao, registrar_resultado
+    from processor import TOKENS, com_metricas, enviar_com_token, erro_interno, interpretar_resposta, preparar_planilha
+    from serializacao import json_bytes
+    from uploads import copiar_upload
+    from workers import PoolProcessamento
+
+# Configuração via ambiente:
+#   SICAP_LOTE_WORKERS        processos que leem/validam as planilhas do lote
+#   SICAP_LOTE_ENVIOS         envios simultâneos ao SICAP por lote
+#   SICAP_LOTE_MAX_ARQUIVOS   planilhas aceitas por lote (contando as do .zip)
+#   SICAP_LOTE_MAX_MB         tamanho máximo descompactado do lote
+#   SICAP_LOTE_SIMULTANEOS    lotes em execução ao mesmo tempo
+LOTE_WORKERS = int(os.environ.get("SICAP_LOTE_WORKERS", "0")) or max(1, os.cpu_count() or 1)
+LOTE_ENVIOS = int(os.environ.get("SICAP_LOTE_ENVIOS", "3"))
+LOTE_MAX_ARQUIVOS = int(os.environ.get("SICAP_LOTE_MAX_ARQUIVOS", "50"))
+LOTE_MAX_BYTES = int(os.environ.get("SICAP_LOTE_MAX_MB", "200")) * 1024 * 1024
+LOTE_SIMULTANEOS = int(os.environ.get("SICAP_LOTE_SIMULTANEOS", "2"))
+
+EXTENSOES_PLANILHA = ('.xlsx', '.xls')
+
+
+class LoteInvalido(Exception):
+    pass
+
+
+def _ignorar(nome):
+    # "~$" são arquivos de trava do Excel; "._" e __MACOSX vêm do compactador do macOS
+    base = os.path.basename(nome)
+    return not base or base.startswith(("~$", "._")) or "__MACOSX/" in nome
+
+
+def _planilha_valida(nome):
+    return nome.lower().endswith(EXTENSOES_PLANILHA)
+
+
+class ArquivosLote:
+    """Planilhas de um lote, cada uma no seu SpooledTemporaryFile (`UploadRecebido`).
+
+    Aceita uploads `.xlsx`/`.xls` e `.zip` (só as planilhas de dentro são
+    extraídas). Limites de quantidade e de tamanho descompactado são checados
+    antes de extrair cada arquivo; arquivos que não são planilha entram em
+    `rejeitados`.
+    """
+
+    def __init__(self):
+        self.planilhas = []  # (nome exibido, UploadRecebido)
+        self.rejeitados = []
+        self._bytes = 0
+
+    def _reservar(self, tamanho):
+        if len(self.planilhas) >= LOTE_MAX_ARQUIVOS:
+            raise LoteInvalido(f"Lote excede o limite de {LOTE_MAX_ARQUIVOS} planilhas.")
+        self._bytes += tamanho
+        if self._bytes > LOTE_MAX_BYTES:
+            raise LoteInvalido(f"Lote excede o limite de {LOTE_MAX_BYTES // (1024 * 1024)} MB descompactados.")
+
+    def adicionar(self, nome, arquivo):
+        """`arquivo` é um objeto de arquivo posicionado no início (ex.: `UploadFile.file`).
+
+        O lote roda depois da resposta, quando o FastAPI já fechou os
+        `UploadFile`; por isso as planilhas são copiadas para spools do lote.
+        """
+        if nome.lower().endswith(".zip"):
+            self._adicionar_zip(nome, arquivo)
+        elif _planilha_valida(nome):
+            arquivo.seek(0, os.SEEK_END)
+            tamanho = arquivo.tell()
+            arquivo.seek(0)
+            self._reservar(tamanho)
+            self.planilhas.append((nome, copiar_upload(arquivo, nome, limite=tamanho)))
+        else:
+            self.rejeitados.append(nome)
+
+    def _adicionar_zip(self, nome, arquivo):
+        try:
+            with zipfile.ZipFile(arquivo) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or _ignorar(info.filename):
+                        continue
+                    if not _planilha_valida(info.filename):
+                        self.rejeitados.append(f"{nome}/{info.filename}")
+                        continue
+                    self._reservar(info.file_size)
+                    # ZipExtFile não lê além de file_size, então o limite vale mesmo com cabeçalho adulterado
+                    with zf.open(info) as origem:
+                        recebido = copiar_upload(origem, os.path.basename(info.filename), limite=info.file_size)
+                    self.planilhas.append((recebido.nome, recebido))
+        except zipfile.BadZipFile:
+            raise LoteInvalido(f"Arquivo compactado inválido: {nome}")
+
+    def remover(self):
+        for _, recebido in self.planilhas:
+            recebido.fechar()
+
+
+def _resultado_arquivo(nome, resultado):
+    return {
+        "arquivo": nome,
+        "status": resultado.get("status"),
+        "mensagem": resultado.get("mensagem"),
+        "detalhes": resultado.get("detalhes"),
+    }
+
+
+def consolidar(arquivos, inicio):
+    enviados = sum(1 for a in arquivos if a["status"] == "sucesso")
+    if enviados == len(arquivos):
+        status = "sucesso"
+    elif enviados:
+        status = "parcial"
+    else:
+        status = "erro"
+    return {
+        "status": status,
+        "mensagem": f"{enviados} de {len(arquivos)} planilha(s) enviada(s) com sucesso.",
+        "detalhes": {
+            "arquivos": arquivos,
+            "tempo": f"{time.time() - inicio:.2f}s",
+        },
+    }
+
+
+class ProcessadorLote:
+    """Leitura/validação em paralelo num pool de processos; login único e
+    envios concorrentes (até `envios` por lote) em threads.
+
+    Cada planilha segue para o envio assim que fica pronta, sem esperar as
+    outras. O progresso vai para o `JobStore` com o nome do arquivo.
+
+    Lotes não passam pela idempotência de `/api/processar` e `/api/jobs`:
+    reenviar um lote (ou a mesma planilha em dois lotes) envia de novo ao
+    SICAP. Quem precisa de deduplicação envia as planilhas por `/api/jobs`.
+    """
+
+    def __init__(self, jobs: JobStore, workers=LOTE_WORKERS, envios=LOTE_ENVIOS):
+        self.jobs = jobs
+        self.envios = envios
+        self.pool = PoolProcessamento(
+            modo="process", workers=workers, max_jobs=LOTE_MAX_ARQUIVOS * LOTE_SIMULTANEOS
+        )
+
+    async def iniciar(self):
+        # o pool de processos só sobe no primeiro lote
+        await asyncio.to_thread(self.pool.iniciar)
+
+    def encerrar(self):
+        self.pool.encerrar()
+
+    async def processar(self, job_id, lote: ArquivosLote, usuario, senha, mes=None, ano=None, prestacao_id=None):
+        inicio = time.time()
+        semaforo = asyncio.Semaphore(self.envios)
+        login = None
+
+        def obter_login():
+            nonlocal login
+            if login is None:
+                login = asyncio.ensure_future(asyncio.to_thread(TOKENS.obter, usuario, senha))
+            return login
+
+        async def registrar(etapa, nome):
+            await asyncio.to_thread(self.jobs.registrar_etapa, job_id, etapa, nome)
+
+        async def um_arquivo(nome, recebido):
+            resultado = await medir_arquivo(nome, recebido)
+            registrar_resultado(resultado)
+            return _resultado_arquivo(nome, resultado)
+
+        async def medir_arquivo(nome, recebido):
+            inicio_arquivo = time.time()
+            medicao = Medicao()
+            try:
+                # o pool de processos recebe os bytes; o spool já pode ser fechado
+                conteudo = await asyncio.to_thread(recebido.conteudo)
+                recebido.fechar()
+                future, _ = await asyncio.to_thread(
+                    self.pool.submeter, preparar_planilha, conteudo, mes, ano, prestacao_id,
+                    progresso=ProgressoJob(job_id, self.jobs.caminho, nome), nome_arquivo=nome, sha256=recebido.sha256,
+                )
+                preparado = await asyncio.wrap_future(future)
+                # a leitura foi cronometrada no processo do pool; login e envio seguem daqui
+                medicao = Medicao(anterior=preparado.pop("metricas", None))
+                if preparado["status"] == "erro":
+                    return com_metricas(preparado, medicao, "planilha")
+                payload = preparado["payload"]
+
+                medicao("login")
+                await registrar("login", nome)
+                try:
+                    await asyncio.shield(obter_login())
+                except Exception as e:
+                    erro = {"status": "erro", "mensagem": f"Falha no login: {e}"}
+                    return com_metricas(erro, medicao, type(e).__name__)
+
+                medicao("fila_envio")
+                async with semaforo:
+                    medicao("envio")
+                    await registrar("envio", nome)
+                    corpo = json_bytes(payload)
+                    medicao.bytes_payload = len(corpo)
+                    r = await asyncio.to_thread(enviar_com_token, usuario, senha, corpo)
+                return com_metricas(interpretar_resposta(r, payload, inicio_arquivo), medicao, f"http_{r.status_code}")
+            except Exception as e:
+                return com_metricas(erro_interno(e), medicao, type(e).__name__)
+
+        try:
+            await self.iniciar()
+            arquivos = await asyncio.gather(*(um_arquivo(n, r) for n, r in lote.planilhas))
+            arquivos = list(arquivos) + [
+                {"arquivo": nome, "status": "erro", "mensagem": "Formato inválido. Use .xlsx, .xls ou .zip"}
+                for nome in lote.rejeitados
+            ]
+            resultado = consolidar(arquivos, inicio)
+            logging.info(f"Lote {job_id}: {resultado['mensagem']}")
+        except Exception as e:
+            resultado = erro_interno(e)
+        finally:
+            lote.remover()
+        await asyncio.to_thread(self.jobs.concluir, job_id, resultado)
+        return resultado
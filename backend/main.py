@@ -1,18 +1,98 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, Request
+from typing import List
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, Response
-import shutil
+from fastapi.responses import FileResponse, Response, StreamingResponse
+import asyncio
+import logging
 import os
-import uuid
+import time
 import json
+import secrets
 import traceback
 
 try:
-    from .processor import processar_planilha
+    from .idempotencia import Idempotencia, chave_envio
+    from .jobs import STATUS_FINAIS, JobStore, ProgressoJob
+    from .lote import LOTE_MAX_BYTES, LOTE_SIMULTANEOS, ArquivosLote, LoteInvalido, ProcessadorLote
+    from .mapeamentos import ADMIN_TOKEN, ConflitoVersao, MapeamentoInvalido
+    from .metricas import TIPO_CONTEUDO, exposicao, medidor, registrar_falha, registrar_resultado
+    from .processor import MAPEAMENTOS, SICAP, aquecer, montar_payload, processar_planilha
+    from .serializacao import json_bytes
+    from .uploads import FOLGA_MULTIPART, LimiteCorpo, UploadGrande, receber_upload
+    from .workers import DRENAR_SEGUNDOS, JobCancelado, PoolOcupado, PoolProcessamento
 except ImportError:
-    from processor import processar_planilha
+    from idempotencia import Idempotencia, chave_envio
+    from jobs import STATUS_FINAIS, JobStore, ProgressoJob
+    from lote import LOTE_MAX_BYTES, LOTE_SIMULTANEOS, ArquivosLote, LoteInvalido, ProcessadorLote
+    from mapeamentos import ADMIN_TOKEN, ConflitoVersao, MapeamentoInvalido
+    from metricas import TIPO_CONTEUDO, exposicao, medidor, registrar_falha, registrar_resultado
+    from processor import MAPEAMENTOS, SICAP, aquecer, montar_payload, processar_planilha
+    from serializacao import json_bytes
+    from uploads import FOLGA_MULTIPART, LimiteCorpo, UploadGrande, receber_upload
+    from workers import DRENAR_SEGUNDOS, JobCancelado, PoolOcupado, PoolProcessamento
 
-app = FastAPI(title="SICAP Uploader", version="1.0.0")
+# Pool onde o processamento (pandas + chamadas ao SICAP) roda, fora do event loop
+POOL = PoolProcessamento()
+
+# Jobs de /api/jobs e /api/lotes
+JOBS = JobStore()
+
+# Uploads repetidos (mesmo arquivo, prestação e usuário) reaproveitam o
+# processamento em andamento ou o sucesso recente; o estado fica no banco
+# dos jobs, visível para todos os workers
+IDEMPOTENCIA = Idempotencia(JOBS.caminho)
+
+# Lotes: leitura em processos separados, login único, envios concorrentes
+LOTES = ProcessadorLote(JOBS)
+_TAREFAS_LOTE = set()
+
+# Estado atual, lido a cada coleta de /metrics
+medidor("sicap_pool_jobs_ativos", "Processamentos em andamento no pool.", lambda: POOL.ativos)
+medidor("sicap_lotes_ativos", "Lotes em execução.", lambda: len(_TAREFAS_LOTE))
+medidor(
+    "sicap_circuito_aberto", "1 quando o circuit breaker do SICAP está aberto.",
+    lambda: SICAP.info()["estado"] == "aberto",
+)
+
+
+def preparar_mestre():
+    """Chamado pelo gunicorn (gunicorn.conf.py) no processo mestre, antes de
+    criar os workers.
+
+    Recupera os jobs órfãos e as reservas de idempotência uma vez só (os
+    workers não mexem nos dos outros) e carrega openpyxl, calamine e o
+    índice dos mapeamentos, que os workers herdam do fork sem copiar.
+    """
+    JOBS.inicializar()
+    JOBS.recuperar = False
+    IDEMPOTENCIA.inicializar()
+    IDEMPOTENCIA.recuperar = False
+    aquecer()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    JOBS.inicializar()
+    IDEMPOTENCIA.inicializar()
+    POOL.iniciar()
+    yield
+    # encerramento gracioso: o servidor já parou de aceitar conexões e
+    # esperou as requisições abertas; falta o que roda em segundo plano
+    if _TAREFAS_LOTE:
+        logging.info(f"Encerrando: aguardando {len(_TAREFAS_LOTE)} lote(s) em andamento")
+        await asyncio.wait(set(_TAREFAS_LOTE), timeout=DRENAR_SEGUNDOS)
+    if POOL.ativos:
+        logging.info(f"Encerrando: aguardando {POOL.ativos} processamento(s) em andamento")
+    await asyncio.to_thread(POOL.encerrar)
+    LOTES.encerrar()
+
+
+app = FastAPI(title="SICAP Uploader", version="1.0.0", lifespan=lifespan)
+
+# Corpo acima do limite é recusado antes de ser lido por inteiro; lotes
+# têm limite próprio
+app.add_middleware(LimiteCorpo, limites={"/api/lotes": LOTE_MAX_BYTES + FOLGA_MULTIPART})
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,9 +102,6 @@ app.add_middleware(
 )
 
 # Diretórios
-UPLOAD_DIR = "/tmp/sicap_uploads" if os.name != 'nt' else os.path.join(os.path.dirname(__file__), "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 FRONTEND_DIR = os.path.join(os.path.dirname(CURRENT_DIR), "frontend")
 if not os.path.exists(FRONTEND_DIR):
@@ -52,16 +129,39 @@ async def serve_js():
 # API
 # ============================================================
 
+@app.exception_handler(UploadGrande)
+async def upload_grande(request: Request, exc: UploadGrande):
+    return _resposta_json({"status": "erro", "mensagem": exc.detail}, 413, headers={"Connection": "close"})
+
+
 @app.get("/health")
 async def health():
     return {
         "status": "ok",
         "frontend_dir": FRONTEND_DIR,
         "frontend_exists": os.path.exists(FRONTEND_DIR),
-        "upload_dir": UPLOAD_DIR,
+        "pool": {
+            "modo": POOL.modo,
+            "workers": POOL.workers,
+            "jobs_ativos": POOL.ativos,
+            "max_jobs": POOL.max_jobs,
+        },
+        "sicap": SICAP.info(),
+        "idempotencia": await asyncio.to_thread(IDEMPOTENCIA.info),
+        "lotes": {
+            "workers": LOTES.pool.workers,
+            "envios_simultaneos": LOTES.envios,
+            "lotes_ativos": len(_TAREFAS_LOTE),
+            "max_lotes": LOTE_SIMULTANEOS,
+        },
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    return Response(content=exposicao(), media_type=TIPO_CONTEUDO)
+
+
 @app.post("/api/test")
 async def test_post():
     return Response(
@@ -73,6 +173,7 @@ async def test_post():
 
 @app.post("/api/processar")
 async def processar_arquivo(
+    request: Request,
     file: UploadFile = File(...),
     usuario: str = Form(...),
     senha: str = Form(...),
@@ -81,45 +182,431 @@ async def processar_arquivo(
     prestacao_id: str = Form(None)
 ):
     if not file.filename.endswith(('.xlsx', '.xls')):
-        return Response(
-            content='{"status":"erro","mensagem":"Formato invalido. Use .xlsx ou .xls"}',
-            status_code=400,
-            media_type="application/json"
-        )
+        return _resposta_json({"status": "erro", "mensagem": "Formato invalido. Use .xlsx ou .xls"}, 400)
 
-    filename = f"{uuid.uuid4()}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
+    indisponivel = _sicap_indisponivel()
+    if indisponivel:
+        return indisponivel
 
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # SHA-256 e limite lendo o spool do próprio UploadFile, que vai direto ao leitor
+        recebido = await receber_upload(file)
+        logging.info(f"Upload recebido: {recebido.nome} ({recebido.tamanho} bytes, sha256={recebido.sha256})")
+
+        # mesmo arquivo + prestação + usuário: reaproveita o envio recente ou o
+        # que está em andamento, neste ou em outro worker
+        chave = chave_envio(recebido.sha256, prestacao_id, mes, usuario, senha)
+        anterior, entrada = await asyncio.to_thread(IDEMPOTENCIA.reservar, chave)
+        if anterior is not None:
+            logging.info(f"Upload repetido ({recebido.sha256[:12]}): devolvendo o resultado recente sem reenviar.")
+            return _resposta_json(anterior, 200, headers={"X-Idempotencia": "cache"})
 
-        resultado = processar_planilha(file_path, usuario, senha, mes, ano, prestacao_id)
+        cabecalhos = None
+        if entrada is not None:
+            logging.info(f"Upload repetido ({recebido.sha256[:12]}): aguardando o processamento em andamento.")
+            entrada.anexar(request.is_disconnected)
+            resultado = await _aguardar_anexado(entrada)
+            cabecalhos = {"X-Idempotencia": "em-andamento"}
+        else:
+            try:
+                future, evento = POOL.submeter(
+                    processar_planilha, _origem_pool(recebido), usuario, senha, mes, ano, prestacao_id,
+                    nome_arquivo=recebido.nome, sha256=recebido.sha256,
+                )
+            except BaseException:
+                await asyncio.to_thread(IDEMPOTENCIA.desistir, chave)
+                raise
+            future.add_done_callback(_registrar_metricas)
+            entrada = await asyncio.to_thread(IDEMPOTENCIA.registrar, chave, future)
+            entrada.anexar(request.is_disconnected)
+            resultado = await POOL.aguardar(future, evento, desconectado=entrada.desconectado)
 
         status_code = 422 if resultado.get("status") == "erro" else 200
-        return Response(
-            content=json.dumps(resultado, ensure_ascii=False, default=str),
-            status_code=status_code,
-            media_type="application/json"
+        return _resposta_json(resultado, status_code, headers=cabecalhos)
+
+    except UploadGrande as e:
+        return _resposta_json({"status": "erro", "mensagem": e.detail}, 413)
+
+    except PoolOcupado as e:
+        return _resposta_json(
+            {"status": "erro", "mensagem": f"Servidor ocupado: {e} Tente novamente em instantes."},
+            503, headers={"Retry-After": "10"}
         )
 
+    except JobCancelado as e:
+        return _resposta_json({"status": "erro", "mensagem": str(e)}, 499)
+
     except Exception as e:
         erro = {
             "status": "erro",
             "mensagem": f"Erro interno: {str(e)}",
             "detalhes": {"traceback": traceback.format_exc()[-800:]}
         }
-        return Response(
-            content=json.dumps(erro, ensure_ascii=False),
-            status_code=500,
-            media_type="application/json"
+        return _resposta_json(erro, 500)
+
+
+@app.post("/api/validar")
+async def validar_arquivo(
+    request: Request,
+    file: UploadFile = File(...),
+    mes: str = Form(None),
+    ano: str = Form(None),
+    prestacao_id: str = Form(None)
+):
+    # Só leitura, mapeamento e validação: sem login e sem envio ao SICAP
+    if not file.filename.endswith(('.xlsx', '.xls')):
+        return _resposta_json({"status": "erro", "mensagem": "Formato invalido. Use .xlsx ou .xls"}, 400)
+
+    try:
+        recebido = await receber_upload(file)
+        inicio = time.time()
+        resultado = await POOL.executar(
+            montar_payload, _origem_pool(recebido), mes, ano, prestacao_id,
+            nome_arquivo=recebido.nome, sha256=recebido.sha256, completo=True, desconectado=request.is_disconnected,
         )
-    finally:
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except Exception:
-                pass
+        resultado.setdefault("detalhes", {})["tempo"] = f"{time.time() - inicio:.2f}s"
+        status_code = 200 if resultado.get("status") == "valido" else 422
+        return _resposta_json(resultado, status_code)
+
+    except UploadGrande as e:
+        return _resposta_json({"status": "erro", "mensagem": e.detail}, 413)
+
+    except PoolOcupado as e:
+        return _resposta_json(
+            {"status": "erro", "mensagem": f"Servidor ocupado: {e} Tente novamente em instantes."},
+            503, headers={"Retry-After": "10"}
+        )
+
+    except JobCancelado as e:
+        return _resposta_json({"status": "erro", "mensagem": str(e)}, 499)
+
+    except Exception as e:
+        erro = {
+            "status": "erro",
+            "mensagem": f"Erro interno: {str(e)}",
+            "detalhes": {"traceback": traceback.format_exc()[-800:]}
+        }
+        return _resposta_json(erro, 500)
+
+
+def _sicap_indisponivel():
+    # circuito aberto: recusa na hora, sem ler a planilha
+    estado = SICAP.info()
+    if estado["estado"] != "aberto":
+        return None
+    espera = max(1, int(estado.get("reabre_em", 0)))
+    return _resposta_json(
+        {"status": "erro", "mensagem": f"SICAP indisponível no momento. Tente novamente em {espera}s.",
+         "detalhes": {"sicap": estado}},
+        503, headers={"Retry-After": str(espera)}
+    )
+
+
+async def _aguardar_anexado(entrada):
+    try:
+        return await asyncio.wrap_future(entrada.future)
+    except asyncio.CancelledError:
+        if not entrada.future.cancelled():
+            raise
+        raise JobCancelado("Processamento original cancelado: todos os clientes desconectaram.")
+
+
+def _origem_pool(recebido):
+    # processos não recebem objetos de arquivo: vai o conteúdo em bytes
+    return recebido.conteudo() if POOL.modo == "process" else recebido.arquivo
+
+
+def _registrar_metricas(future):
+    # uma vez por processamento: quem reaproveita o future não conta de novo
+    if future.cancelled():
+        registrar_falha("cancelado")
+    elif future.exception() is not None:
+        registrar_falha(type(future.exception()).__name__)
+    else:
+        registrar_resultado(future.result())
+
+
+def _resposta_json(dados, status_code=200, headers=None):
+    return Response(
+        content=json_bytes(dados, default=str),
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers
+    )
+
+
+# ============================================================
+# JOBS ASSÍNCRONOS
+# POST devolve o id na hora; o progresso sai por GET ou SSE.
+# ============================================================
+
+def _finalizar_job(job_id, future):
+    try:
+        resultado = future.result()
+    except Exception as e:
+        resultado = {
+            "status": "erro",
+            "mensagem": f"Erro interno: {str(e)}",
+            "detalhes": {"tipo_erro": type(e).__name__}
+        }
+    JOBS.concluir(job_id, resultado)
+
+
+def _resposta_job(job_id, status, sha256, reaproveitado=None):
+    dados = {"job_id": job_id, "status": status, "sha256": sha256, "links": {
+        "status": f"/api/jobs/{job_id}",
+        "eventos": f"/api/jobs/{job_id}/eventos",
+    }}
+    if reaproveitado:
+        dados["reaproveitado"] = reaproveitado
+    return _resposta_json(dados, 202)
+
+
+@app.post("/api/jobs")
+async def criar_job(
+    file: UploadFile = File(...),
+    usuario: str = Form(...),
+    senha: str = Form(...),
+    mes: str = Form(None),
+    ano: str = Form(None),
+    prestacao_id: str = Form(None)
+):
+    if not file.filename.endswith(('.xlsx', '.xls')):
+        return _resposta_json({"status": "erro", "mensagem": "Formato invalido. Use .xlsx ou .xls"}, 400)
+
+    indisponivel = _sicap_indisponivel()
+    if indisponivel:
+        return indisponivel
+
+    job_id = None
+    try:
+        recebido = await receber_upload(file)
+        logging.info(f"Upload recebido: {recebido.nome} ({recebido.tamanho} bytes, sha256={recebido.sha256})")
+
+        chave = chave_envio(recebido.sha256, prestacao_id, mes, usuario, senha)
+        anterior, entrada = await asyncio.to_thread(IDEMPOTENCIA.reservar, chave)
+        if anterior is not None:
+            job_id = await asyncio.to_thread(JOBS.criar, recebido.nome)
+            await asyncio.to_thread(JOBS.concluir, job_id, anterior)
+            return _resposta_job(job_id, "concluido", recebido.sha256, "cache")
+
+        if entrada is not None:
+            if entrada.job_id:
+                return _resposta_job(entrada.job_id, "na_fila", recebido.sha256, "em_andamento")
+            # o original veio de /api/processar (ou o job ainda não foi
+            # registrado): um job novo acompanha o mesmo future
+            job_id = await asyncio.to_thread(JOBS.criar, recebido.nome)
+            entrada.anexar()
+            entrada.future.add_done_callback(lambda f: _finalizar_job(job_id, f))
+            return _resposta_job(job_id, "na_fila", recebido.sha256, "em_andamento")
+
+        try:
+            job_id = await asyncio.to_thread(JOBS.criar, recebido.nome)
+            # o job continua depois da resposta, quando o FastAPI já fechou o
+            # UploadFile: vai o conteúdo em bytes
+            conteudo = await asyncio.to_thread(recebido.conteudo)
+            future, _ = POOL.submeter(
+                processar_planilha, conteudo, usuario, senha, mes, ano, prestacao_id,
+                progresso=ProgressoJob(job_id, JOBS.caminho), nome_arquivo=recebido.nome, sha256=recebido.sha256,
+            )
+        except BaseException:
+            await asyncio.to_thread(IDEMPOTENCIA.desistir, chave)
+            raise
+        future.add_done_callback(_registrar_metricas)
+        entrada = await asyncio.to_thread(IDEMPOTENCIA.registrar, chave, future, job_id)
+        entrada.anexar()
+    except UploadGrande as e:
+        return _resposta_json({"status": "erro", "mensagem": e.detail}, 413)
+    except PoolOcupado as e:
+        await asyncio.to_thread(JOBS.remover, job_id)
+        return _resposta_json(
+            {"status": "erro", "mensagem": f"Servidor ocupado: {e} Tente novamente em instantes."},
+            503, headers={"Retry-After": "10"}
+        )
+    except Exception as e:
+        if job_id:
+            await asyncio.to_thread(JOBS.remover, job_id)
+        return _resposta_json({"status": "erro", "mensagem": f"Erro interno: {str(e)}"}, 500)
+
+    future.add_done_callback(lambda f: _finalizar_job(job_id, f))
+    return _resposta_job(job_id, "na_fila", recebido.sha256)
+
+
+@app.get("/api/jobs/{job_id}")
+async def obter_job(job_id: str):
+    job = await asyncio.to_thread(JOBS.obter, job_id)
+    if job is None:
+        return _resposta_json({"status": "erro", "mensagem": "Job não encontrado."}, 404)
+    return _resposta_json(job)
+
+
+@app.post("/api/lotes")
+async def criar_lote(
+    files: List[UploadFile] = File(...),
+    usuario: str = Form(...),
+    senha: str = Form(...),
+    mes: str = Form(None),
+    ano: str = Form(None),
+    prestacao_id: str = Form(None)
+):
+    indisponivel = _sicap_indisponivel()
+    if indisponivel:
+        return indisponivel
+
+    if len(_TAREFAS_LOTE) >= LOTE_SIMULTANEOS:
+        return _resposta_json(
+            {"status": "erro", "mensagem": f"Servidor ocupado: limite de {LOTE_SIMULTANEOS} lotes simultâneos atingido. Tente novamente em instantes."},
+            503, headers={"Retry-After": "30"}
+        )
+
+    lote = ArquivosLote()
+    try:
+        for file in files:
+            await asyncio.to_thread(lote.adicionar, file.filename, file.file)
+        if not lote.planilhas:
+            raise LoteInvalido("Nenhuma planilha .xlsx ou .xls encontrada no envio.")
+        job_id = await asyncio.to_thread(JOBS.criar, f"{len(lote.planilhas)} planilha(s): " + ", ".join(n for n, _ in lote.planilhas)[:200])
+    except LoteInvalido as e:
+        lote.remover()
+        return _resposta_json({"status": "erro", "mensagem": str(e), "detalhes": {"rejeitados": lote.rejeitados}}, 400)
+    except Exception as e:
+        lote.remover()
+        return _resposta_json({"status": "erro", "mensagem": f"Erro interno: {str(e)}"}, 500)
+
+    tarefa = asyncio.create_task(LOTES.processar(job_id, lote, usuario, senha, mes, ano, prestacao_id))
+    _TAREFAS_LOTE.add(tarefa)
+    tarefa.add_done_callback(_TAREFAS_LOTE.discard)
+    return _resposta_json(
+        {"job_id": job_id, "status": "na_fila", "arquivos": [n for n, _ in lote.planilhas],
+         "rejeitados": lote.rejeitados, "links": {
+            "status": f"/api/jobs/{job_id}",
+            "eventos": f"/api/jobs/{job_id}/eventos",
+        }},
+        202
+    )
+
+
+# Intervalo de consulta ao banco e de keep-alive do SSE (segundos)
+SSE_INTERVALO = 0.5
+SSE_KEEPALIVE = 15
+
+
+@app.get("/api/jobs/{job_id}/eventos")
+async def eventos_job(job_id: str, request: Request):
+    if await asyncio.to_thread(JOBS.obter, job_id) is None:
+        return _resposta_json({"status": "erro", "mensagem": "Job não encontrado."}, 404)
+
+    def _evento(nome, dados):
+        return f"event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n"
+
+    async def gerar():
+        ultimo_evento = 0
+        ultimo_envio = asyncio.get_running_loop().time()
+        while True:
+            # status antes dos eventos: se já é final, nenhuma etapa fica para trás
+            job = await asyncio.to_thread(JOBS.obter, job_id)
+            for ultimo_evento, item in await asyncio.to_thread(JOBS.eventos, job_id, ultimo_evento):
+                yield _evento("etapa", item)
+                ultimo_envio = asyncio.get_running_loop().time()
+            if job["status"] in STATUS_FINAIS:
+                yield _evento("fim", job)
+                return
+            if await request.is_disconnected():
+                return
+            if asyncio.get_running_loop().time() - ultimo_envio > SSE_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                ultimo_envio = asyncio.get_running_loop().time()
+            await asyncio.sleep(SSE_INTERVALO)
+
+    return StreamingResponse(
+        gerar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ============================================================
+# MAPEAMENTOS (administração)
+# Alterações gravadas direto em Utils/mapeamentos.json: o próximo
+# processamento já usa a versão nova, sem redeploy. Exige
+# "Authorization: Bearer <SICAP_ADMIN_TOKEN>".
+# ============================================================
+
+def _admin_negado(request: Request):
+    if not ADMIN_TOKEN:
+        return _resposta_json(
+            {"status": "erro", "mensagem": "API de mapeamentos desativada: defina SICAP_ADMIN_TOKEN no servidor."}, 403
+        )
+    esquema, _, token = request.headers.get("authorization", "").partition(" ")
+    if esquema.lower() != "bearer" or not secrets.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        return _resposta_json(
+            {"status": "erro", "mensagem": "Token de administração inválido."}, 401,
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return None
+
+
+def _categoria_nao_encontrada(categoria):
+    return _resposta_json({"status": "erro", "mensagem": f"Categoria de mapeamento não encontrada: {categoria}"}, 404)
+
+
+def _resposta_categoria(instantaneo, categoria):
+    # ETag = versão do arquivo inteiro; mandar de volta em If-Match no PUT
+    return _resposta_json(
+        {"categoria": categoria, "versao": instantaneo.versao, "valores": instantaneo.categoria(categoria)},
+        headers={"ETag": f'"{instantaneo.versao}"'}
+    )
+
+
+@app.get("/api/mapeamentos/{categoria}")
+async def obter_mapeamento(categoria: str, request: Request):
+    negado = _admin_negado(request)
+    if negado:
+        return negado
+    instantaneo = await asyncio.to_thread(MAPEAMENTOS.instantaneo)
+    if categoria not in instantaneo.mapas:
+        return _categoria_nao_encontrada(categoria)
+    return _resposta_categoria(instantaneo, categoria)
+
+
+@app.put("/api/mapeamentos/{categoria}")
+async def alterar_mapeamento(categoria: str, request: Request):
+    # corpo: {"valores": {nome: id, ...}, "versao": "<lida no GET>", "autor": "..."};
+    # a versão também pode vir em If-Match. Sem versão -> 428; desatualizada -> 409.
+    negado = _admin_negado(request)
+    if negado:
+        return negado
+    try:
+        corpo = await request.json()
+    except ValueError:
+        corpo = None
+    if not isinstance(corpo, dict):
+        return _resposta_json({"status": "erro", "mensagem": "Corpo deve ser um objeto JSON com \"valores\"."}, 400)
+    versao = request.headers.get("if-match", "").strip().strip('"') or corpo.get("versao")
+    if not versao:
+        return _resposta_json(
+            {"status": "erro", "mensagem": "Informe a versão lida no GET (If-Match ou \"versao\") para alterar a categoria."},
+            428
+        )
+    try:
+        instantaneo = await asyncio.to_thread(
+            MAPEAMENTOS.atualizar, categoria, corpo.get("valores"), versao, str(corpo.get("autor") or "")
+        )
+    except KeyError:
+        return _categoria_nao_encontrada(categoria)
+    except MapeamentoInvalido as e:
+        return _resposta_json({"status": "erro", "mensagem": str(e)}, 400)
+    except ConflitoVersao as e:
+        return _resposta_json({"status": "erro", "mensagem": str(e)}, 409)
+    return _resposta_categoria(instantaneo, categoria)
+
+
+@app.get("/api/mapeamentos/{categoria}/versoes")
+async def versoes_mapeamento(categoria: str, request: Request):
+    negado = _admin_negado(request)
+    if negado:
+        return negado
+    return _resposta_json({"categoria": categoria, "versoes": await asyncio.to_thread(MAPEAMENTOS.historico, categoria)})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import MappingProxyType
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+try:
+    from .mapping import MappingIndex
+except ImportError:
+    from mapping import MappingIndex
+
+# Utils/mapeamentos.json em memória como um instantâneo imutável. Cada
+# processamento pega o instantâneo uma vez e usa o mesmo do início ao fim;
+# arquivo alterado (pela API ou à mão) vira um instantâneo novo, trocado numa
+# única atribuição, sem afetar quem já está processando.
+#
+# Configuração via ambiente:
+#   SICAP_ADMIN_TOKEN          token Bearer de /api/mapeamentos (sem ele, a API fica desligada)
+#   SICAP_MAPEAMENTOS_VERSOES  banco SQLite com o histórico das alterações ("0" desliga)
+ADMIN_TOKEN = os.environ.get("SICAP_ADMIN_TOKEN", "")
+VERSOES_DB = os.environ.get("SICAP_MAPEAMENTOS_VERSOES") or (
+    "/tmp/sicap_mapeamentos.db" if os.name != 'nt' else os.path.join(os.path.dirname(__file__), "mapeamentos.db")
+)
+
+
+class ConflitoVersao(Exception):
+    """A categoria mudou desde a versão que o cliente leu."""
+
+
+class MapeamentoInvalido(ValueError):
+    pass
+
+
+def _congelar(valor):
+    if isinstance(valor, dict):
+        return MappingProxyType({k: _congelar(v) for k, v in valor.items()})
+    if isinstance(valor, list):
+        return tuple(_congelar(v) for v in valor)
+    return valor
+
+
+def _descongelar(valor):
+    if isinstance(valor, MappingProxyType):
+        return {k: _descongelar(v) for k, v in valor.items()}
+    if isinstance(valor, tuple):
+        return [_descongelar(v) for v in valor]
+    return valor
+
+
+def _serializar(mapas) -> bytes:
+    # mesmo formato do arquivo versionado no repositório
+    return json.dumps(mapas, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def validar_valores(categoria, valores):
+    """Confere o corpo de um PUT: objeto de nome -> ID inteiro (ou objetos
+    aninhados de IDs, como PrestacaoContaId por ano e mês)."""
+    def _conferir(mapa, caminho):
+        if not isinstance(mapa, dict) or not mapa:
+            raise MapeamentoInvalido(f"{caminho}: esperado um objeto não vazio de nome -> ID.")
+        for chave, valor in mapa.items():
+            if not chave.strip():
+                raise MapeamentoInvalido(f"{caminho}: nome vazio.")
+            if isinstance(valor, dict):
+                _conferir(valor, f"{caminho}.{chave}")
+            elif isinstance(valor, bool) or not isinstance(valor, int):
+                raise MapeamentoInvalido(f"{caminho}.{chave}: o ID deve ser inteiro.")
+    _conferir(valores, categoria)
+
+
+@dataclass(frozen=True)
+class Instantaneo:
+    versao: str  # SHA-256 do conteúdo do arquivo
+    mapas: MappingProxyType
+    indice: MappingIndex
+    mtime_ns: int
+    tamanho: int
+    carregado_em: float
+
+    def categoria(self, nome):
+        """Cópia mutável de uma categoria (None se não existir)."""
+        valores = self.mapas.get(nome)
+        return None if valores is None else _descongelar(valores)
+
+
+class Mapeamentos:
+    """Instantâneo atual de `caminho`, recarregado só quando o arquivo muda.
+
+    `instantaneo()` custa um `stat` quando nada mudou. Mudou data ou tamanho,
+    o arquivo é relido; o índice só é recompilado se o SHA-256 for outro
+    (salvar sem alterar não recompila). JSON inválido mantém o instantâneo
+    anterior.
+
+    `atualizar` grava uma categoria no arquivo (substituição atômica, com
+    trava entre processos) e registra a versão anterior e a nova no SQLite
+    de `versoes`. Os outros processos enxergam a mudança pela data do
+    arquivo na próxima chamada.
+    """
+
+    def __init__(self, caminho, versoes=VERSOES_DB):
+        self.caminho = caminho
+        self.versoes = versoes
+        self._atual = None
+        self._lock = threading.Lock()
+        self._versoes_prontas = False
+
+    # ---------------------------------------------------------------- leitura
+
+    def _carregar(self):
+        with open(self.caminho, "rb") as f:
+            info = os.fstat(f.fileno())
+            conteudo = f.read()
+        versao = hashlib.sha256(conteudo).hexdigest()
+        atual = self._atual
+        if atual is not None and atual.versao == versao:
+            indice, mapas = atual.indice, atual.mapas
+        else:
+            mapas = _congelar(json.loads(conteudo))
+            indice = MappingIndex(mapas)
+            if atual is not None:
+                logging.info(f"Mapeamentos recarregados: versão {versao[:12]} (antes {atual.versao[:12]})")
+        return Instantaneo(versao, mapas, indice, info.st_mtime_ns, info.st_size, time.time())
+
+    def instantaneo(self) -> Instantaneo:
+        info = os.stat(self.caminho)
+        atual = self._atual
+        if atual is not None and (atual.mtime_ns, atual.tamanho) == (info.st_mtime_ns, info.st_size):
+            return atual
+        with self._lock:
+            atual = self._atual
+            if atual is not None and (atual.mtime_ns, atual.tamanho) == (info.st_mtime_ns, info.st_size):
+                return atual
+            try:
+                novo = self._carregar()
+            except (ValueError, TypeError) as e:
+                if atual is None:
+                    raise
+                logging.error(f"mapeamentos.json inválido ({e}); mantendo a versão {atual.versao[:12]}")
+                return atual
+            self._atual = novo
+            return novo
+
+    # ---------------------------------------------------------------- escrita
+
+    @contextmanager
+    def _trava(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.caminho}.lock", "a") as trava:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(trava, fcntl.LOCK_UN)
+
+    def atualizar(self, categoria, valores, versao_esperada, autor="") -> Instantaneo:
+        """Substitui `categoria` inteira; `versao_esperada` é a `versao` lida
+        pelo cliente e é sempre conferida (sem ela, `ConflitoVersao`)."""
+        validar_valores(categoria, valores)
+        with self._trava():
+            with open(self.caminho, "rb") as f:
+                conteudo = f.read()
+            anterior = hashlib.sha256(conteudo).hexdigest()
+            if versao_esperada != anterior:
+                raise ConflitoVersao(f"Os mapeamentos mudaram (versão atual {anterior}); leia de novo antes de alterar.")
+            mapas = json.loads(conteudo)
+            if categoria not in mapas:
+                raise KeyError(categoria)
+            mapas[categoria] = valores
+            novo = _serializar(mapas)
+            versao = hashlib.sha256(novo).hexdigest()
+            if versao != anterior:
+                temporario = f"{self.caminho}.{os.getpid()}.tmp"
+                with open(temporario, "wb") as f:
+                    f.write(novo)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temporario, self.caminho)
+                self._registrar_versao(anterior, conteudo, versao, novo, categoria, autor)
+                logging.info(f"Mapeamentos: categoria {categoria} alterada por {autor or 'admin'} ({anterior[:12]} -> {versao[:12]})")
+        return self.instantaneo()
+
+    # ---------------------------------------------------------------- histórico
+
+    @property
+    def _com_historico(self):
+        return self.versoes not in ("", "0")
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.versoes, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                if not self._versoes_prontas:
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS versoes (
+                            versao TEXT PRIMARY KEY,
+                            anterior TEXT,
+                            categoria TEXT,
+                            autor TEXT,
+                            conteudo TEXT NOT NULL,
+                            criado_em REAL NOT NULL
+                        )
+                    """)
+                    self._versoes_prontas = True
+                yield conn
+        finally:
+            conn.close()
+
+    def _registrar_versao(self, anterior, conteudo_anterior, versao, conteudo, categoria, autor):
+        if not self._com_historico:
+            return
+        try:
+            with self._conectar() as conn:
+                # a versão que estava no arquivo entra uma vez, para poder voltar a ela
+                conn.execute(
+                    "INSERT OR IGNORE INTO versoes (versao, anterior, categoria, autor, conteudo, criado_em) "
+                    "VALUES (?, NULL, NULL, 'arquivo', ?, ?)",
+                    (anterior, conteudo_anterior.decode("utf-8"), time.time()),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO versoes (versao, anterior, categoria, autor, conteudo, criado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (versao, anterior, categoria, autor, conteudo.decode("utf-8"), time.time()),
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"Histórico de mapeamentos não gravado ({self.versoes}): {e}")
+
+    def historico(self, categoria, limite=50) -> list:
+        """Alterações de `categoria`, da mais recente para a mais antiga."""
+        if not self._com_historico:
+            return []
+        with self._conectar() as conn:
+            linhas = conn.execute(
+                "SELECT versao, anterior, autor, criado_em, conteudo FROM versoes "
+                "WHERE categoria = ? ORDER BY criado_em DESC LIMIT ?",
+                (categoria, limite),
+            ).fetchall()
+        return [
+            {
+                "versao": l["versao"], "anterior": l["anterior"], "autor": l["autor"], "criado_em": l["criado_em"],
+                "valores": json.loads(l["conteudo"]).get(categoria),
+            }
+            for l in linhas
+        ]
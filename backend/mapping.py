@@ -0,0 +1,309 @@
+import json
+import re
+import unicodedata
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+# ==================================================================================
+# NORMALIZAÇÃO
+# ==================================================================================
+
+def normalizar_texto(texto):
+    if pd.isna(texto):
+        return ""
+    texto = str(texto).strip().upper()
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return texto
+
+def _palavras(texto):
+    return set(re.findall(r'\w+', texto))
+
+def _fatorar(serie):
+    # Em colunas object com tipos misturados, 1, 1.0 e True colidem no hash,
+    # mas `mapear` os trata de forma diferente: fatora por (tipo, valor).
+    if serie.dtype == object and "mixed" in pd.api.types.infer_dtype(serie, skipna=True):
+        codigos, unicos = pd.factorize(serie.map(lambda v: (type(v), v)), use_na_sentinel=False)
+        return codigos, [v for _, v in unicos]
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    return codigos, pd.Series(unicos, dtype=object).tolist()
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+def _trigramas_palavras(texto):
+    # como no pg_trgm: cada palavra com dois espaços antes e um depois, para
+    # início de palavra pesar mais e palavras curtas também gerarem trigramas
+    trigramas = set()
+    for palavra in re.findall(r'\w+', texto):
+        p = f"  {palavra} "
+        trigramas.update(p[i:i + 3] for i in range(len(p) - 2))
+    return trigramas
+
+# ==================================================================================
+# ESTRUTURAS DE BUSCA
+# ==================================================================================
+
+class _AhoCorasick:
+    """Automato que devolve a menor ordem entre as chaves contidas em um texto."""
+
+    def __init__(self, padroes):
+        self._goto = [{}]
+        self._falha = [0]
+        self._melhor = [None]
+        for padrao, ordem in padroes:
+            no = 0
+            for c in padrao:
+                prox = self._goto[no].get(c)
+                if prox is None:
+                    prox = len(self._goto)
+                    self._goto[no][c] = prox
+                    self._goto.append({})
+                    self._falha.append(0)
+                    self._melhor.append(None)
+                no = prox
+            if self._melhor[no] is None or ordem < self._melhor[no]:
+                self._melhor[no] = ordem
+
+        # BFS: liga cada nó ao maior sufixo próprio presente na árvore e
+        # propaga a menor ordem pelos links de falha.
+        fila = list(self._goto[0].values())
+        i = 0
+        while i < len(fila):
+            no = fila[i]
+            i += 1
+            for c, filho in self._goto[no].items():
+                f = self._falha[no]
+                while f and c not in self._goto[f]:
+                    f = self._falha[f]
+                destino = self._goto[f].get(c, 0)
+                self._falha[filho] = destino if destino != filho else 0
+                herdado = self._melhor[self._falha[filho]]
+                if herdado is not None and (self._melhor[filho] is None or herdado < self._melhor[filho]):
+                    self._melhor[filho] = herdado
+                fila.append(filho)
+
+    def menor_ordem(self, texto):
+        melhor = None
+        no = 0
+        goto, falha, melhores = self._goto, self._falha, self._melhor
+        for c in texto:
+            while no and c not in goto[no]:
+                no = falha[no]
+            no = goto[no].get(c, 0)
+            m = melhores[no]
+            if m is not None and (melhor is None or m < melhor):
+                melhor = m
+                if melhor == 0:
+                    break
+        return melhor
+
+
+class _IndiceAproximado:
+    """Fallbacks de `mapear` (substring nos dois sentidos e subconjunto de
+    palavras) para uma categoria, preservando a ordem das chaves do JSON."""
+
+    def __init__(self, itens, ignorar_vazias):
+        # itens: lista de (chave_normalizada, id) na ordem original do JSON
+        self._ids = [v for _, v in itens]
+        self._chaves = [k for k, _ in itens]
+        self._ignorar_vazias = ignorar_vazias
+
+        validas = [(k, o) for o, k in enumerate(self._chaves) if k]
+        vazias = [o for o, k in enumerate(self._chaves) if not k]
+        self._ordem_vazia = None if ignorar_vazias or not vazias else vazias[0]
+        self._automato = _AhoCorasick(validas)
+
+        self._por_trigrama = {}
+        for k, o in validas:
+            for t in _trigramas(k):
+                self._por_trigrama.setdefault(t, []).append(o)
+
+        self._tam_palavras = []
+        self._por_palavra = {}
+        for o, k in enumerate(self._chaves):
+            palavras = _palavras(k)
+            self._tam_palavras.append(len(palavras))
+            for p in palavras:
+                self._por_palavra.setdefault(p, []).append(o)
+
+    def _contem_valor(self, val):
+        # menor ordem de chave que contém `val` como substring
+        if len(val) < 3:
+            for o, k in enumerate(self._chaves):
+                if (k or not self._ignorar_vazias) and val in k:
+                    return o
+            return None
+        candidatos = None
+        for t in _trigramas(val):
+            lista = self._por_trigrama.get(t)
+            if not lista:
+                return None
+            candidatos = set(lista) if candidatos is None else candidatos.intersection(lista)
+            if not candidatos:
+                return None
+        for o in sorted(candidatos):
+            if val in self._chaves[o]:
+                return o
+        return None
+
+    def por_substring(self, val):
+        ordens = [o for o in (self._ordem_vazia, self._automato.menor_ordem(val), self._contem_valor(val)) if o is not None]
+        return min(ordens) if ordens else None
+
+    def por_palavras(self, val):
+        contagem = {}
+        for p in _palavras(val):
+            for o in self._por_palavra.get(p, ()):
+                contagem[o] = contagem.get(o, 0) + 1
+        ordens = [o for o, n in contagem.items() if n == self._tam_palavras[o]]
+        return min(ordens) if ordens else None
+
+    def id_da_ordem(self, ordem):
+        return self._ids[ordem]
+
+
+class _IndiceSugestoes:
+    """Chaves de uma categoria mais parecidas com um valor sem mapeamento.
+
+    Similaridade de trigramas |A ∩ B| / |A ∪ B| (a do pg_trgm). Cada trigrama
+    aponta para um array com as chaves que o contêm; a interseção com todas
+    as chaves sai de um único `np.bincount`, sem laço Python por chave.
+    """
+
+    def __init__(self, mapa):
+        self._nomes = []
+        self._ids = []
+        tamanhos = []
+        por_trigrama = {}
+        for nome, id_ in mapa.items():
+            trigramas = _trigramas_palavras(normalizar_texto(nome))
+            if not trigramas or isinstance(id_, Mapping):
+                continue
+            ordem = len(self._nomes)
+            self._nomes.append(nome)
+            self._ids.append(id_)
+            tamanhos.append(len(trigramas))
+            for t in trigramas:
+                por_trigrama.setdefault(t, []).append(ordem)
+        self._tamanhos = np.array(tamanhos, dtype=np.int64)
+        self._por_trigrama = {t: np.array(ordens, dtype=np.int64) for t, ordens in por_trigrama.items()}
+
+    def sugerir(self, valor, k, minimo):
+        trigramas = _trigramas_palavras(normalizar_texto(valor))
+        listas = [self._por_trigrama[t] for t in trigramas if t in self._por_trigrama]
+        if not listas:
+            return []
+        comuns = np.bincount(np.concatenate(listas), minlength=len(self._nomes))
+        candidatas = np.flatnonzero(comuns)
+        inter = comuns[candidatas]
+        similaridade = inter / (len(trigramas) + self._tamanhos[candidatas] - inter)
+        ok = similaridade >= minimo
+        candidatas, similaridade = candidatas[ok], similaridade[ok]
+        # mais parecida primeiro; empate fica com a ordem do JSON
+        sugestoes, vistos = [], set()
+        for i in np.lexsort((candidatas, -similaridade)):
+            id_ = self._ids[candidatas[i]]
+            if id_ in vistos:
+                continue  # vários nomes para o mesmo ID: fica o mais parecido
+            vistos.add(id_)
+            sugestoes.append({"id": id_, "nome": self._nomes[candidatas[i]], "similaridade": round(float(similaridade[i]), 3)})
+            if len(sugestoes) == k:
+                break
+        return sugestoes
+
+# ==================================================================================
+# MAPPING INDEX
+# ==================================================================================
+
+class MappingIndex:
+    """Versão compilada de `Utils/mapeamentos.json`.
+
+    Normaliza as chaves uma única vez e monta índices para os fallbacks de
+    CargoId/Unidade. `mapear` devolve exatamente os mesmos IDs que
+    o `mapear(valor, categoria, mapas)` original (benchmarks/referencia.py).
+    """
+
+    CATEGORIAS_NUMERICAS = ("LinhaServicoId", "Unidade")
+    # categorias com sugestões ("você quis dizer") para valores sem mapeamento
+    CATEGORIAS_SUGESTOES = ("CargoId", "Unidade")
+
+    def __init__(self, mapas):
+        self.mapas = mapas
+        self._exatos = {}
+        self._aproximados = {}
+        self._sugestoes = {}
+
+        for categoria, mapa in mapas.items():
+            if not isinstance(mapa, Mapping):
+                continue
+            if categoria == "LinhaServicoId":
+                extra = mapas.get("LinhasDeServico", {})
+                if extra:
+                    mapa = dict(mapa)
+                    mapa.update(extra)
+            itens = [(normalizar_texto(k), v) for k, v in mapa.items()]
+            self._exatos[categoria] = dict(itens)
+            if categoria == "CargoId":
+                self._aproximados[categoria] = _IndiceAproximado(itens, ignorar_vazias=False)
+            elif categoria == "Unidade":
+                self._aproximados[categoria] = _IndiceAproximado(itens, ignorar_vazias=True)
+            if categoria in self.CATEGORIAS_SUGESTOES:
+                self._sugestoes[categoria] = _IndiceSugestoes(mapa)
+
+        # LinhaServicoId herda LinhasDeServico mesmo se a categoria não existir
+        if "LinhaServicoId" not in mapas and isinstance(mapas.get("LinhasDeServico"), Mapping):
+            self._exatos["LinhaServicoId"] = {normalizar_texto(k): v for k, v in mapas["LinhasDeServico"].items()}
+
+    @classmethod
+    def from_file(cls, caminho):
+        with open(caminho, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def mapear(self, valor, categoria):
+        try:
+            if categoria in self.CATEGORIAS_NUMERICAS:
+                if isinstance(valor, (int, float)) and not pd.isna(valor):
+                    return int(valor)
+                if isinstance(valor, str) and valor.strip().isdigit():
+                    return int(valor.strip())
+        except Exception:
+            pass
+
+        val = normalizar_texto(valor)
+        exato = self._exatos.get(categoria, {})
+        if val in exato:
+            return exato[val]
+
+        aproximado = self._aproximados.get(categoria)
+        if aproximado is None:
+            return None
+        ordem = aproximado.por_substring(val)
+        if ordem is None and categoria == "Unidade":
+            ordem = aproximado.por_palavras(val)
+        return None if ordem is None else aproximado.id_da_ordem(ordem)
+
+    def sugerir(self, valor, categoria, k=3, minimo=0.3):
+        """Até `k` IDs de `categoria` com nome parecido com `valor`, do mais
+        para o menos parecido: `[{"id", "nome", "similaridade"}]`.
+
+        `similaridade` vai de 0 a 1; abaixo de `minimo` não entra.
+        """
+        indice = self._sugestoes.get(categoria)
+        if indice is None or k <= 0:
+            return []
+        return indice.sugerir(valor, k, minimo)
+
+    def mapear_coluna(self, serie, categoria):
+        """Mapeia só os valores distintos de `serie` e replica os IDs por índice.
+
+        Retorna `(ids, valores_unicos, ids_unicos)`: `ids` tem um ID por linha
+        (0 quando não mapeado) e os dois últimos permitem montar relatórios de
+        valores sem mapeamento sem percorrer a coluna inteira de novo.
+        """
+        codigos, valores_unicos = _fatorar(serie)
+        resultados = pd.Series([self.mapear(v, categoria) for v in valores_unicos], dtype=object)
+        ids_unicos = pd.to_numeric(resultados, errors="coerce").fillna(0).astype(np.int64).to_numpy()
+        return ids_unicos.take(codigos), valores_unicos, ids_unicos
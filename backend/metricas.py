@@ -0,0 +1,156 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, disable_created_metrics, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Métricas do processamento via prometheus_client. Os valores ficam no
+# processo da API: os workers do pool devolvem as medições junto com o
+# resultado (`detalhes["metricas"]`).
+#
+# Com vários processos da API (gunicorn), PROMETHEUS_MULTIPROC_DIR aponta
+# para um diretório compartilhado (modo multiprocesso do prometheus_client):
+# cada processo grava ali os seus contadores e histogramas e /metrics soma
+# todos na coleta. O gunicorn.conf.py cria e limpa o diretório antes de
+# importar a aplicação. Os medidores continuam sendo do processo que respondeu.
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or None
+
+TIPO_CONTEUDO = CONTENT_TYPE_LATEST
+
+BUCKETS_SEGUNDOS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BUCKETS_LINHAS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000, 100000, 500000)
+BUCKETS_BYTES = tuple(1024 * kb for kb in (1, 10, 50, 100, 500, 1024, 5 * 1024, 10 * 1024, 50 * 1024, 100 * 1024))
+
+# sem as séries *_created, que o modo multiprocesso não tem: a saída é a
+# mesma com um processo ou vários
+disable_created_metrics()
+
+
+class _Medidores:
+    """Coletor dos gauges lidos na hora da coleta, a partir de `funcao()`."""
+
+    def __init__(self):
+        self._medidores = []
+
+    def adicionar(self, nome, ajuda, funcao):
+        self._medidores.append((nome, ajuda, funcao))
+
+    def collect(self):
+        for nome, ajuda, funcao in self._medidores:
+            try:
+                valor = float(funcao())
+            except Exception:
+                continue
+            yield GaugeMetricFamily(nome, ajuda, value=valor)
+
+
+REGISTRO = CollectorRegistry()
+_MEDIDORES = _Medidores()
+REGISTRO.register(_MEDIDORES)
+
+ETAPAS = Histogram(
+    "sicap_etapa_segundos", "Duração de cada etapa do processamento de uma planilha.", ("etapa",),
+    buckets=BUCKETS_SEGUNDOS, registry=REGISTRO,
+)
+PROCESSAMENTOS = Counter(
+    "sicap_processamentos_total", "Planilhas processadas, por resultado, etapa final e tipo de erro.",
+    ("status", "etapa", "tipo_erro"), registry=REGISTRO,
+)
+LINHAS = Histogram(
+    "sicap_linhas_por_job", "Prestadores (linhas da aba 610) por planilha enviada.",
+    buckets=BUCKETS_LINHAS, registry=REGISTRO,
+)
+PAYLOAD_BYTES = Histogram(
+    "sicap_payload_bytes", "Tamanho do JSON enviado ao SICAP, em bytes.",
+    buckets=BUCKETS_BYTES, registry=REGISTRO,
+)
+
+
+def medidor(nome, ajuda, funcao):
+    """Gauge deste processo, lido na coleta de /metrics."""
+    _MEDIDORES.adicionar(nome, ajuda, funcao)
+
+
+def exposicao() -> bytes:
+    """Corpo de /metrics; com PROMETHEUS_MULTIPROC_DIR, soma todos os processos."""
+    if MULTIPROC_DIR is None:
+        return generate_latest(REGISTRO)
+    registro = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registro, MULTIPROC_DIR)
+    registro.register(_MEDIDORES)
+    return generate_latest(registro)
+
+
+class Medicao:
+    """Cronometra as etapas de um processamento.
+
+    É passada como `progresso` para `montar_payload`/`processar_planilha`:
+    cada chamada fecha a etapa anterior e abre a nova, e repassa a etapa para
+    o `progresso` original (ex.: `ProgressoJob`).
+    """
+
+    def __init__(self, progresso=None, anterior=None):
+        # `anterior`: resumo de uma medição feita em outro processo, para continuar dela
+        anterior = anterior or {}
+        self.progresso = progresso
+        self.tempos = dict(anterior.get("etapas") or {})
+        self.etapa = anterior.get("etapa_final")
+        self.linhas = anterior.get("linhas")
+        self.bytes_payload = anterior.get("bytes_payload")
+        self._inicio = time.perf_counter() - anterior.get("total", 0.0)
+        self._desde = None
+
+    def __call__(self, etapa):
+        self._fechar()
+        self.etapa = etapa
+        self._desde = time.perf_counter()
+        if self.progresso is not None:
+            self.progresso(etapa)
+
+    def _fechar(self):
+        if self._desde is not None:
+            self.tempos[self.etapa] = self.tempos.get(self.etapa, 0.0) + time.perf_counter() - self._desde
+            self._desde = None
+
+    def resumo(self, tipo_erro=None) -> dict:
+        self._fechar()
+        resumo = {
+            "etapas": {etapa: round(t, 4) for etapa, t in self.tempos.items()},
+            "total": round(time.perf_counter() - self._inicio, 4),
+            "etapa_final": self.etapa,
+            "tipo_erro": tipo_erro,
+        }
+        if self.linhas is not None:
+            resumo["linhas"] = self.linhas
+        if self.bytes_payload is not None:
+            resumo["bytes_payload"] = self.bytes_payload
+        return resumo
+
+
+def registrar_resultado(resultado):
+    """Alimenta as métricas a partir de `detalhes["metricas"]` de um resultado."""
+    if not isinstance(resultado, dict):
+        return
+    medicoes = (resultado.get("detalhes") or {}).get("metricas")
+    if not isinstance(medicoes, dict):
+        return
+    for etapa, segundos in (medicoes.get("etapas") or {}).items():
+        ETAPAS.labels(etapa=etapa).observe(segundos)
+    ETAPAS.labels(etapa="total").observe(medicoes.get("total", 0.0))
+    status = resultado.get("status") or "erro"
+    PROCESSAMENTOS.labels(
+        status=status,
+        etapa=medicoes.get("etapa_final") or "",
+        tipo_erro="" if status == "sucesso" else (medicoes.get("tipo_erro") or "desconhecido"),
+    ).inc()
+    if status == "sucesso" and medicoes.get("linhas") is not None:
+        LINHAS.observe(medicoes["linhas"])
+    if medicoes.get("bytes_payload") is not None:
+        PAYLOAD_BYTES.observe(medicoes["bytes_payload"])
+
+
+def registrar_falha(tipo_erro):
+    """Processamento que terminou sem resultado (cancelado ou exceção no pool)."""
+    PROCESSAMENTOS.labels(status="erro", etapa="", tipo_erro=tipo_erro).inc()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+# Perfis de layout da aba 610: cada fornecedor (GlobalMed, PersonalMed...) usa
+# sempre o mesmo cabeçalho. A impressão digital do cabeçalho leva direto às
+# colunas já resolvidas, sem passar pela busca aproximada de `resolver_coluna`.
+#
+# Configuração via ambiente:
+#   SICAP_PERFIS_LAYOUT   arquivo JSON dos perfis ("0" desliga o registro)
+PERFIS_ARQUIVO = os.environ.get("SICAP_PERFIS_LAYOUT") or (
+    "/tmp/sicap_perfis_layout.json" if os.name != 'nt' else os.path.join(os.path.dirname(__file__), "perfis_layout.json")
+)
+
+VERSAO = 1
+
+
+def impressao_digital(cabecalho) -> str:
+    """Hash do cabeçalho exatamente como lido (nomes, ordem e espaços)."""
+    return hashlib.sha256("\x1f".join(map(str, cabecalho)).encode("utf-8")).hexdigest()[:32]
+
+
+def _hash_esperado(esperado) -> str:
+    return hashlib.sha256(json.dumps(esperado, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class PerfilLayout:
+    impressao: str
+    esperado: str  # hash dos campos pedidos quando o perfil foi resolvido
+    colunas: dict  # campo -> nome da coluna no cabeçalho
+    tipos: dict = field(default_factory=dict)  # campo -> dtype lido na primeira vez
+    cabecalho: list = field(default_factory=list)
+    criado: str = ""
+
+
+class RegistroPerfis:
+    """Perfis de layout conhecidos, persistidos em JSON.
+
+    Cada processo guarda uma cópia em memória e relê o arquivo quando ele
+    muda. Layout novo é resolvido uma vez e gravado; dois processos gravando
+    ao mesmo tempo no máximo perdem um perfil, que é resolvido de novo na
+    próxima planilha.
+
+    `campos_texto` são os campos lidos com dtype explícito ("str") quando o
+    perfil registrou texto para eles: pula a inferência numérica do parser.
+    Datas, valores e documentos continuam inferidos, porque a conversão
+    deles depende do tipo original da célula.
+    """
+
+    def __init__(self, caminho=PERFIS_ARQUIVO, campos_texto=()):
+        self.caminho = caminho
+        self.campos_texto = frozenset(campos_texto)
+        self._perfis = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self):
+        return self.caminho not in ("", "0")
+
+    def _ler_arquivo(self):
+        try:
+            mtime = os.path.getmtime(self.caminho)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            if dados.get("versao") == VERSAO:
+                self._perfis = {k: PerfilLayout(**v) for k, v in dados.get("perfis", {}).items()}
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"Perfis de layout ignorados ({self.caminho}): {e}")
+        self._mtime = mtime
+
+    def _gravar(self):
+        temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        dados = {"versao": VERSAO, "perfis": {k: asdict(v) for k, v in self._perfis.items()}}
+        try:
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(dados, f, ensure_ascii=False, indent=1)
+            os.replace(temporario, self.caminho)
+            self._mtime = os.path.getmtime(self.caminho)
+        except OSError as e:
+            logging.warning(f"Não foi possível gravar os perfis de layout em {self.caminho}: {e}")
+
+    def obter(self, cabecalho, esperado):
+        """Perfil do cabeçalho, se já conhecido para os mesmos campos `esperado`."""
+        if not self.ativo:
+            return None
+        with self._lock:
+            self._ler_arquivo()
+            perfil = self._perfis.get(impressao_digital(cabecalho))
+        if perfil is None or perfil.esperado != _hash_esperado(esperado):
+            return None
+        return perfil
+
+    def tipos_explicitos(self, perfil) -> dict:
+        """dtype por nome de coluna para o parser (só campos de texto)."""
+        return {
+            perfil.colunas[campo]: "str"
+            for campo, tipo in perfil.tipos.items()
+            if campo in self.campos_texto and tipo == "str"
+        }
+
+    def registrar(self, cabecalho, esperado, colunas, df):
+        """Guarda o layout recém-resolvido; layouts incompletos não viram perfil."""
+        if not self.ativo or any(c is None for c in colunas.values()):
+            return None
+        perfil = PerfilLayout(
+            impressao=impressao_digital(cabecalho),
+            esperado=_hash_esperado(esperado),
+            colunas=dict(colunas),
+            tipos={campo: str(df[coluna].dtype) for campo, coluna in colunas.items() if coluna in df.columns},
+            cabecalho=[str(c) for c in cabecalho],
+            criado=datetime.now().isoformat(timespec="seconds"),
+        )
+        with self._lock:
+            self._ler_arquivo()
+            self._perfis[perfil.impressao] = perfil
+            self._gravar()
+        logging.info(f"Novo perfil de layout da aba 610: {perfil.impressao}")
+        return perfil
@@ -1,16 +1,40 @@
+import io
+import numpy as np
 import pandas as pd
 import logging
 import time
 import os
-import json
 import requests
-import unicodedata
 import re
 import math
-import shutil
 from datetime import datetime
 from pathlib import Path
 
+try:
+    from .auth import TokenCache
+    from .cache_planilhas import CachePlanilhas
+    from .cliente_sicap import STATUS_FALHA, TIMEOUT_ENVIO, TIMEOUT_LOGIN, ClienteSicap, SicapIndisponivel, conexao_nao_estabelecida
+    from .conversao import converter_cpf, converter_texto, converter_valores, formatar_datas, ler_datas
+    from .documentos import cns_invalidos, cpfs_invalidos, linhas_excel
+    from .mapeamentos import Mapeamentos
+    from .mapping import MappingIndex, normalizar_texto
+    from .metricas import Medicao
+    from .perfis import RegistroPerfis
+    from .reader import ABA_EMPRESA, ABA_PRESTADORES, PlanilhaEmLotes, find_column, ler_planilha
+    from .serializacao import CorpoEmPartes, corpo_envio, json_bytes
+except ImportError:
+    from auth import TokenCache
+    from cache_planilhas import CachePlanilhas
+    from cliente_sicap import STATUS_FALHA, TIMEOUT_ENVIO, TIMEOUT_LOGIN, ClienteSicap, SicapIndisponivel, conexao_nao_estabelecida
+    from conversao import converter_cpf, converter_texto, converter_valores, formatar_datas, ler_datas
+    from documentos import cns_invalidos, cpfs_invalidos, linhas_excel
+    from mapeamentos import Mapeamentos
+    from mapping import MappingIndex, normalizar_texto
+    from metricas import Medicao
+    from perfis import RegistroPerfis
+    from reader import ABA_EMPRESA, ABA_PRESTADORES, PlanilhaEmLotes, find_column, ler_planilha
+    from serializacao import CorpoEmPartes, corpo_envio, json_bytes
+
 # Configuração de logs
 log_dir = "/tmp/sicap_logs" if os.name != 'nt' else os.path.join(os.path.dirname(__file__), 'logs')
 os.makedirs(log_dir, exist_ok=True)
@@ -31,11 +55,12 @@ except Exception:
     logging.info("Logging configurado para Console (StreamHandler)")
 
 # API
-API_BASE_URL = "https://sicap.prefeitura.sp.gov.br/v1"
+# SICAP_API_BASE_URL aponta o backend para outro servidor (ex.: o SICAP falso
+# de benchmarks/sicap_falso.py, em testes de carga)
+API_BASE_URL = os.environ.get("SICAP_API_BASE_URL", "https://sicap.prefeitura.sp.gov.br/v1").rstrip("/")
 LOGIN_ENDPOINT = f"{API_BASE_URL}/Autenticacao/Login"
 FOLHA_PJ_ENDPOINT = f"{API_BASE_URL}/FolhaPagamentoPessoaJuridica"
 
-# Caminho para Mapeamentos
 # Caminho para Mapeamentos
 # Se rodar via 'run.py' na raiz, o BASE_DIR deve ser a própria raiz.
 # Se rodar via 'backend/main.py', sobe um nível.
@@ -44,35 +69,66 @@ if not os.path.exists(os.path.join(BASE_DIR, "Utils")):
     BASE_DIR = os.path.dirname(os.path.abspath(__file__)) # Fallback local
 ARQUIVO_JSON_MAPEAMENTOS = os.path.join(BASE_DIR, "Utils", "mapeamentos.json")
 
+# Campos da aba 610 -> exemplo de cabeçalho usado por find_column
+COLUNAS_610 = {
+    "Nome": "Nome Completo",
+    "NomeSocial": "Nome Social",
+    "CPF": "CPF Funcionário",
+    "DataNascimento": "Data Nascimento",
+    "AutoDeclaracaoGenero": "Autodeclaração de Gênero",
+    "AutoDeclaracaoRacial": "Autodeclaração Racial",
+    "CargoId": "Categoria Profissional",
+    "NumConselhoClasse": "Nº Conselho de Classe",
+    "CnsDoProfissional": "Cns Do Profissional",
+    "CargaHorariaSemanalId": "Carga Horária Semanal/Plantão",
+    "TurnoTrabalho": "Turno de Trabalho",
+    "Unidade": "Unidade",
+    "LinhaServicoId": "Linha de Serviço",
+    "ValorPorProfissional": "Valor por Profissional",
+    "TipoCoordenadoria": "Tipo de Coordenadoria",
+    "TipoAtividade": "Tipo de Atividade"
+}
+
+# Campos da 610 lidos como texto quando o perfil do layout já é conhecido
+# (só nomes e categorias: a conversão de datas, valores e documentos depende
+# do tipo original da célula)
+CAMPOS_TEXTO_610 = (
+    "Nome", "NomeSocial", "AutoDeclaracaoGenero", "AutoDeclaracaoRacial", "CargoId",
+    "CargaHorariaSemanalId", "TurnoTrabalho", "Unidade", "LinhaServicoId",
+    "TipoCoordenadoria", "TipoAtividade",
+)
+
+# Perfis de layout da 610 por impressão digital do cabeçalho
+PERFIS = RegistroPerfis(campos_texto=CAMPOS_TEXTO_610)
+
+# Abas já lidas, por SHA-256 do arquivo (reenvio da mesma planilha)
+CACHE_PLANILHAS = CachePlanilhas()
+
+# Modo em lotes para planilhas grandes (ver processar_em_lotes): a 610 é lida,
+# mapeada e validada aos poucos e o corpo do envio é escrito incrementalmente.
+#   SICAP_STREAMING_MB     arquivos a partir deste tamanho usam o modo em lotes ("0" desliga)
+#   SICAP_STREAMING_LOTE   linhas da 610 por lote
+#   SICAP_STREAMING_BACKEND  leitor usado nesse modo (padrão: o de SICAP_EXCEL_BACKEND).
+#                          O calamine guarda a aba inteira em memória nativa; o
+#                          openpyxl lê em fluxo, com bem menos RSS, porém mais devagar.
+STREAMING_BYTES = int(float(os.environ.get("SICAP_STREAMING_MB", "5")) * 1024 * 1024)
+STREAMING_LOTE = int(os.environ.get("SICAP_STREAMING_LOTE", "5000"))
+STREAMING_BACKEND = os.environ.get("SICAP_STREAMING_BACKEND") or None
+
+# Sugestões ("você quis dizer") para Unidades e Cargos sem mapeamento, por
+# similaridade de trigramas com os nomes de mapeamentos.json
+#   SICAP_SUGESTOES          IDs sugeridos por valor ("0" desliga)
+#   SICAP_SUGESTOES_MINIMO   similaridade mínima, de 0 a 1
+SUGESTOES_K = int(os.environ.get("SICAP_SUGESTOES", "3"))
+SUGESTOES_MINIMO = float(os.environ.get("SICAP_SUGESTOES_MINIMO", "0.3"))
+
+# Instantâneo dos mapeamentos (índice compilado), refeito apenas quando o arquivo muda
+MAPEAMENTOS = Mapeamentos(ARQUIVO_JSON_MAPEAMENTOS)
+
 # ==================================================================================
 # HELPER FUNCTIONS
 # ==================================================================================
 
-def normalizar_texto(texto):
-    if pd.isna(texto):
-        return ""
-    texto = str(texto).strip().upper()
-    texto = unicodedata.normalize("NFKD", texto)
-    texto = "".join(c for c in texto if not unicodedata.combining(c))
-    return texto
-
-def _normalize_col_name(s):
-    return re.sub(r'[^a-z0-9]', '', str(s).lower())
-
-def find_column(df, example):
-    cols_norm = { _normalize_col_name(c): c for c in df.columns }
-    target_norm = _normalize_col_name(example)
-    if target_norm in cols_norm:
-        return cols_norm[target_norm]
-    words = re.findall(r'\w+', target_norm)
-    for norm, orig in cols_norm.items():
-        if all(w in norm for w in words):
-            return orig
-    for norm, orig in cols_norm.items():
-        if 'cns' in norm:
-            return orig
-    return None
-
 def sanitize_filename(s: str) -> str:
     if s is None:
         return ""
@@ -99,80 +155,34 @@ def parse_money(valor):
         return float(valor)
     return float(valor)
 
-def mapear(valor, categoria, mapas):
-    val = normalizar_texto(valor)
-    mapa_categoria = mapas.get(categoria, {})
+def carregar_indice_mapeamentos() -> MappingIndex:
+    # índice do instantâneo atual; quem processa pega uma vez e usa até o fim
+    return MAPEAMENTOS.instantaneo().indice
 
-    if categoria == "LinhaServicoId":
-        extra = mapas.get("LinhasDeServico", {})
-        if extra:
-            merged = dict(mapa_categoria)
-            merged.update(extra)
-            mapa_categoria = merged
+def aquecer():
+    # Inicializador dos workers: importa os leitores de Excel e compila os
+    # mapeamentos antes do primeiro upload.
+    import openpyxl  # noqa: F401
     try:
-        if categoria in ("LinhaServicoId", "Unidade"):
-            if isinstance(valor, (int, float)) and not pd.isna(valor):
-                return int(valor)
-            if isinstance(valor, str) and valor.strip().isdigit():
-                return int(valor.strip())
-    except Exception:
+        import python_calamine  # noqa: F401
+    except ImportError:
         pass
-
-    mapa_normalizado = {normalizar_texto(k): v for k, v in mapa_categoria.items()}
-    if val in mapa_normalizado:
-        return mapa_normalizado[val]
-
-    if categoria == "CargoId":
-        for chave_orig, id_cargo in mapa_categoria.items():
-            chave_norm = normalizar_texto(chave_orig)
-            if chave_norm in val or val in chave_norm:
-                return id_cargo
-
-    if categoria == "Unidade":
-        for chave_orig, id_un in mapa_categoria.items():
-            chave_norm = normalizar_texto(chave_orig)
-            if chave_norm and (chave_norm in val or val in chave_norm):
-                return id_un
-        words_val = set(re.findall(r'\w+', val))
-        for chave_orig, id_un in mapa_categoria.items():
-            chave_norm = normalizar_texto(chave_orig)
-            words_ch = set(re.findall(r'\w+', chave_norm))
-            if words_ch and words_ch.issubset(words_val):
-                return id_un
-
-    return None
-
-def _only_digits(s: str) -> str:
-    return re.sub(r'\D', '', str(s or ''))
-
-def is_valid_cpf(cpf: str) -> bool:
-    s = _only_digits(cpf)
-    if len(s) != 11:
-        return False
-    if s == s[0] * 11:
-        return False
-    def _calc(digs):
-        ssum = sum(int(a) * b for a, b in zip(digs, range(len(digs)+1, 1, -1)))
-        rem = (ssum * 10) % 11
-        return rem if rem < 10 else 0
-    try:
-        d1 = _calc(s[:9])
-        d2 = _calc(s[:9] + str(d1))
-        return int(s[9]) == d1 and int(s[10]) == d2
-    except Exception:
-        return False
+    carregar_indice_mapeamentos()
 
 # ==================================================================================
 # API & LOGIC
 # ==================================================================================
 
+# Conexões com o SICAP: timeouts, repetições e circuit breaker
+SICAP = ClienteSicap()
+
 def fazer_login(usuario, senha):
     logging.info(f"Fazendo login na API SICAP para usuario: {usuario}")
     payload = {"login": usuario, "senha": senha}
     headers = {"Content-Type": "application/json"}
     
     try:
-        r = requests.post(LOGIN_ENDPOINT, json=payload, headers=headers, timeout=30)
+        r = SICAP.post(LOGIN_ENDPOINT, TIMEOUT_LOGIN, json=payload, headers=headers)
         r.raise_for_status()
         data = r.json()
         token = data.get("token") or data.get("Token") or data.get("access_token") or data.get("accessToken")
@@ -180,6 +190,12 @@ def fazer_login(usuario, senha):
             raise ValueError("Token não encontrado na resposta da API")
         logging.info("Login realizado com sucesso!")
         return token
+    except SicapIndisponivel:
+        raise
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        # SICAP fora do ar não é credencial errada: quem chama pode tentar de novo
+        logging.error(f"Erro de conexão no login: {e}")
+        raise ConnectionError(f"Erro na conexão com SICAP: {str(e)}")
     except Exception as e:
         logging.error(f"Erro no login: {e}")
         if 'r' in locals() and r:
@@ -187,251 +203,664 @@ def fazer_login(usuario, senha):
         raise ValueError(f"Falha na autenticação: {str(e)}")
 
 def enviar_folha_pj(token, payload):
+    # `payload` pode vir já serializado (bytes), como em enviar_com_token
     logging.info("Enviando folha de pagamento para SICAP...")
-    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+    corpo, extras = corpo_envio(payload)
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}", **extras}
     
     try:
-        r = requests.post(FOLHA_PJ_ENDPOINT, json=payload, headers=headers, timeout=120)
+        # POST não idempotente: só repete se o pedido comprovadamente não chegou
+        r = SICAP.post(FOLHA_PJ_ENDPOINT, TIMEOUT_ENVIO, idempotente=False, data=corpo, headers=headers)
         return r
     except Exception as e:
-        logging.error(f"Erro ao enviar folha: {e}")
-        raise ConnectionError(f"Erro na conexão com SICAP: {str(e)}")
+        # mantém o tipo original: erro_interno distingue "não conectou" (pode
+        # tentar de novo) de "enviado sem resposta" (pode já estar no SICAP)
+        if not isinstance(e, SicapIndisponivel):
+            logging.error(f"Erro ao enviar folha: {e}")
+        raise
 
-def processar_planilha(caminho_arquivo: str, usuario: str, senha: str, mes: str = None, ano: str = None, prestacao_id: any = None) -> dict:
-    start_time = time.time()
-    try:
-        logging.info(f"Iniciando processamento do arquivo: {caminho_arquivo}")
-        logging.info(f"Parâmetros recebidos: Mes={mes}, Ano={ano}")
-
-        if not os.path.exists(ARQUIVO_JSON_MAPEAMENTOS):
-             logging.error(f"Arquivo de mapeamentos não encontrado em: {ARQUIVO_JSON_MAPEAMENTOS}")
-             return {
-                 "status": "erro",
-                 "mensagem": "Arquivo Utils/mapeamentos.json não encontrado no servidor. Contate o suporte.",
-                 "detalhes": {"caminho_esperado": ARQUIVO_JSON_MAPEAMENTOS}
-             }
-
-        with open(ARQUIVO_JSON_MAPEAMENTOS, "r", encoding="utf-8") as f:
-            MAPAS = json.load(f)
-            
-        # Determinação do mês de referência
-        mes_ref = None
-        if mes:
-            mes_ref = mes.lower() # garantir lowercase (jan, fev...)
-        else:
-            # Fallback para detecção automática (legado)
-            m = re.search(r"\(([A-Za-z]{3})[\.)]", os.path.basename(caminho_arquivo))
-            if m:
-                mes_ref = m.group(1).lower()
-                logging.info(f"Mês detectado via nome do arquivo: {mes_ref}")
-        
-        if not prestacao_id:
-             return {
-                 "status": "erro",
-                 "mensagem": "O ID da Prestação de Contas é obrigatório.",
-                 "detalhes": {"acao": "Informe o ID da competência obtido no portal SICAP."}
-             }
-        
-        logging.info(f"Usando PrestacaoContaId: {prestacao_id}")
-
-        # Abas Fixas
-        ABA_EMPRESA = "600"
-        ABA_PRESTADORES = "610"
+# Colunas de Prestadores cujo NaN/inf vira 0; ValorPorProfissional vira 0.0
+# e as demais viram ""
+COLUNAS_NUM = [
+    "AutoDeclaracaoGenero", "AutoDeclaracaoRacial", "CargoId",
+    "CargaHorariaSemanalId", "TurnoTrabalho", "UnidadeId",
+    "LinhaServicoId", "TipoCoordenadoria", "TipoAtividade"
+]
 
-        try:
-            df_emp = pd.read_excel(caminho_arquivo, sheet_name=ABA_EMPRESA)
-            df = pd.read_excel(caminho_arquivo, sheet_name=ABA_PRESTADORES)
-        except Exception as e:
-            return {
-                 "status": "erro",
-                 "mensagem": f"Erro ao ler abas da planilha ({ABA_EMPRESA}, {ABA_PRESTADORES}). Verifique o formato.",
-                 "detalhes": {"erro_tecnico": str(e)}
-            }
-        
-        # Montar Empresa
-        try:
-            empresa = {
-                "Id": 4623,
-                "ParceriaId": 31,
-                "PrestacaoContaId": prestacao_id,
-                "RazaoSocialEmpresa": df_emp.loc[0, "Razao Social Empresa"],
-                "CnpjEmpresa": df_emp.loc[0, "CNPJ Empresa"],
-                "ValorBrutoNf": parse_money(df_emp.loc[0, "Valor Bruto NF"]),
-                "NumNotaFiscal": str(int(float(df_emp.loc[0, "Nº Nota Fiscal"]))),
-                "ValorLiquido": parse_money(df_emp.loc[0, "Valor Liquido"])
-            }
-        except Exception as e:
-            return {
-                "status": "erro",
-                "mensagem": "Erro ao ler dados da aba Empresa (600). Verifique colunas e valores.",
-                "detalhes": {"erro": str(e)}
+def _nao_finitos(serie):
+    if pd.api.types.is_float_dtype(serie.dtype):
+        return ~np.isfinite(serie.to_numpy(dtype=float, na_value=np.nan))
+    if isinstance(serie.dtype, pd.StringDtype) and serie.dtype.na_value is np.nan:
+        # dtype "str": célula vazia continua NaN depois do astype(str)
+        return serie.isna().to_numpy()
+    if serie.dtype == object:
+        return serie.map(lambda v: isinstance(v, float) and not math.isfinite(v)).to_numpy(dtype=bool)
+    return None
+
+def registros_prestadores(saida: pd.DataFrame) -> list:
+    # NaN/inf são trocados coluna a coluna antes de gerar os dicts; os dicts
+    # saem de listas por coluna, bem mais barato que to_dict(orient="records")
+    chaves = list(saida.columns)
+    colunas = []
+    for col in chaves:
+        serie = saida[col]
+        invalidos = _nao_finitos(serie)
+        if invalidos is not None and invalidos.any():
+            if col == "ValorPorProfissional":
+                padrao = 0.0
+            elif col in COLUNAS_NUM:
+                padrao = 0
+            else:
+                padrao = ""
+            serie = serie.astype(object).where(~invalidos, padrao)
+        colunas.append(serie.tolist())
+    return [dict(zip(chaves, valores)) for valores in zip(*colunas)]
+
+def relatorio_linhas(verificacoes, index) -> list:
+    # `verificacoes`: (campo, problema, máscara por linha, valores originais)
+    linhas = []
+    for campo, problema, mascara, valores in verificacoes:
+        mascara = np.asarray(mascara, dtype=bool)
+        originais = np.asarray(valores, dtype=object)[mascara]
+        for linha, valor in zip(linhas_excel(mascara, index), originais):
+            linhas.append({
+                "linha": linha,
+                "campo": campo,
+                "valor": "" if pd.isna(valor) else str(valor),
+                "problema": problema,
+            })
+    linhas.sort(key=lambda l: l["linha"])
+    return linhas
+
+class ValidacaoPrestadores:
+    """Problemas de validação da 610, somados lote a lote.
+
+    `montar_payload` passa a aba inteira como um lote só; `processar_em_lotes`
+    soma todos. As mensagens e as linhas do Excel saem iguais nos dois casos.
+    Com `indice`, os erros trazem sugestões de ID para Unidades e Cargos sem
+    mapeamento.
+    """
+
+    def __init__(self, indice: MappingIndex = None):
+        self.indice = indice
+        self.unidades_sem_mapa = set()
+        self.cargos_sem_mapa = set()
+        self.cargo_sem_mapa = False
+        self.linha_sem_mapa = False
+        self.linhas_cpf = []
+        self.linhas_cns = []
+
+    def adicionar(self, saida: pd.DataFrame, unicos: dict):
+        # devolve as máscaras de CPF/CNS inválidos do lote (relatório por linha)
+        def _sem_mapa(destino):
+            valores_unicos, ids_unicos = unicos[destino]
+            return [v for v, id_ in zip(valores_unicos, ids_unicos) if id_ == 0]
+
+        self.unidades_sem_mapa.update("" if pd.isna(u) else str(u).strip() for u in _sem_mapa("UnidadeId"))
+        cargos = _sem_mapa("CargoId")
+        self.cargos_sem_mapa.update("" if pd.isna(c) else str(c).strip() for c in cargos)
+        self.cargo_sem_mapa = self.cargo_sem_mapa or bool(cargos)
+        self.linha_sem_mapa = self.linha_sem_mapa or bool(_sem_mapa("LinhaServicoId"))
+        cpf_invalido = cpfs_invalidos(saida["CPF"])
+        self.linhas_cpf += linhas_excel(cpf_invalido, saida.index)
+        cns_invalido = cns_invalidos(saida["CnsDoProfissional"])
+        self.linhas_cns += linhas_excel(cns_invalido, saida.index)
+        return cpf_invalido, cns_invalido
+
+    @staticmethod
+    def _nomes(valores) -> list:
+        return [v for v in sorted(valores) if v != "" and v.upper() != "NAN"]
+
+    def unidades(self) -> list:
+        return self._nomes(self.unidades_sem_mapa)
+
+    def sugestoes(self) -> dict:
+        # {"Unidade": {valor: [{"id", "nome", "similaridade"}]}, "CargoId": {...}}
+        if self.indice is None or SUGESTOES_K <= 0:
+            return {}
+        sugestoes = {}
+        for categoria, valores in (("Unidade", self.unidades_sem_mapa), ("CargoId", self.cargos_sem_mapa)):
+            por_valor = {
+                valor: self.indice.sugerir(valor, categoria, SUGESTOES_K, SUGESTOES_MINIMO)
+                for valor in self._nomes(valores)[:50]
             }
-            
-        # Mapeamento e Validação (Mantém lógica anterior)
-        expected = {
-            "Nome": "Nome Completo",
-            "NomeSocial": "Nome Social",
-            "CPF": "CPF Funcionário",
-            "DataNascimento": "Data Nascimento",
-            "AutoDeclaracaoGenero": "Autodeclaração de Gênero",
-            "AutoDeclaracaoRacial": "Autodeclaração Racial",
-            "CargoId": "Categoria Profissional",
-            "NumConselhoClasse": "Nº Conselho de Classe",
-            "CnsDoProfissional": "Cns Do Profissional",
-            "CargaHorariaSemanalId": "Carga Horária Semanal/Plantão",
-            "TurnoTrabalho": "Turno de Trabalho",
-            "Unidade": "Unidade",
-            "LinhaServicoId": "Linha de Serviço",
-            "ValorPorProfissional": "Valor por Profissional",
-            "TipoCoordenadoria": "Tipo de Coordenadoria",
-            "TipoAtividade": "Tipo de Atividade"
-        }
-        
-        cols = {}
-        missing_cols = []
-        for key, example in expected.items():
-            col = find_column(df, example)
-            if not col:
-                missing_cols.append(f"{key} (ex: {example})")
-            cols[key] = col
-        
-        if missing_cols:
-             return {
-                 "status": "erro",
-                 "mensagem": "Colunas obrigatórias não encontradas na aba 610.",
-                 "detalhes": {"colunas_faltantes": missing_cols}
-             }
-
-        const_tipo_coordenadoria = mapear("SEMPRE", "TipoCoordenadoria", MAPAS) or 0
-        const_tipo_atividade = mapear("SEMPRE", "TipoAtividade", MAPAS) or 0
-
-        saida = pd.DataFrame({
-            "Id": 0,
-            "Nome": df[cols["Nome"]].astype(str).str.strip(),
-            "NomeSocial": df[cols["NomeSocial"]].astype(str).str.strip(),
-            "CPF": df[cols["CPF"]].astype(str).str.replace(r'\D', '', regex=True).str.zfill(11),
-            "DataNascimento": pd.to_datetime(df[cols["DataNascimento"]], errors="coerce", dayfirst=True).apply(lambda x: x.strftime("%Y-%m-%dT00:00:00") if pd.notna(x) else "1900-01-01T00:00:00"),
-            "AutoDeclaracaoGenero": df[cols["AutoDeclaracaoGenero"]].apply(lambda x: mapear(x, "AutoDeclaracaoGenero", MAPAS)),
-            "AutoDeclaracaoRacial": df[cols["AutoDeclaracaoRacial"]].apply(lambda x: mapear(x, "AutoDeclaracaoRacial", MAPAS)),
-            "CargoId": df[cols["CargoId"]].apply(lambda x: mapear(x, "CargoId", MAPAS)),
-            "NumConselhoClasse": df[cols["NumConselhoClasse"]].astype(str).str.strip(),
-            "CnsDoProfissional": df[cols["CnsDoProfissional"]].astype(str).str.strip(),
-            "CargaHorariaSemanalId": df[cols["CargaHorariaSemanalId"]].apply(lambda x: mapear(x, "CargaHorariaSemanalId", MAPAS)),
-            "TurnoTrabalho": df[cols["TurnoTrabalho"]].apply(lambda x: mapear(x, "TurnoTrabalho", MAPAS)),
-            "UnidadeId": df[cols["Unidade"]].apply(lambda x: mapear(x, "Unidade", MAPAS)),
-            "LinhaServicoId": df[cols["LinhaServicoId"]].apply(lambda x: mapear(x, "LinhaServicoId", MAPAS)),
-            "ValorPorProfissional": df[cols["ValorPorProfissional"]].apply(parse_money),
-            "TipoCoordenadoria": [const_tipo_coordenadoria] * len(df),
-            "TipoAtividade": [const_tipo_atividade] * len(df),
-            "Especificacao": ""
-        })
-
-        colunas_num = [
-            "AutoDeclaracaoGenero", "AutoDeclaracaoRacial", "CargoId",
-            "CargaHorariaSemanalId", "TurnoTrabalho", "UnidadeId",
-            "LinhaServicoId", "TipoCoordenadoria", "TipoAtividade"
-        ]
-        for col in colunas_num:
-            saida[col] = pd.to_numeric(saida[col], errors="coerce").fillna(0).astype(int)
-            
-        orig_unidades = df[cols["Unidade"]].astype(str).fillna("").str.strip()
-        unmapped = sorted(set(orig_unidades[saida["UnidadeId"] == 0].unique()))
-        unmapped = [u for u in unmapped if u != "" and u.upper() != "NAN"]
-        
+            if por_valor:
+                sugestoes[categoria] = por_valor
+        return sugestoes
+
+    def problemas(self):
+        # mensagens + linhas exatas do Excel; a mensagem mostra só as 20 primeiras
+        problemas, linhas_invalidas = [], {}
+        if self.unidades():
+            problemas.append("Existem Unidades sem mapeamento (UnidadeId = 0).")
+        if self.cargo_sem_mapa:
+            problemas.append("Existem COLABORADORES com Cargo não mapeado (CargoId=0).")
+        if self.linha_sem_mapa:
+            problemas.append("Existem COLABORADORES com Linha de Serviço não mapeada (LinhaServicoId=0).")
+        if self.linhas_cpf:
+            problemas.append(f"CPFs inválidos detectados: {', '.join(f'Linha {l}' for l in self.linhas_cpf[:20])}...")
+            linhas_invalidas["linhas_cpf_invalido"] = self.linhas_cpf
+        if self.linhas_cns:
+            problemas.append(f"CNS inválidos detectados: {', '.join(f'Linha {l}' for l in self.linhas_cns[:20])}...")
+            linhas_invalidas["linhas_cns_invalido"] = self.linhas_cns
+        return problemas, linhas_invalidas
+
+    def valida(self) -> bool:
+        return not (self.unidades() or self.cargo_sem_mapa or self.linha_sem_mapa or self.linhas_cpf or self.linhas_cns)
+
+    def erro(self):
+        # resposta de erro do envio (para no primeiro grupo), ou None
+        unmapped = self.unidades()
         if unmapped:
+            detalhes = {"unidades_sem_mapa": unmapped[:50]}
+            sugestoes = self.sugestoes().get("Unidade")
+            if sugestoes:
+                detalhes["sugestoes"] = {"Unidade": sugestoes}
             return {
                 "status": "erro",
                 "mensagem": "Existem Unidades sem mapeamento (UnidadeId = 0).",
-                "detalhes": {"unidades_sem_mapa": unmapped[:50]}
+                "detalhes": detalhes
             }
-            
-        problemas = []
-        
-        mask_cargo0 = saida['CargoId'] == 0
-        if mask_cargo0.any():
-            problemas.append("Existem COLABORADORES com Cargo não mapeado (CargoId=0).")
-            
-        mask_linha0 = saida['LinhaServicoId'] == 0
-        if mask_linha0.any():
-            problemas.append("Existem COLABORADORES com Linha de Serviço não mapeada (LinhaServicoId=0).")
-            
-        mask_cpf_inv = []
-        cpf_series = saida['CPF'].astype(str).fillna("")
-        for i, raw in cpf_series.items():
-            if not is_valid_cpf(raw):
-                mask_cpf_inv.append(f"Linha {i+2}")
-        
-        if mask_cpf_inv:
-            problemas.append(f"CPFs inválidos detectados: {', '.join(mask_cpf_inv[:20])}...")
-            
+        problemas, linhas_invalidas = self.problemas()
         if problemas:
+            detalhes = {"problemas": problemas, **linhas_invalidas}
+            sugestoes = self.sugestoes()
+            if sugestoes:
+                detalhes["sugestoes"] = sugestoes
             return {
                 "status": "erro",
                 "mensagem": "Erros de validação pré-envio detectados.",
-                "detalhes": {"problemas": problemas}
+                "detalhes": detalhes
             }
-            
-        prestadores_lista = saida.to_dict(orient="records")
-        for prestador in prestadores_lista:
-            for key, value in list(prestador.items()):
-                if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
-                    if key in ["ValorPorProfissional"]:
-                        prestador[key] = 0.0
-                    elif key in colunas_num:
-                        prestador[key] = 0
-                    else:
-                        prestador[key] = ""
-
-        payload = {**empresa, "Prestadores": prestadores_lista}
-        for key, value in list(payload.items()):
-            if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
-                if key in ["ValorBrutoNf", "ValorLiquido"]:
-                    payload[key] = 0.0
-                else:
-                    payload[key] = ""
-                    
-        payload["SourceArquivo"] = os.path.basename(caminho_arquivo)
-        
-        token = fazer_login(usuario, senha)
-        r = enviar_folha_pj(token, payload)
-        
-        elapsed_time = time.time() - start_time
-        
-        result_json = None
+        return None
+
+# Colunas de Prestadores com ID mapeado -> categoria em mapeamentos.json
+COLUNAS_CATEGORICAS = {
+    "AutoDeclaracaoGenero": "AutoDeclaracaoGenero",
+    "AutoDeclaracaoRacial": "AutoDeclaracaoRacial",
+    "CargoId": "CargoId",
+    "CargaHorariaSemanalId": "CargaHorariaSemanalId",
+    "TurnoTrabalho": "TurnoTrabalho",
+    "UnidadeId": "Unidade",
+    "LinhaServicoId": "LinhaServicoId",
+}
+
+def mapear_categorias(df: pd.DataFrame, cols: dict, indice: MappingIndex):
+    # Mapeia apenas os valores distintos de cada coluna categórica e
+    # replica os IDs; os únicos alimentam os relatórios de não mapeados.
+    mapeados = {}
+    unicos = {}
+    for destino, categoria in COLUNAS_CATEGORICAS.items():
+        ids, valores_unicos, ids_unicos = indice.mapear_coluna(df[cols[categoria]], categoria)
+        mapeados[destino] = ids
+        unicos[destino] = (valores_unicos, ids_unicos)
+    return mapeados, unicos
+
+def converter_colunas(df: pd.DataFrame, cols: dict) -> dict:
+    # Colunas de texto, documento, data e valor já no formato do SICAP
+    return {
+        "Nome": converter_texto(df[cols["Nome"]]),
+        "NomeSocial": converter_texto(df[cols["NomeSocial"]]),
+        "CPF": converter_cpf(df[cols["CPF"]]),
+        "DataNascimento": formatar_datas(ler_datas(df[cols["DataNascimento"]]), df.index),
+        "NumConselhoClasse": converter_texto(df[cols["NumConselhoClasse"]]),
+        "CnsDoProfissional": converter_texto(df[cols["CnsDoProfissional"]]),
+        "ValorPorProfissional": converter_valores(df[cols["ValorPorProfissional"]]),
+    }
+
+def montar_saida(df: pd.DataFrame, convertidas: dict, mapeados: dict, indice: MappingIndex) -> pd.DataFrame:
+    # DataFrame de Prestadores, na ordem de campos que o SICAP espera
+    const_tipo_coordenadoria = indice.mapear("SEMPRE", "TipoCoordenadoria") or 0
+    const_tipo_atividade = indice.mapear("SEMPRE", "TipoAtividade") or 0
+
+    saida = pd.DataFrame({
+        "Id": 0,
+        "Nome": convertidas["Nome"],
+        "NomeSocial": convertidas["NomeSocial"],
+        "CPF": convertidas["CPF"],
+        "DataNascimento": convertidas["DataNascimento"],
+        "AutoDeclaracaoGenero": mapeados["AutoDeclaracaoGenero"],
+        "AutoDeclaracaoRacial": mapeados["AutoDeclaracaoRacial"],
+        "CargoId": mapeados["CargoId"],
+        "NumConselhoClasse": convertidas["NumConselhoClasse"],
+        "CnsDoProfissional": convertidas["CnsDoProfissional"],
+        "CargaHorariaSemanalId": mapeados["CargaHorariaSemanalId"],
+        "TurnoTrabalho": mapeados["TurnoTrabalho"],
+        "UnidadeId": mapeados["UnidadeId"],
+        "LinhaServicoId": mapeados["LinhaServicoId"],
+        "ValorPorProfissional": convertidas["ValorPorProfissional"],
+        "TipoCoordenadoria": [const_tipo_coordenadoria] * len(df),
+        "TipoAtividade": [const_tipo_atividade] * len(df),
+        "Especificacao": ""
+    }, index=df.index)
+
+    for col in ("TipoCoordenadoria", "TipoAtividade"):
+        saida[col] = pd.to_numeric(saida[col], errors="coerce").fillna(0).astype(int)
+    return saida
+
+def _etapa(progresso, etapa: str):
+    if progresso is not None:
         try:
-            result_json = r.json()
-        except:
-             pass
-             
-        if r.status_code >= 400:
-            logging.error(f"Erro API {r.status_code}: {r.text}")
-            return {
-                "status": "erro",
-                "mensagem": f"Erro retornado pela API SICAP (Status {r.status_code})",
-                "detalhes": {
-                    "resposta_api": result_json if result_json else r.text,
-                    "nota_fiscal": payload.get("NumNotaFiscal")
-                }
-            }
-            
-        logging.info(f"Sucesso! NF: {payload.get('NumNotaFiscal')}")
-        return {
-            "status": "sucesso",
-            "mensagem": f"Folha enviada com sucesso! NF: {payload.get('NumNotaFiscal')}",
+            progresso(etapa)
+        except Exception as e:
+            logging.warning(f"Falha ao registrar progresso ({etapa}): {e}")
+
+def _cancelado(cancelado) -> bool:
+    return cancelado is not None and cancelado.is_set()
+
+def _resposta_cancelado(etapa: str) -> dict:
+    logging.warning(f"Processamento cancelado antes da etapa: {etapa}")
+    return {
+        "status": "erro",
+        "mensagem": "Processamento cancelado: o cliente desconectou antes do envio.",
+        "detalhes": {"etapa": etapa}
+    }
+
+# Tokens do SICAP reaproveitados entre uploads do mesmo usuário
+TOKENS = TokenCache(lambda usuario, senha: fazer_login(usuario, senha))
+
+def enviar_com_token(usuario, senha, payload):
+    # serializa uma vez só, mesmo se precisar reenviar
+    payload = json_bytes(payload) if isinstance(payload, dict) else payload
+    token = TOKENS.obter(usuario, senha)
+    r = enviar_folha_pj(token, payload)
+    if r.status_code == 401:
+        # token expirado/revogado antes do previsto: renova e tenta uma vez
+        logging.warning("SICAP respondeu 401; renovando token e reenviando.")
+        TOKENS.invalidar(usuario, senha, token)
+        token = TOKENS.obter(usuario, senha)
+        r = enviar_folha_pj(token, payload)
+    return r
+
+def _verificar_entrada(prestacao_id):
+    # erro de configuração/parâmetro que impede qualquer processamento, ou None
+    if not os.path.exists(ARQUIVO_JSON_MAPEAMENTOS):
+         logging.error(f"Arquivo de mapeamentos não encontrado em: {ARQUIVO_JSON_MAPEAMENTOS}")
+         return {
+             "status": "erro",
+             "mensagem": "Arquivo Utils/mapeamentos.json não encontrado no servidor. Contate o suporte.",
+             "detalhes": {"caminho_esperado": ARQUIVO_JSON_MAPEAMENTOS}
+         }
+    if not prestacao_id:
+         return {
+             "status": "erro",
+             "mensagem": "O ID da Prestação de Contas é obrigatório.",
+             "detalhes": {"acao": "Informe o ID da competência obtido no portal SICAP."}
+         }
+    return None
+
+def _erro_leitura(e: Exception) -> dict:
+    return {
+         "status": "erro",
+         "mensagem": f"Erro ao ler abas da planilha ({ABA_EMPRESA}, {ABA_PRESTADORES}). Verifique o formato.",
+         "detalhes": {"erro_tecnico": str(e)}
+    }
+
+def montar_empresa(df_emp: pd.DataFrame, prestacao_id) -> dict:
+    # Campos da Empresa (aba 600) no topo do payload; NaN/inf viram 0.0 nos
+    # valores e "" nos demais. Levanta exceção se a aba não tiver os campos.
+    empresa = {
+        "Id": 4623,
+        "ParceriaId": 31,
+        "PrestacaoContaId": prestacao_id,
+        "RazaoSocialEmpresa": df_emp.loc[0, "Razao Social Empresa"],
+        "CnpjEmpresa": df_emp.loc[0, "CNPJ Empresa"],
+        "ValorBrutoNf": parse_money(df_emp.loc[0, "Valor Bruto NF"]),
+        "NumNotaFiscal": str(int(float(df_emp.loc[0, "Nº Nota Fiscal"]))),
+        "ValorLiquido": parse_money(df_emp.loc[0, "Valor Liquido"])
+    }
+    for key, value in list(empresa.items()):
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            if key in ["ValorBrutoNf", "ValorLiquido"]:
+                empresa[key] = 0.0
+            else:
+                empresa[key] = ""
+    return empresa
+
+def _erro_empresa(e: Exception) -> dict:
+    return {
+        "status": "erro",
+        "mensagem": "Erro ao ler dados da aba Empresa (600). Verifique colunas e valores.",
+        "detalhes": {"erro": str(e)}
+    }
+
+def _erro_colunas(cols: dict):
+    missing_cols = [f"{key} (ex: {example})" for key, example in COLUNAS_610.items() if not cols[key]]
+    if missing_cols:
+         return {
+             "status": "erro",
+             "mensagem": "Colunas obrigatórias não encontradas na aba 610.",
+             "detalhes": {"colunas_faltantes": missing_cols}
+         }
+    return None
+
+def montar_payload(caminho_arquivo, mes: str = None, ano: str = None, prestacao_id: any = None, cancelado=None, progresso=None, nome_arquivo: str = None, completo: bool = False, sha256: str = None) -> dict:
+    # Etapas de leitura, mapeamento e validação; não fala com o SICAP.
+    # Retorna {"status": "valido", "payload": ...} ou o dict de erro.
+    # Com `completo` (validação sem envio), não para no primeiro grupo de erros:
+    # devolve o relatório por linha em `detalhes["linhas"]` e o payload montado.
+    # `caminho_arquivo` também pode ser o conteúdo (bytes) ou um arquivo aberto;
+    # nesse caso `nome_arquivo` traz o nome original do upload e `sha256`, o
+    # hash já calculado na recepção (chave do cache de planilhas).
+    if isinstance(caminho_arquivo, (bytes, bytearray)):
+        caminho_arquivo = io.BytesIO(caminho_arquivo)
+    nome_arquivo = nome_arquivo or os.path.basename(caminho_arquivo)
+    logging.info(f"Iniciando processamento do arquivo: {nome_arquivo}")
+    logging.info(f"Parâmetros recebidos: Mes={mes}, Ano={ano}")
+
+    erro = _verificar_entrada(prestacao_id)
+    if erro:
+        return erro
+
+    indice = carregar_indice_mapeamentos()
+
+    # Determinação do mês de referência
+    mes_ref = None
+    if mes:
+        mes_ref = mes.lower() # garantir lowercase (jan, fev...)
+    else:
+        # Fallback para detecção automática (legado)
+        m = re.search(r"\(([A-Za-z]{3})[\.)]", nome_arquivo)
+        if m:
+            mes_ref = m.group(1).lower()
+            logging.info(f"Mês detectado via nome do arquivo: {mes_ref}")
+
+    logging.info(f"Usando PrestacaoContaId: {prestacao_id}")
+
+    # Abas 600 e 610 lidas numa única abertura do arquivo
+    _etapa(progresso, "leitura")
+    try:
+        planilha = CACHE_PLANILHAS.ler(caminho_arquivo, COLUNAS_610, sha256=sha256, perfis=PERFIS)
+        df_emp = planilha.empresa
+        df = planilha.prestadores
+    except Exception as e:
+        return _erro_leitura(e)
+
+    if _cancelado(cancelado):
+        return _resposta_cancelado("mapeamento")
+    _etapa(progresso, "mapeamento")
+
+    # Montar Empresa
+    try:
+        empresa = montar_empresa(df_emp, prestacao_id)
+    except Exception as e:
+        return _erro_empresa(e)
+
+    # Mapeamento e Validação (Mantém lógica anterior)
+
+    cols = planilha.colunas
+    erro = _erro_colunas(cols)
+    if erro:
+        return erro
+
+    mapeados, unicos = mapear_categorias(df, cols, indice)
+    convertidas = converter_colunas(df, cols)
+    saida = montar_saida(df, convertidas, mapeados, indice)
+
+    _etapa(progresso, "validacao")
+    validacao = ValidacaoPrestadores(indice)
+    cpf_invalido, cns_invalido = validacao.adicionar(saida, unicos)
+    if not completo:
+        erro = validacao.erro()
+        if erro:
+            return erro
+    unmapped = validacao.unidades()
+    problemas, linhas_invalidas = validacao.problemas()
+
+    prestadores_lista = registros_prestadores(saida)
+
+    payload = {**empresa, "Prestadores": prestadores_lista}
+    payload["SourceArquivo"] = nome_arquivo
+
+    if not completo:
+        return {"status": "valido", "payload": payload}
+
+    unidade = df[cols["Unidade"]]
+    unidade_texto = unidade.astype(str).str.strip()
+    unidade_preenchida = unidade.notna() & (unidade_texto != "") & (unidade_texto.str.upper() != "NAN")
+    linhas = relatorio_linhas([
+        ("Unidade", "Unidade sem mapeamento", (mapeados["UnidadeId"] == 0) & unidade_preenchida.to_numpy(), unidade),
+        ("CargoId", "Cargo não mapeado", mapeados["CargoId"] == 0, df[cols["CargoId"]]),
+        ("LinhaServicoId", "Linha de Serviço não mapeada", mapeados["LinhaServicoId"] == 0, df[cols["LinhaServicoId"]]),
+        ("CPF", "CPF inválido", cpf_invalido, df[cols["CPF"]]),
+        ("CnsDoProfissional", "CNS inválido", cns_invalido, df[cols["CnsDoProfissional"]]),
+    ], saida.index)
+    detalhes = {"prestadores": len(prestadores_lista), "problemas": problemas, "linhas": linhas}
+    if unmapped:
+        detalhes["unidades_sem_mapa"] = unmapped[:50]
+    sugestoes = validacao.sugestoes()
+    if sugestoes:
+        detalhes["sugestoes"] = sugestoes
+    return {
+        "status": "erro" if problemas else "valido",
+        "mensagem": "Erros de validação pré-envio detectados." if problemas else "Planilha válida, pronta para envio.",
+        "detalhes": {**detalhes, **linhas_invalidas},
+        "payload": payload,
+    }
+
+# Resposta ambígua ao envio da folha (POST não idempotente): reenviar às cegas
+# pode duplicar a folha
+AVISO_ENVIO_INCERTO = "A folha pode ter sido recebida: confira no SICAP antes de reenviar."
+
+def interpretar_resposta(r, payload: dict, start_time: float, prestadores: int = None) -> dict:
+    # `prestadores`: quantos foram enviados, quando o payload não traz a lista (modo em lotes)
+    elapsed_time = time.time() - start_time
+
+    result_json = None
+    try:
+        result_json = r.json()
+    except:
+         pass
+
+    if r.status_code >= 400:
+        logging.error(f"Erro API {r.status_code}: {r.text}")
+        resultado = {
+            "status": "erro",
+            "mensagem": f"Erro retornado pela API SICAP (Status {r.status_code})",
             "detalhes": {
-                "prestadores_enviados": len(prestadores_lista),
-                "resposta_sucesso": result_json,
-                "tempo": f"{elapsed_time:.2f}s"
+                "resposta_api": result_json if result_json else r.text,
+                "nota_fiscal": payload.get("NumNotaFiscal")
             }
         }
+        if r.status_code in STATUS_FALHA:
+            # falha do servidor depois de receber a folha: pode ter gravado parte ou tudo
+            resultado["mensagem"] += f". {AVISO_ENVIO_INCERTO}"
+            resultado["detalhes"]["pedido_enviado"] = True
+        return resultado
 
-    except Exception as e:
-        logging.error(f"Exceção não tratada: {str(e)}")
+    logging.info(f"Sucesso! NF: {payload.get('NumNotaFiscal')}")
+    return {
+        "status": "sucesso",
+        "mensagem": f"Folha enviada com sucesso! NF: {payload.get('NumNotaFiscal')}",
+        "detalhes": {
+            "prestadores_enviados": len(payload.get("Prestadores", [])) if prestadores is None else prestadores,
+            "resposta_sucesso": result_json,
+            "tempo": f"{elapsed_time:.2f}s"
+        }
+    }
+
+def erro_interno(e: Exception) -> dict:
+    # detalhes["pedido_enviado"]: False quando a folha certamente não chegou
+    # ao SICAP (pode tentar de novo), True quando pode ter chegado
+    if isinstance(e, SicapIndisponivel):
+        logging.warning(str(e))
         return {
             "status": "erro",
-            "mensagem": f"Erro interno: {str(e)}",
-            "detalhes": {
-                "tipo_erro": type(e).__name__,
-                "log": log_file
+            "mensagem": str(e),
+            "detalhes": {"tipo_erro": type(e).__name__, "pedido_enviado": False}
+        }
+    if isinstance(e, requests.exceptions.RequestException):
+        # só enviar_folha_pj deixa passar erros do requests
+        if conexao_nao_estabelecida(e):
+            logging.warning(f"Sem conexão com o SICAP: {e}")
+            return {
+                "status": "erro",
+                "mensagem": f"Não foi possível conectar ao SICAP; a folha não foi enviada. ({type(e).__name__})",
+                "detalhes": {"tipo_erro": type(e).__name__, "pedido_enviado": False, "erro_tecnico": str(e)}
             }
+        logging.error(f"Envio da folha sem resposta do SICAP: {e}")
+        return {
+            "status": "erro",
+            "mensagem": f"O SICAP não respondeu ao envio da folha ({type(e).__name__}). {AVISO_ENVIO_INCERTO}",
+            "detalhes": {"tipo_erro": type(e).__name__, "pedido_enviado": True, "erro_tecnico": str(e)}
+        }
+    if isinstance(e, ConnectionError):
+        # fazer_login: SICAP fora do ar antes do envio da folha
+        logging.warning(str(e))
+        return {
+            "status": "erro",
+            "mensagem": str(e),
+            "detalhes": {"tipo_erro": type(e).__name__, "pedido_enviado": False}
+        }
+    logging.error(f"Exceção não tratada: {str(e)}")
+    return {
+        "status": "erro",
+        "mensagem": f"Erro interno: {str(e)}",
+        "detalhes": {
+            "tipo_erro": type(e).__name__,
+            "log": log_file
         }
+    }
+
+def com_metricas(resultado: dict, medicao: Medicao, tipo_erro: str = None) -> dict:
+    # tempos por etapa, linhas e bytes vão junto do resultado, inclusive nos erros;
+    # a API os agrega em /metrics (ver metricas.registrar_resultado)
+    if resultado.get("status") == "sucesso":
+        tipo_erro = None
+    resultado.setdefault("detalhes", {})["metricas"] = medicao.resumo(tipo_erro)
+    return resultado
+
+def preparar_planilha(caminho_arquivo, *args, progresso=None, **kwargs) -> dict:
+    # montar_payload cronometrado, para quem faz login/envio em outro processo
+    # (lotes): o resumo volta em "metricas" e continua com Medicao(anterior=...)
+    medicao = Medicao(progresso)
+    preparado = montar_payload(caminho_arquivo, *args, progresso=medicao, **kwargs)
+    if preparado["status"] == "valido":
+        medicao.linhas = len(preparado["payload"]["Prestadores"])
+    preparado["metricas"] = medicao.resumo("planilha" if preparado["status"] == "erro" else None)
+    return preparado
+
+def usar_lotes(caminho_arquivo) -> bool:
+    # planilhas a partir de SICAP_STREAMING_MB vão pelo modo em lotes
+    if STREAMING_BYTES <= 0:
+        return False
+    if isinstance(caminho_arquivo, (bytes, bytearray)):
+        tamanho = len(caminho_arquivo)
+    elif isinstance(caminho_arquivo, io.BytesIO):
+        tamanho = caminho_arquivo.getbuffer().nbytes
+    elif isinstance(caminho_arquivo, (str, Path)):
+        try:
+            tamanho = os.path.getsize(caminho_arquivo)
+        except OSError:
+            return False
+    else:
+        return False
+    return tamanho >= STREAMING_BYTES
+
+def processar_em_lotes(caminho_arquivo, usuario: str, senha: str, mes: str = None, ano: str = None, prestacao_id: any = None, cancelado=None, progresso=None, nome_arquivo: str = None, tamanho_lote: int = STREAMING_LOTE) -> dict:
+    # processar_planilha com memória limitada, para planilhas grandes: a 610 é
+    # lida, mapeada e validada em lotes de `tamanho_lote` linhas e os Prestadores
+    # vão direto para o corpo do POST (CorpoEmPartes, em disco quando cresce).
+    # Os erros de validação são juntados da planilha inteira antes de decidir o
+    # envio; as respostas são as mesmas de processar_planilha. Não usa o cache
+    # de planilhas, que guarda a aba inteira.
+    start_time = time.time()
+    medicao = Medicao(progresso)
+    corpo = None
+    try:
+        if isinstance(caminho_arquivo, (bytes, bytearray)):
+            caminho_arquivo = io.BytesIO(caminho_arquivo)
+        nome_arquivo = nome_arquivo or os.path.basename(caminho_arquivo)
+        logging.info(f"Iniciando processamento em lotes de {tamanho_lote} linhas: {nome_arquivo}")
+
+        erro = _verificar_entrada(prestacao_id)
+        if erro:
+            return com_metricas(erro, medicao, "planilha")
+        indice = carregar_indice_mapeamentos()
+
+        _etapa(medicao, "leitura")
+        try:
+            planilha = PlanilhaEmLotes(caminho_arquivo, COLUNAS_610, tamanho_lote, backend=STREAMING_BACKEND, perfis=PERFIS)
+        except Exception as e:
+            return com_metricas(_erro_leitura(e), medicao, "planilha")
+
+        with planilha:
+            if _cancelado(cancelado):
+                return com_metricas(_resposta_cancelado("mapeamento"), medicao, "cancelado")
+            _etapa(medicao, "mapeamento")
+            try:
+                empresa = montar_empresa(planilha.empresa, prestacao_id)
+            except Exception as e:
+                return com_metricas(_erro_empresa(e), medicao, "planilha")
+            cols = planilha.colunas
+            erro = _erro_colunas(cols)
+            if erro:
+                return com_metricas(erro, medicao, "planilha")
+
+            validacao = ValidacaoPrestadores(indice)
+            corpo = CorpoEmPartes(empresa)
+            try:
+                for df in planilha.lotes():
+                    if _cancelado(cancelado):
+                        return com_metricas(_resposta_cancelado("validacao"), medicao, "cancelado")
+                    mapeados, unicos = mapear_categorias(df, cols, indice)
+                    saida = montar_saida(df, converter_colunas(df, cols), mapeados, indice)
+                    validacao.adicionar(saida, unicos)
+                    # depois do primeiro erro só continua juntando problemas
+                    if validacao.valida():
+                        corpo.adicionar(registros_prestadores(saida))
+                    # solta o lote antes de ler o próximo
+                    del df, saida, mapeados, unicos
+            except Exception as e:
+                return com_metricas(_erro_leitura(e), medicao, "planilha")
+
+        _etapa(medicao, "validacao")
+        erro = validacao.erro()
+        if erro:
+            return com_metricas(erro, medicao, "planilha")
+        corpo.fechar({"SourceArquivo": nome_arquivo})
+        medicao.linhas = corpo.registros
+
+        if _cancelado(cancelado):
+            return com_metricas(_resposta_cancelado("login"), medicao, "cancelado")
+        _etapa(medicao, "login")
+        TOKENS.obter(usuario, senha)
+        if _cancelado(cancelado):
+            return com_metricas(_resposta_cancelado("envio"), medicao, "cancelado")
+        _etapa(medicao, "envio")
+        medicao.bytes_payload = corpo.bytes_json
+        r = enviar_com_token(usuario, senha, corpo)
+        return com_metricas(interpretar_resposta(r, empresa, start_time, corpo.registros), medicao, f"http_{r.status_code}")
+
+    except Exception as e:
+        return com_metricas(erro_interno(e), medicao, type(e).__name__)
+    finally:
+        if corpo is not None:
+            corpo.descartar()
+
+def processar_planilha(caminho_arquivo, usuario: str, senha: str, mes: str = None, ano: str = None, prestacao_id: any = None, cancelado=None, progresso=None, nome_arquivo: str = None, sha256: str = None) -> dict:
+    if usar_lotes(caminho_arquivo):
+        return processar_em_lotes(caminho_arquivo, usuario, senha, mes, ano, prestacao_id, cancelado, progresso, nome_arquivo)
+    start_time = time.time()
+    medicao = Medicao(progresso)
+    try:
+        preparado = montar_payload(caminho_arquivo, mes, ano, prestacao_id, cancelado, medicao, nome_arquivo, sha256=sha256)
+        if preparado["status"] == "erro":
+            return com_metricas(preparado, medicao, "cancelado" if _cancelado(cancelado) else "planilha")
+        payload = preparado["payload"]
+        medicao.linhas = len(payload["Prestadores"])
+
+        if _cancelado(cancelado):
+            return com_metricas(_resposta_cancelado("login"), medicao, "cancelado")
+        _etapa(medicao, "login")
+        TOKENS.obter(usuario, senha)
+        if _cancelado(cancelado):
+            return com_metricas(_resposta_cancelado("envio"), medicao, "cancelado")
+        _etapa(medicao, "envio")
+        corpo = json_bytes(payload)
+        medicao.bytes_payload = len(corpo)
+        r = enviar_com_token(usuario, senha, corpo)
+        return com_metricas(interpretar_resposta(r, payload, start_time), medicao, f"http_{r.status_code}")
+
+    except Exception as e:
+        return com_metricas(erro_interno(e), medicao, type(e).__name__)
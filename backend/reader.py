@@ -0,0 +1,347 @@
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+# Abas Fixas
+ABA_EMPRESA = "600"
+ABA_PRESTADORES = "610"
+
+# Códigos de erro do Excel; o pandas os lê como NaN
+_ERROS_EXCEL = frozenset(("#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A"))
+
+# ==================================================================================
+# RESOLUÇÃO DE COLUNAS
+# ==================================================================================
+
+def _normalize_col_name(s):
+    return re.sub(r'[^a-z0-9]', '', str(s).lower())
+
+def resolver_coluna(colunas, example):
+    cols_norm = { _normalize_col_name(c): c for c in colunas }
+    target_norm = _normalize_col_name(example)
+    if target_norm in cols_norm:
+        return cols_norm[target_norm]
+    words = re.findall(r'\w+', target_norm)
+    for norm, orig in cols_norm.items():
+        if all(w in norm for w in words):
+            return orig
+    # "CNS"/"Cartão SUS" aparece com vários nomes; o atalho vale só para esse campo
+    if 'cns' in target_norm:
+        for norm, orig in cols_norm.items():
+            if 'cns' in norm:
+                return orig
+    return None
+
+def find_column(df, example):
+    return resolver_coluna(df.columns, example)
+
+# ==================================================================================
+# BACKENDS
+# ==================================================================================
+# Cada backend abre o arquivo uma vez e devolve, por aba, um iterador de linhas
+# já convertidas como o `pd.read_excel` faria (célula vazia -> "", número
+# inteiro -> int, erro -> NaN). `brutas` entrega as células sem conversão, para
+# quem só precisa de algumas colunas converter apenas essas (`converter`).
+
+class _Backend:
+    def linhas(self, aba):
+        converter = self.converter
+        for row in self.brutas(aba):
+            yield [converter(v) for v in row]
+
+
+class _OpenpyxlBackend(_Backend):
+    nome = "openpyxl"
+
+    def __init__(self, origem):
+        from openpyxl import load_workbook
+        self._book = load_workbook(origem, read_only=True, data_only=True, keep_links=False)
+
+    def abas(self):
+        return self._book.sheetnames
+
+    def brutas(self, aba):
+        sheet = self._book[aba]
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+
+    @staticmethod
+    def converter(v):
+        return _converter_openpyxl(v)
+
+    def fechar(self):
+        self._book.close()
+
+
+def _converter_openpyxl(v):
+    if v is None:
+        return ""
+    if isinstance(v, float):
+        i = int(v) if np.isfinite(v) else None
+        return i if i == v else v
+    if isinstance(v, str) and v in _ERROS_EXCEL:
+        return np.nan
+    return v
+
+
+class _CalamineBackend(_Backend):
+    nome = "calamine"
+
+    def __init__(self, origem):
+        from python_calamine import load_workbook
+        self._book = load_workbook(origem)
+
+    def abas(self):
+        return self._book.sheet_names
+
+    def brutas(self, aba):
+        sheet = self._book.get_sheet_by_name(aba)
+        inicio = sheet.start
+        if inicio is None:
+            return
+        linha_ini, col_ini = inicio
+        for _ in range(linha_ini):
+            yield []
+        if not col_ini:
+            yield from sheet.iter_rows()
+            return
+        prefixo = [""] * col_ini
+        for row in sheet.iter_rows():
+            yield prefixo + row
+
+    @staticmethod
+    def converter(v):
+        return _converter_calamine(v)
+
+    def fechar(self):
+        close = getattr(self._book, "close", None)
+        if close:
+            close()
+
+
+def _converter_calamine(v):
+    if isinstance(v, float):
+        i = int(v) if np.isfinite(v) else None
+        return i if i == v else v
+    if isinstance(v, date) and not isinstance(v, datetime):
+        return datetime(v.year, v.month, v.day)
+    return v
+
+
+BACKENDS = {
+    "openpyxl": _OpenpyxlBackend,
+    "calamine": _CalamineBackend,
+}
+
+def backends_disponiveis():
+    disponiveis = []
+    for nome, modulo in (("calamine", "python_calamine"), ("openpyxl", "openpyxl")):
+        try:
+            __import__(modulo)
+            disponiveis.append(nome)
+        except ImportError:
+            pass
+    return disponiveis
+
+def escolher_backend(nome=None):
+    # SICAP_EXCEL_BACKEND força um backend; sem ele, calamine tem preferência
+    nome = nome or os.environ.get("SICAP_EXCEL_BACKEND")
+    if nome:
+        if nome not in BACKENDS:
+            raise ValueError(f"Backend de leitura desconhecido: {nome}")
+        return BACKENDS[nome]
+    disponiveis = backends_disponiveis()
+    if not disponiveis:
+        raise ImportError("Nenhum leitor de Excel instalado (openpyxl ou python-calamine).")
+    return BACKENDS[disponiveis[0]]
+
+# ==================================================================================
+# LEITURA
+# ==================================================================================
+
+@dataclass
+class PlanilhaLida:
+    empresa: pd.DataFrame
+    prestadores: pd.DataFrame
+    colunas: dict
+    cabecalho: list = field(default_factory=list)
+    backend: str = ""
+    perfil: str = ""  # impressão digital do layout da 610 (ver perfis.py)
+    perfil_novo: bool = False
+    do_cache: bool = False  # veio do cache_planilhas, sem abrir o Excel
+
+
+def _tem_dados(linha):
+    return any(v != "" for v in linha)
+
+def _tem_dados_brutos(linha):
+    # mesma regra de `_tem_dados`, antes da conversão (None é célula vazia no openpyxl)
+    return any(v is not None and v != "" for v in linha)
+
+def _nomes_cabecalho(linha, largura=0):
+    linha = list(linha)
+    while linha and linha[-1] == "":
+        linha.pop()
+    linha += [""] * (largura - len(linha))
+    if not linha:
+        return []
+    # mesmo tratamento de duplicadas/vazias do read_excel ("X.1", "Unnamed: N")
+    return list(TextParser([linha], header=0).read().columns)
+
+def _montar_frame(linhas, nomes, tipos=None):
+    if not linhas and not nomes:
+        return pd.DataFrame()
+    try:
+        return TextParser(linhas, header=None, names=nomes, skip_blank_lines=False, dtype=tipos or None).read()
+    except EmptyDataError:
+        return pd.DataFrame(columns=nomes)
+
+def _ler_aba_completa(leitor, aba):
+    linhas = iter(leitor.linhas(aba))
+    cabecalho = next(linhas, [])
+    nomes = _nomes_cabecalho(cabecalho)
+    dados, ultima = [], -1
+    for linha in linhas:
+        if _tem_dados(linha):
+            ultima = len(dados)
+        dados.append(linha)
+    dados = dados[: ultima + 1]
+    largura = max([len(nomes)] + [len(l) for l in dados])
+    if largura > len(nomes):
+        nomes = _nomes_cabecalho(cabecalho, largura)
+    dados = [l + [""] * (largura - len(l)) for l in dados]
+    return _montar_frame(dados, nomes)
+
+def _resolver_layout(nomes, esperado, perfis=None):
+    # layout conhecido: colunas e dtypes do perfil; novo: resolve pelo nome
+    perfil = perfis.obter(nomes, esperado) if perfis is not None else None
+    if perfil is not None:
+        return perfil, dict(perfil.colunas), perfis.tipos_explicitos(perfil)
+    return None, {chave: resolver_coluna(nomes, exemplo) for chave, exemplo in esperado.items()}, None
+
+def _linhas_colunas(brutas, converter, selecionadas):
+    # só as colunas `selecionadas` são convertidas; linhas vazias no meio contam
+    # (viram NaN), as do final são descartadas
+    vazias = 0
+    vazia = [""] * len(selecionadas)
+    for linha in brutas:
+        if not _tem_dados_brutos(linha):
+            vazias += 1
+            continue
+        for _ in range(vazias):
+            yield list(vazia)
+        vazias = 0
+        n = len(linha)
+        yield [converter(linha[i]) if i < n else "" for i in selecionadas]
+
+def _ler_aba_colunas(leitor, aba, esperado, perfis=None):
+    brutas = iter(leitor.brutas(aba))
+    converter = leitor.converter
+    nomes = _nomes_cabecalho([converter(v) for v in next(brutas, [])])
+    perfil, colunas, tipos = _resolver_layout(nomes, esperado, perfis)
+
+    # só as colunas resolvidas são materializadas, na ordem do cabeçalho
+    selecionadas = sorted({nomes.index(c) for c in colunas.values() if c is not None})
+    dados = list(_linhas_colunas(brutas, converter, selecionadas))
+    df = _montar_frame(dados, [nomes[i] for i in selecionadas], tipos)
+
+    novo = False
+    if perfil is None and perfis is not None:
+        perfil = perfis.registrar(nomes, esperado, colunas, df)
+        novo = perfil is not None
+    return df, colunas, nomes, perfil.impressao if perfil is not None else "", novo
+
+def ler_planilha(origem, esperado, backend=None, perfis=None) -> PlanilhaLida:
+    """Abre a pasta de trabalho uma única vez e lê as abas 600 e 610.
+
+    `origem` pode ser um caminho ou um arquivo em memória. Da aba 610 só são
+    lidas as colunas que `resolver_coluna` encontra para os campos de
+    `esperado`; `colunas` traz o nome resolvido (ou None) de cada campo.
+    Com `perfis` (um `RegistroPerfis`), um cabeçalho já conhecido usa as
+    colunas e dtypes gravados no perfil, sem resolver nada.
+    """
+    classe = escolher_backend(backend)
+    leitor = classe(origem)
+    try:
+        abas = leitor.abas()
+        for aba in (ABA_EMPRESA, ABA_PRESTADORES):
+            if aba not in abas:
+                raise ValueError(f"Worksheet named '{aba}' not found")
+        df_emp = _ler_aba_completa(leitor, ABA_EMPRESA)
+        df, colunas, cabecalho, perfil, novo = _ler_aba_colunas(leitor, ABA_PRESTADORES, esperado, perfis)
+    finally:
+        leitor.fechar()
+    return PlanilhaLida(df_emp, df, colunas, cabecalho, classe.nome, perfil, novo)
+
+
+class PlanilhaEmLotes:
+    """Leitura da aba 610 em lotes de `tamanho_lote` linhas, para planilhas grandes.
+
+    Abre o arquivo e lê a aba 600 e o cabeçalho da 610 na criação; `lotes()`
+    entrega um DataFrame por lote, com as mesmas colunas e conversões de
+    `ler_planilha` e índice contínuo (posição da linha na aba inteira, para
+    `linhas_excel`). Só um lote fica em memória por vez. Usar com `with`.
+    """
+
+    def __init__(self, origem, esperado, tamanho_lote, backend=None, perfis=None):
+        classe = escolher_backend(backend)
+        self.backend = classe.nome
+        self.tamanho_lote = tamanho_lote
+        self._esperado = esperado
+        self._perfis = perfis
+        self._leitor = classe(origem)
+        try:
+            abas = self._leitor.abas()
+            for aba in (ABA_EMPRESA, ABA_PRESTADORES):
+                if aba not in abas:
+                    raise ValueError(f"Worksheet named '{aba}' not found")
+            self.empresa = _ler_aba_completa(self._leitor, ABA_EMPRESA)
+            self._brutas = iter(self._leitor.brutas(ABA_PRESTADORES))
+            self.cabecalho = _nomes_cabecalho([self._leitor.converter(v) for v in next(self._brutas, [])])
+            perfil, self.colunas, self._tipos = _resolver_layout(self.cabecalho, esperado, perfis)
+        except Exception:
+            self._leitor.fechar()
+            raise
+        self.perfil = perfil.impressao if perfil is not None else ""
+        self.perfil_novo = False
+        self._registrar = perfil is None and perfis is not None
+
+    def lotes(self):
+        selecionadas = sorted({self.cabecalho.index(c) for c in self.colunas.values() if c is not None})
+        nomes = [self.cabecalho[i] for i in selecionadas]
+        linhas = _linhas_colunas(self._brutas, self._leitor.converter, selecionadas)
+        inicio = 0
+        while True:
+            dados = [linha for _, linha in zip(range(self.tamanho_lote), linhas)]
+            if not dados and inicio:
+                return
+            df = _montar_frame(dados, nomes, self._tipos)
+            dados = None
+            df.index = pd.RangeIndex(inicio, inicio + len(df))
+            if self._registrar:
+                # layout novo: registrado com os dtypes do primeiro lote
+                self._registrar = False
+                perfil = self._perfis.registrar(self.cabecalho, self._esperado, self.colunas, df)
+                if perfil is not None:
+                    self.perfil, self.perfil_novo = perfil.impressao, True
+            inicio += len(df)
+            completo = len(df) == self.tamanho_lote
+            yield df
+            df = None
+            if not completo:
+                return
+
+    def fechar(self):
+        self._leitor.fechar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
@@ -0,0 +1,95 @@
+import gzip
+import json
+import os
+import tempfile
+
+# orjson é opcional; sem ele cai no json da biblioteca padrão
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# SICAP_GZIP=1 comprime o corpo enviado ao SICAP (Content-Encoding: gzip).
+# Desligado por padrão: só ativar depois de confirmar que o SICAP aceita.
+GZIP_ENVIO = os.environ.get("SICAP_GZIP", "0") == "1"
+GZIP_NIVEL = 6
+
+# Corpo montado em partes (modo em lotes, ver processor.processar_em_lotes):
+# fica em memória até SICAP_STREAMING_SPOOL_MB e depois vai para um arquivo
+# temporário; o POST lê o arquivo em blocos de BLOCO_ENVIO bytes.
+SPOOL_MAX_BYTES = int(float(os.environ.get("SICAP_STREAMING_SPOOL_MB", "8")) * 1024 * 1024)
+BLOCO_ENVIO = 64 * 1024
+
+
+def json_bytes(dados, default=None) -> bytes:
+    """Serializa `dados` direto para bytes UTF-8."""
+    if orjson is not None:
+        return orjson.dumps(dados, default=default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(dados, ensure_ascii=False, default=default, separators=(",", ":")).encode("utf-8")
+
+
+def corpo_envio(payload, comprimir=GZIP_ENVIO):
+    """Corpo pronto para o POST e os cabeçalhos extras que ele exige.
+
+    `payload` pode ser um dict, bytes já serializados por `json_bytes` ou
+    um `CorpoEmPartes` fechado (enviado como está).
+    """
+    if isinstance(payload, CorpoEmPartes):
+        return payload, payload.cabecalhos
+    corpo = payload if isinstance(payload, (bytes, bytearray)) else json_bytes(payload)
+    if comprimir:
+        return gzip.compress(corpo, GZIP_NIVEL), {"Content-Encoding": "gzip"}
+    return corpo, {}
+
+
+class CorpoEmPartes:
+    """JSON `{**inicio, "Prestadores": [...], **fim}` escrito lote a lote.
+
+    Os bytes são os mesmos de `json_bytes` no payload inteiro, mas só um
+    lote de registros fica em memória por vez. Depois de `fechar`, o objeto
+    é o próprio corpo do POST: o requests vê `len` e `__iter__`, manda
+    Content-Length e lê o arquivo em blocos. Pode ser enviado mais de uma
+    vez (401, repetição); `descartar` apaga o arquivo.
+    """
+
+    def __init__(self, inicio: dict, comprimir=GZIP_ENVIO, spool_max=SPOOL_MAX_BYTES):
+        self.cabecalhos = {"Content-Encoding": "gzip"} if comprimir else {}
+        self.registros = 0
+        self.bytes_json = 0  # tamanho do JSON antes do gzip
+        self._arquivo = tempfile.SpooledTemporaryFile(max_size=spool_max)
+        self._saida = gzip.GzipFile(fileobj=self._arquivo, mode="wb", compresslevel=GZIP_NIVEL, mtime=0) if comprimir else self._arquivo
+        self._tamanho = None
+        self._escrever(json_bytes(inicio)[:-1] + (b',"Prestadores":[' if inicio else b'"Prestadores":['))
+
+    def _escrever(self, dados):
+        self._saida.write(dados)
+        self.bytes_json += len(dados)
+
+    def adicionar(self, registros: list):
+        if not registros:
+            return
+        if self.registros:
+            self._escrever(b",")
+        self._escrever(json_bytes(registros)[1:-1])
+        self.registros += len(registros)
+
+    def fechar(self, fim: dict):
+        self._escrever(b"]" + (b"," + json_bytes(fim)[1:] if fim else b"}"))
+        if self._saida is not self._arquivo:
+            self._saida.close()
+        self._tamanho = self._arquivo.tell()
+        return self
+
+    def descartar(self):
+        self._arquivo.close()
+
+    def __len__(self):
+        return self._tamanho
+
+    def __iter__(self):
+        self._arquivo.seek(0)
+        return iter(lambda: self._arquivo.read(BLOCO_ENVIO), b"")
+
+    def __bytes__(self):
+        self._arquivo.seek(0)
+        return self._arquivo.read()
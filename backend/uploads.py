@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+from tempfile import SpooledTemporaryFile
+
+from fastapi import HTTPException
+
+# Configuração via ambiente:
+#   SICAP_UPLOAD_MAX_MB       tamanho máximo de uma planilha enviada
+#   SICAP_UPLOAD_MEMORIA_MB   cópias feitas para os lotes (que rodam depois da
+#                             resposta) ficam em memória até esse tamanho;
+#                             acima disso o SpooledTemporaryFile vai para disco
+UPLOAD_MAX_BYTES = int(float(os.environ.get("SICAP_UPLOAD_MAX_MB", "20")) * 1024 * 1024)
+UPLOAD_MEMORIA_BYTES = int(float(os.environ.get("SICAP_UPLOAD_MEMORIA_MB", "16")) * 1024 * 1024)
+
+# Folga para os campos do formulário e os delimitadores do multipart
+FOLGA_MULTIPART = 64 * 1024
+
+TAMANHO_BLOCO = 1024 * 1024
+
+
+def _mensagem_limite(limite):
+    return f"Envio excede o limite de {limite / (1024 * 1024):.0f} MB."
+
+
+class UploadGrande(HTTPException):
+    # HTTPException para atravessar o parser de formulário do FastAPI como 413
+    def __init__(self, limite):
+        super().__init__(status_code=413, detail=_mensagem_limite(limite))
+        self.limite = limite
+
+
+class UploadRecebido:
+    """Upload num SpooledTemporaryFile (o do próprio `UploadFile` ou uma
+    cópia), com SHA-256 e tamanho."""
+
+    def __init__(self, nome, arquivo, sha256, tamanho):
+        self.nome = nome
+        self.arquivo = arquivo
+        self.sha256 = sha256
+        self.tamanho = tamanho
+
+    def conteudo(self) -> bytes:
+        # para o pool de processos, que não recebe objetos de arquivo
+        self.arquivo.seek(0)
+        return self.arquivo.read()
+
+    def fechar(self):
+        try:
+            self.arquivo.close()
+        except Exception:
+            pass
+
+
+async def receber_upload(upload, limite=UPLOAD_MAX_BYTES) -> UploadRecebido:
+    """Lê o `UploadFile` em blocos para calcular o SHA-256 e conferir o limite.
+
+    Não copia nada: o resultado aponta para o spool do próprio `UploadFile`,
+    que o FastAPI fecha ao fim da requisição. Levanta `UploadGrande` assim
+    que o limite é ultrapassado.
+    """
+    sha = hashlib.sha256()
+    tamanho = 0
+    while True:
+        bloco = await upload.read(TAMANHO_BLOCO)
+        if not bloco:
+            break
+        tamanho += len(bloco)
+        if tamanho > limite:
+            raise UploadGrande(limite)
+        sha.update(bloco)
+    await upload.seek(0)
+    return UploadRecebido(upload.filename, upload.file, sha.hexdigest(), tamanho)
+
+
+def copiar_upload(origem, nome, limite=UPLOAD_MAX_BYTES, memoria=UPLOAD_MEMORIA_BYTES) -> UploadRecebido:
+    """Copia `origem` em blocos, calculando o SHA-256 no caminho.
+
+    Para o que precisa sobreviver à requisição (planilhas de um lote, as de
+    dentro de um .zip).
+
+    Levanta `UploadGrande` assim que o limite é ultrapassado, sem ler o resto.
+    """
+    destino = SpooledTemporaryFile(max_size=memoria)
+    sha = hashlib.sha256()
+    tamanho = 0
+    try:
+        while True:
+            bloco = origem.read(TAMANHO_BLOCO)
+            if not bloco:
+                break
+            tamanho += len(bloco)
+            if tamanho > limite:
+                raise UploadGrande(limite)
+            sha.update(bloco)
+            destino.write(bloco)
+    except BaseException:
+        destino.close()
+        raise
+    destino.seek(0)
+    return UploadRecebido(nome, destino, sha.hexdigest(), tamanho)
+
+
+class LimiteCorpo:
+    """Middleware ASGI que recusa com 413 corpos acima do limite.
+
+    Confere o Content-Length antes de ler qualquer coisa e, para corpos sem
+    Content-Length (chunked), conta os bytes à medida que chegam e levanta
+    `UploadGrande` no primeiro bloco que passar do limite. `limites` permite
+    um valor diferente por prefixo de rota.
+    """
+
+    def __init__(self, app, limite=UPLOAD_MAX_BYTES + FOLGA_MULTIPART, limites=None):
+        self.app = app
+        self.limite = limite
+        self.limites = limites or {}
+
+    def _limite(self, caminho):
+        for prefixo, limite in self.limites.items():
+            if caminho.startswith(prefixo):
+                return limite
+        return self.limite
+
+    async def _recusar(self, send, limite):
+        corpo = json.dumps(
+            {"status": "erro", "mensagem": _mensagem_limite(limite)}, ensure_ascii=False
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": corpo})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+
+        limite = self._limite(scope["path"])
+        for chave, valor in scope["headers"]:
+            if chave == b"content-length":
+                try:
+                    if int(valor) > limite:
+                        await self._recusar(send, limite)
+                        return
+                except ValueError:
+                    pass
+                break
+
+        recebidos = 0
+
+        async def receive_limitado():
+            nonlocal recebidos
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                recebidos += len(mensagem.get("body", b""))
+                if recebidos > limite:
+                    # vira 413 pelo handler de UploadGrande registrado no app
+                    raise UploadGrande(limite)
+            return mensagem
+
+        await self.app(scope, receive_limitado, send)
@@ -0,0 +1,193 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+import zipfile
+
+# Configuração via ambiente (segundos):
+#   SICAP_VIGIA_MODO        "auto" (inotify quando disponível), "inotify" ou "polling"
+#   SICAP_VIGIA_INTERVALO   varredura da pasta no modo polling
+#   SICAP_VIGIA_VARREDURA   varredura de segurança com inotify (eventos perdidos,
+#                           pastas de rede que não geram eventos)
+#   SICAP_VIGIA_ESTAVEL     tempo sem mudar tamanho/data para o arquivo contar como completo
+VIGIA_MODO = os.environ.get("SICAP_VIGIA_MODO", "auto").lower()
+VIGIA_INTERVALO = float(os.environ.get("SICAP_VIGIA_INTERVALO", "2"))
+VIGIA_VARREDURA = float(os.environ.get("SICAP_VIGIA_VARREDURA", "60"))
+VIGIA_ESTAVEL = float(os.environ.get("SICAP_VIGIA_ESTAVEL", "3"))
+
+EXTENSOES_PLANILHA = (".xlsx", ".xls")
+
+# linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENTOS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+_CABECALHO_EVENTO = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class _Inotify:
+    """inotify via ctypes (só Linux); sem dependência externa."""
+
+    def __init__(self, pasta):
+        nome = ctypes.util.find_library("c")
+        if not nome or not os.path.exists("/proc/sys/fs/inotify"):
+            raise OSError(errno.ENOSYS, "inotify indisponível")
+        libc = ctypes.CDLL(nome, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        if libc.inotify_add_watch(self.fd, os.fsencode(pasta), EVENTOS) < 0:
+            erro = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(erro, f"inotify_add_watch falhou para {pasta}")
+
+    def esperar(self, timeout):
+        """Espera até `timeout` s por eventos; devolve os nomes afetados."""
+        prontos, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not prontos:
+            return []
+        try:
+            dados = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        nomes = []
+        pos = 0
+        while pos + _CABECALHO_EVENTO.size <= len(dados):
+            _, mascara, _, tamanho = _CABECALHO_EVENTO.unpack_from(dados, pos)
+            pos += _CABECALHO_EVENTO.size
+            nome = dados[pos:pos + tamanho].rstrip(b"\0")
+            pos += tamanho
+            if mascara & (IN_DELETE_SELF | IN_MOVE_SELF):
+                raise FileNotFoundError("A pasta vigiada foi removida ou movida.")
+            if nome:
+                nomes.append(os.fsdecode(nome))
+        return nomes
+
+    def fechar(self):
+        os.close(self.fd)
+
+
+def _candidata(nome):
+    # "~$" são travas do Excel; ".~" e ".nome.tmp" vêm de cópias em andamento
+    return nome.lower().endswith(EXTENSOES_PLANILHA) and not nome.startswith(("~$", "."))
+
+
+def _completa(caminho):
+    # .xlsx é um zip: o diretório central fica no fim, então cópia pela metade não abre
+    if caminho.lower().endswith(".xlsx"):
+        return zipfile.is_zipfile(caminho)
+    return True
+
+
+class Vigia:
+    """Detecta planilhas novas numa pasta e as entrega depois de completas.
+
+    Um arquivo só é entregue quando tamanho e data de modificação ficam
+    `estavel` segundos sem mudar (e, se for .xlsx, quando já abre como zip).
+    O inotify só antecipa a próxima varredura; a listagem da pasta continua
+    sendo a fonte da verdade, então o modo polling se comporta igual, só que
+    com mais latência.
+
+    Cada arquivo é entregue uma vez enquanto estiver na pasta; `adiar`
+    devolve um arquivo para nova entrega depois de um tempo.
+    """
+
+    def __init__(self, pasta, modo=VIGIA_MODO, intervalo=VIGIA_INTERVALO,
+                 varredura=VIGIA_VARREDURA, estavel=VIGIA_ESTAVEL):
+        if modo not in ("auto", "inotify", "polling"):
+            raise ValueError(f"SICAP_VIGIA_MODO inválido: {modo}")
+        self.pasta = os.path.abspath(pasta)
+        self.intervalo = intervalo
+        self.varredura = varredura
+        self.estavel = estavel
+        self._observando = {}  # caminho -> (tamanho, mtime, desde)
+        self._entregues = set()
+        self._adiados = {}  # caminho -> instante em que pode voltar
+        self._inotify = None
+        if modo != "polling":
+            try:
+                self._inotify = _Inotify(self.pasta)
+            except (OSError, AttributeError) as e:
+                if modo == "inotify":
+                    raise
+                logging.info(f"inotify indisponível ({e}); vigiando {self.pasta} por polling")
+        self.modo = "inotify" if self._inotify is not None else "polling"
+
+    def fechar(self):
+        if self._inotify is not None:
+            self._inotify.fechar()
+            self._inotify = None
+
+    def adiar(self, caminho, segundos):
+        """Permite entregar `caminho` de novo daqui a `segundos`."""
+        self._entregues.discard(caminho)
+        self._adiados[caminho] = time.monotonic() + segundos
+
+    def _varrer(self, agora):
+        presentes = set()
+        prontos = []
+        with os.scandir(self.pasta) as entradas:
+            for entrada in entradas:
+                if not _candidata(entrada.name):
+                    continue
+                try:
+                    if not entrada.is_file():
+                        continue
+                    info = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                caminho = entrada.path
+                presentes.add(caminho)
+                if caminho in self._entregues or self._adiados.get(caminho, 0) > agora:
+                    continue
+                assinatura = (info.st_size, info.st_mtime_ns)
+                anterior = self._observando.get(caminho)
+                if anterior is None or anterior[:2] != assinatura:
+                    self._observando[caminho] = (*assinatura, agora)
+                elif agora - anterior[2] >= self.estavel and info.st_size > 0 and _completa(caminho):
+                    prontos.append(caminho)
+
+        # arquivos que saíram da pasta (movidos, apagados) deixam de ser acompanhados
+        for estado in (self._observando, self._adiados):
+            for caminho in [c for c in estado if c not in presentes]:
+                del estado[caminho]
+        self._entregues &= presentes
+        for caminho in prontos:
+            del self._observando[caminho]
+            self._adiados.pop(caminho, None)
+            self._entregues.add(caminho)
+        return sorted(prontos)
+
+    def _proxima_varredura(self, agora):
+        if self._observando:
+            # há arquivo sendo copiado: volta quando ele puder estar estável
+            return min(self.estavel / 2, self.intervalo) if self._inotify else self.intervalo
+        limite = self.varredura if self._inotify else self.intervalo
+        if self._adiados:
+            limite = min(limite, max(0.0, min(self._adiados.values()) - agora))
+        return limite
+
+    def aguardar(self, timeout=None):
+        """Planilhas completas desde a última chamada; espera no máximo `timeout` s."""
+        agora = time.monotonic()
+        prontos = self._varrer(agora)
+        if prontos:
+            return prontos
+        espera = self._proxima_varredura(agora)
+        if timeout is not None:
+            espera = min(espera, timeout)
+        if self._inotify is not None:
+            self._inotify.esperar(espera)
+        else:
+            time.sleep(espera)
+        return self._varrer(time.monotonic())
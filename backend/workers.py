@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+try:
+    from .processor import aquecer
+except ImportError:
+    from processor import aquecer
+
+# Configuração via ambiente:
+#   SICAP_POOL_MODO     "thread" (padrão) ou "process"
+#   SICAP_POOL_WORKERS  quantidade de workers
+#   SICAP_MAX_JOBS      jobs simultâneos aceitos (em execução + na fila)
+#   SICAP_DRENAR_SEGUNDOS  no encerramento, quanto esperar os lotes em andamento
+POOL_MODO = os.environ.get("SICAP_POOL_MODO", "thread").lower()
+POOL_WORKERS = int(os.environ.get("SICAP_POOL_WORKERS", "0")) or (
+    4 if POOL_MODO == "thread" else max(1, min(4, os.cpu_count() or 1))
+)
+MAX_JOBS = int(os.environ.get("SICAP_MAX_JOBS", "0")) or POOL_WORKERS * 2
+DRENAR_SEGUNDOS = float(os.environ.get("SICAP_DRENAR_SEGUNDOS", "150"))
+
+# Intervalo para checar se o cliente desconectou enquanto o job roda
+INTERVALO_DESCONEXAO = 0.5
+
+
+class PoolOcupado(Exception):
+    pass
+
+
+class JobCancelado(Exception):
+    pass
+
+
+def _descartar_resultado(future):
+    # o cliente já saiu; só evita o aviso de exceção nunca consumida
+    if not future.cancelled():
+        future.exception()
+
+
+class PoolProcessamento:
+    """Executa o processamento síncrono fora do event loop do uvicorn.
+
+    Cada job recebe um evento `cancelado`, que o processor consulta entre as
+    etapas; assim um cliente que desconecta não gera envio ao SICAP.
+    """
+
+    def __init__(self, modo=POOL_MODO, workers=POOL_WORKERS, max_jobs=MAX_JOBS):
+        if modo not in ("thread", "process"):
+            raise ValueError(f"SICAP_POOL_MODO inválido: {modo}")
+        self.modo = modo
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self._executor = None
+        self._manager = None
+        self._ativos = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ativos(self):
+        return self._ativos
+
+    def iniciar(self):
+        if self._executor is not None:
+            return
+        if self.modo == "process":
+            import multiprocessing
+            self._manager = multiprocessing.Manager()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=aquecer)
+            # força a criação dos processos agora, já com pandas e mapeamentos carregados
+            for f in [self._executor.submit(int) for _ in range(self.workers)]:
+                f.result()
+        else:
+            aquecer()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sicap")
+        logging.info(f"Pool de processamento iniciado: modo={self.modo} workers={self.workers} max_jobs={self.max_jobs}")
+
+    def encerrar(self, aguardar=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=aguardar, cancel_futures=not aguardar)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def _novo_evento(self):
+        return self._manager.Event() if self._manager is not None else threading.Event()
+
+    def _liberar(self, _future):
+        with self._lock:
+            self._ativos -= 1
+
+    def submeter(self, fn, *args, **kwargs):
+        """Reserva uma vaga e envia `fn(*args, cancelado=evento, **kwargs)` ao pool.
+
+        Retorna `(future, evento)` sem esperar o resultado; a vaga é liberada
+        quando o job termina de fato. Levanta `PoolOcupado` se não há vaga.
+        """
+        self.iniciar()
+        with self._lock:
+            if self._ativos >= self.max_jobs:
+                raise PoolOcupado(f"Limite de {self.max_jobs} processamentos simultâneos atingido.")
+            self._ativos += 1
+
+        evento = self._novo_evento()
+        try:
+            future = self._executor.submit(partial(fn, *args, cancelado=evento, **kwargs))
+        except Exception:
+            self._liberar(None)
+            raise
+        future.add_done_callback(self._liberar)
+        return future, evento
+
+    async def executar(self, fn, *args, desconectado=None, **kwargs):
+        """Como `submeter`, mas aguarda o resultado.
+
+        `desconectado` é uma corrotina (ex.: `request.is_disconnected`); se ela
+        indicar que o cliente saiu, o evento é sinalizado e `JobCancelado` é
+        levantada.
+        """
+        future, evento = self.submeter(fn, *args, **kwargs)
+        return await self.aguardar(future, evento, desconectado)
+
+    async def aguardar(self, future, evento, desconectado=None):
+        """Espera um job já submetido, com a mesma regra de desconexão de `executar`."""
+        aguardando = asyncio.wrap_future(future)
+        while True:
+            done, _ = await asyncio.wait({aguardando}, timeout=INTERVALO_DESCONEXAO)
+            if done:
+                return aguardando.result()
+            if desconectado is not None and await desconectado():
+                evento.set()
+                future.cancel()
+                aguardando.add_done_callback(_descartar_resultado)
+                logging.warning("Cliente desconectou; processamento marcado para cancelamento.")
+                raise JobCancelado("Cliente desconectou antes do fim do processamento.")
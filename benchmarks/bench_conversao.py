@@ -0,0 +1,80 @@
+"""Benchmark: conversão da 610 com `.astype(str)`/`apply` (antes) x
+`backend.conversao` (vetorizada), coluna por coluna.
+
+O DataFrame sai do mesmo caminho do leitor (células como o openpyxl entrega,
+montadas por `reader._montar_frame`), com a mistura de tipos do gerador:
+CPF número/texto, data datetime/texto, valor float/"R$ 1.234,56".
+
+Uso (na raiz do repositório):
+    python -m benchmarks.bench_conversao --linhas 100000
+"""
+import argparse
+import json
+import time
+
+import pandas as pd
+
+from backend.conversao import converter_cpf, converter_texto, converter_valores, formatar_datas, ler_datas
+from backend.processor import ARQUIVO_JSON_MAPEAMENTOS, COLUNAS_610, parse_money
+from backend.reader import _converter_openpyxl, _montar_frame, find_column
+from benchmarks.gerador import CABECALHO_610, linhas_prestadores
+
+
+def _datas_antes(serie):
+    return pd.to_datetime(serie, errors="coerce", dayfirst=True).apply(
+        lambda x: x.strftime("%Y-%m-%dT00:00:00") if pd.notna(x) else "1900-01-01T00:00:00"
+    )
+
+
+def _datas_depois(serie):
+    # como em processor.converter_colunas
+    return formatar_datas(ler_datas(serie), serie.index)
+
+
+CONVERSOES = {
+    "Nome": (lambda s: s.astype(str).str.strip(), converter_texto),
+    "CPF": (lambda s: s.astype(str).str.replace(r'\D', '', regex=True).str.zfill(11), converter_cpf),
+    "DataNascimento": (_datas_antes, _datas_depois),
+    "CnsDoProfissional": (lambda s: s.astype(str).str.strip(), converter_texto),
+    "ValorPorProfissional": (lambda s: s.apply(parse_money), converter_valores),
+}
+
+
+def frame_610(linhas, seed=42):
+    with open(ARQUIVO_JSON_MAPEAMENTOS, "r", encoding="utf-8") as f:
+        mapas = json.load(f)
+    brutas = ([_converter_openpyxl(v) for v in linha] for linha in linhas_prestadores(linhas, mapas, seed))
+    return _montar_frame(list(brutas), CABECALHO_610)
+
+
+def cronometrar(fn, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=100000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    df = frame_610(args.linhas, args.seed)
+    print(f"{args.linhas} linhas")
+    total_antes = total_depois = 0.0
+    for campo, (antes, depois) in CONVERSOES.items():
+        serie = df[find_column(df, COLUNAS_610[campo])]
+        t_antes = cronometrar(lambda: antes(serie), args.repeticoes)
+        t_depois = cronometrar(lambda: depois(serie), args.repeticoes)
+        total_antes += t_antes
+        total_depois += t_depois
+        print(f"  {campo:<22} {str(serie.dtype):<8} {t_antes * 1000:9.1f}ms -> {t_depois * 1000:8.1f}ms  ({t_antes / t_depois:.1f}x)")
+    print(f"  {'total':<31} {total_antes * 1000:9.1f}ms -> {total_depois * 1000:8.1f}ms  ({total_antes / total_depois:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
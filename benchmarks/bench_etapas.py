@@ -0,0 +1,160 @@
+"""Benchmark por etapa de `montar_payload`, com histórico para comparar execuções.
+
+Etapas medidas separadamente, na ordem do processamento:
+    leitura      ler_planilha (abas 600 e 610)
+    colunas      resolver_coluna para cada campo de COLUNAS_610
+    mapeamento   mapear_categorias (IDs de cargo, unidade, linha de serviço...)
+    conversao    converter_colunas (texto, CPF, data, CNS, valor)
+    validacao    cpfs_invalidos + cns_invalidos
+    montagem     montar_saida + registros_prestadores
+    serializacao json_bytes do payload
+    total        montar_payload de ponta a ponta
+
+As planilhas vêm de `benchmarks.gerador`. Cada execução grava um JSON em
+`benchmarks/resultados/` (melhor tempo de N repetições por etapa); com
+`--comparar`, mostra a variação contra uma execução anterior e termina com
+código 1 se alguma etapa piorar mais que `--tolerancia` (diferenças abaixo de
+`--minimo` ms são ruído e não contam).
+
+Uso (na raiz do repositório):
+    python -m benchmarks.bench_etapas --linhas 1000 20000
+    python -m benchmarks.bench_etapas --linhas 20000 --comparar benchmarks/resultados/etapas_20260101-120000.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from backend.documentos import cns_invalidos, cpfs_invalidos
+from backend.processor import (
+    BASE_DIR, COLUNAS_610, carregar_indice_mapeamentos, converter_colunas, mapear_categorias,
+    montar_payload, montar_saida, registros_prestadores,
+)
+from backend.reader import ler_planilha, resolver_coluna
+from backend.serializacao import json_bytes, orjson
+from benchmarks.gerador import gerar_planilha
+
+DIRETORIO_RESULTADOS = os.path.join(BASE_DIR, "benchmarks", "resultados")
+ETAPAS = ["leitura", "colunas", "mapeamento", "conversao", "validacao", "montagem", "serializacao", "total"]
+
+
+def _melhor(fn, repeticoes):
+    melhor, resultado = float("inf"), None
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        resultado = fn()
+        melhor = min(melhor, time.perf_counter() - t0)
+    return melhor, resultado
+
+
+def medir(caminho, repeticoes, backend=None):
+    """Melhor tempo (s) de cada etapa para a planilha em `caminho`."""
+    indice = carregar_indice_mapeamentos()
+    tempos = {}
+
+    tempos["leitura"], planilha = _melhor(lambda: ler_planilha(caminho, COLUNAS_610, backend=backend), repeticoes)
+    df = planilha.prestadores
+    tempos["colunas"], cols = _melhor(
+        lambda: {campo: resolver_coluna(planilha.cabecalho, ex) for campo, ex in COLUNAS_610.items()}, repeticoes
+    )
+    tempos["mapeamento"], (mapeados, _) = _melhor(lambda: mapear_categorias(df, cols, indice), repeticoes)
+    tempos["conversao"], convertidas = _melhor(lambda: converter_colunas(df, cols), repeticoes)
+    tempos["validacao"], _ = _melhor(
+        lambda: (cpfs_invalidos(convertidas["CPF"]), cns_invalidos(convertidas["CnsDoProfissional"])), repeticoes
+    )
+    tempos["montagem"], prestadores = _melhor(
+        lambda: registros_prestadores(montar_saida(df, convertidas, mapeados, indice)), repeticoes
+    )
+    tempos["serializacao"], _ = _melhor(lambda: json_bytes({"Prestadores": prestadores}), repeticoes)
+    tempos["total"], resultado = _melhor(
+        lambda: montar_payload(caminho, prestacao_id="921", nome_arquivo="bench.xlsx"), repeticoes
+    )
+    if resultado["status"] != "valido":
+        raise SystemExit(f"montar_payload recusou a planilha gerada: {resultado['mensagem']}")
+    return tempos, planilha.backend
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, anterior, tolerancia, minimo=0.002):
+    """Imprime a variação por etapa; devolve as etapas que pioraram além da tolerância."""
+    piores = []
+    print(f"\nComparação com {anterior['data']} (commit {anterior.get('commit') or '?'}):")
+    for linhas, tempos in atual["resultados"].items():
+        base = anterior["resultados"].get(linhas)
+        if not base:
+            print(f"  {linhas} linhas: sem referência")
+            continue
+        for etapa in ETAPAS:
+            if etapa not in base:
+                continue
+            variacao = tempos[etapa] / base[etapa] - 1 if base[etapa] else 0.0
+            marca = ""
+            if variacao > tolerancia and tempos[etapa] - base[etapa] > minimo:
+                marca = "  <- regressão"
+                piores.append((linhas, etapa, variacao))
+            print(f"  {linhas:>7} {etapa:<13} {base[etapa] * 1000:>9.1f}ms -> {tempos[etapa] * 1000:>9.1f}ms "
+                  f"{variacao:>+7.1%}{marca}")
+    return piores
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--backend", help="openpyxl ou calamine (padrão: o mesmo do backend)")
+    parser.add_argument("--saida", help="arquivo JSON de resultados (padrão: benchmarks/resultados/etapas_<data>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.20, help="piora relativa aceita por etapa")
+    parser.add_argument("--minimo", type=float, default=2.0, help="piora absoluta mínima (ms) para contar")
+    args = parser.parse_args()
+
+    execucao = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "json": "orjson" if orjson is not None else "json",
+        "repeticoes": args.repeticoes,
+        "resultados": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for linhas in args.linhas:
+            caminho = gerar_planilha(os.path.join(tmp, f"sintetica_{linhas}.xlsx"), linhas)
+            tempos, backend = medir(caminho, args.repeticoes, args.backend)
+            execucao["backend"] = backend
+            execucao["resultados"][str(linhas)] = tempos
+            print(f"\n{linhas} linhas ({backend})")
+            for etapa in ETAPAS:
+                print(f"  {etapa:<13} {tempos[etapa] * 1000:>9.1f}ms")
+
+    saida = args.saida or os.path.join(
+        DIRETORIO_RESULTADOS, f"etapas_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(execucao, f, indent=2)
+    print(f"\nResultados gravados em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+        if comparar(execucao, anterior, args.tolerancia, args.minimo / 1000):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark de leitura das abas 600/610: `pd.read_excel` duas vezes x
+`ler_planilha` em cada backend disponível.
+
+Usa os layouts reais de `backend/uploads` (GlobalMed/PersonalMed). Com
+`--linhas`, as linhas da 610 são replicadas até o tamanho pedido.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.bench_leitura --linhas 20000
+"""
+import argparse
+import glob
+import hashlib
+import os
+import tempfile
+import time
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from backend.processor import BASE_DIR, COLUNAS_610
+from backend.reader import ABA_EMPRESA, ABA_PRESTADORES, backends_disponiveis, ler_planilha
+
+
+def planilhas_reais():
+    vistos, arquivos = set(), []
+    for caminho in sorted(glob.glob(os.path.join(BASE_DIR, "backend", "uploads", "*.xlsx"))):
+        with open(caminho, "rb") as f:
+            h = hashlib.sha256(f.read()).hexdigest()
+        if h not in vistos:
+            vistos.add(h)
+            arquivos.append(caminho)
+    return arquivos
+
+
+def ampliar(caminho, linhas, destino):
+    origem = load_workbook(caminho, read_only=True)
+    saida = Workbook(write_only=True)
+    for aba in (ABA_EMPRESA, ABA_PRESTADORES):
+        ws = saida.create_sheet(aba)
+        rows = list(origem[aba].iter_rows(values_only=True))
+        ws.append(rows[0])
+        corpo = [r for r in rows[1:] if any(v is not None for v in r)]
+        if aba == ABA_EMPRESA:
+            for r in corpo:
+                ws.append(r)
+            continue
+        for i in range(linhas):
+            ws.append(corpo[i % len(corpo)])
+    saida.save(destino)
+    origem.close()
+
+
+def cronometrar(fn, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=0, help="replicar a aba 610 até N linhas (0 = arquivo original)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("arquivos", nargs="*")
+    args = parser.parse_args()
+
+    arquivos = args.arquivos or planilhas_reais()
+    with tempfile.TemporaryDirectory() as tmp:
+        for caminho in arquivos:
+            alvo = caminho
+            if args.linhas:
+                alvo = os.path.join(tmp, os.path.basename(caminho))
+                ampliar(caminho, args.linhas, alvo)
+
+            def _read_excel():
+                pd.read_excel(alvo, sheet_name=ABA_EMPRESA)
+                pd.read_excel(alvo, sheet_name=ABA_PRESTADORES)
+
+            base = cronometrar(_read_excel, args.repeticoes)
+            print(f"\n{os.path.basename(caminho)} ({args.linhas or 'original'} linhas)")
+            print(f"  {'pd.read_excel x2':<22} {base:8.3f}s")
+            for backend in backends_disponiveis():
+                t = cronometrar(lambda: ler_planilha(alvo, COLUNAS_610, backend=backend), args.repeticoes)
+                print(f"  {'ler_planilha/' + backend:<22} {t:8.3f}s  ({base / t:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark: `mapear` legado x `MappingIndex` compilado.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.bench_mapeamento --linhas 20000
+"""
+import argparse
+import json
+import random
+import time
+
+from backend.mapping import MappingIndex
+from backend.processor import ARQUIVO_JSON_MAPEAMENTOS
+from benchmarks.referencia import mapear
+
+CATEGORIAS = {
+    "AutoDeclaracaoGenero": "AutoDeclaracaoGenero",
+    "AutoDeclaracaoRacial": "AutoDeclaracaoRacial",
+    "CargoId": "CargoId",
+    "CargaHorariaSemanalId": "CargaHorariaSemanalId",
+    "TurnoTrabalho": "TurnoTrabalho",
+    "Unidade": "Unidade",
+    "LinhaServicoId": "LinhasDeServico",
+}
+
+
+def _variante(chave, rng):
+    # mesmas variações que aparecem nas planilhas: caixa, acentos e espaços
+    r = rng.random()
+    if r < 0.4:
+        return chave
+    if r < 0.6:
+        return chave.lower()
+    if r < 0.75:
+        return f"  {chave}  "
+    if r < 0.9:
+        return chave.replace(" - ", " ").replace("DR ", "DR. ")
+    return chave.split(" ")[0] + " X"
+
+
+def gerar_colunas(mapas, linhas, seed=42):
+    rng = random.Random(seed)
+    colunas = {}
+    for categoria, origem in CATEGORIAS.items():
+        chaves = list(mapas.get(origem, {}).keys())
+        colunas[categoria] = [_variante(rng.choice(chaves), rng) for _ in range(linhas)]
+    return colunas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(ARQUIVO_JSON_MAPEAMENTOS, "r", encoding="utf-8") as f:
+        mapas = json.load(f)
+    colunas = gerar_colunas(mapas, args.linhas)
+
+    t0 = time.perf_counter()
+    legado = {c: [mapear(v, c, mapas) for v in vals] for c, vals in colunas.items()}
+    t_legado = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    indice = MappingIndex(mapas)
+    t_compilacao = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    novo = {c: [indice.mapear(v, c) for v in vals] for c, vals in colunas.items()}
+    t_indice = time.perf_counter() - t0
+
+    divergencias = sum(a != b for c in colunas for a, b in zip(legado[c], novo[c]))
+
+    print(f"Linhas por coluna:  {args.linhas} ({len(colunas)} colunas)")
+    print(f"mapear legado:      {t_legado:.3f}s")
+    print(f"MappingIndex:       {t_indice:.3f}s (+ {t_compilacao * 1000:.1f}ms de compilação)")
+    print(f"Speedup:            {t_legado / t_indice:.1f}x")
+    print(f"Divergências:       {divergencias}")
+    if divergencias:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Pico de memória de `processar_planilha`: aba inteira x modo em lotes.
+
+Cada medição roda num processo novo, com o SICAP trocado por um envio falso
+que só consome o corpo. O pico vem do `tracemalloc` (alocações Python e
+numpy, a partir do início do processamento); o RSS máximo do processo vai
+junto, descontado o que já estava ocupado depois dos imports. O cache de
+planilhas fica desligado para as duas leituras abrirem o Excel.
+
+O calamine guarda a aba inteira em memória nativa (só aparece no RSS); com
+SICAP_STREAMING_BACKEND=openpyxl o modo em lotes também lê o Excel em fluxo.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.bench_memoria --linhas 50000
+    python -m benchmarks.bench_memoria --arquivo planilha.xlsx --lote 2000
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.gerador import gerar_planilha
+
+
+class _Resposta:
+    status_code = 200
+    text = "{}"
+
+    def json(self):
+        return {}
+
+
+def _enviar_falso(token, payload):
+    from backend.serializacao import corpo_envio
+    corpo, _ = corpo_envio(payload)
+    if not isinstance(corpo, (bytes, bytearray)):
+        for _ in corpo:
+            pass
+    return _Resposta()
+
+
+def medir(modo, caminho, lote):
+    import resource
+    import tracemalloc
+
+    from backend import processor
+    from backend.cache_planilhas import CachePlanilhas
+
+    processor.CACHE_PLANILHAS = CachePlanilhas(pasta="0")
+    processor.fazer_login = lambda usuario, senha: "token"
+    processor.enviar_folha_pj = _enviar_falso
+    processor.carregar_indice_mapeamentos()
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    if modo == "inteiro":
+        processor.STREAMING_BYTES = 0
+        resultado = processor.processar_planilha(caminho, "u", "s", prestacao_id="1")
+    else:
+        resultado = processor.processar_em_lotes(caminho, "u", "s", prestacao_id="1", tamanho_lote=lote)
+    tempo = time.perf_counter() - t0
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss
+    return resultado["status"], pico, rss * 1024, tempo
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=50000)
+    parser.add_argument("--lote", type=int, default=5000)
+    parser.add_argument("--arquivo", help="planilha existente (senão, gerada com --linhas)")
+    args = parser.parse_args()
+
+    contexto = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = args.arquivo
+        if not caminho:
+            caminho = gerar_planilha(os.path.join(tmp, f"sintetica_{args.linhas}.xlsx"), args.linhas)
+        print(f"{os.path.basename(caminho)} ({os.path.getsize(caminho) / 2 ** 20:.1f} MB), lote de {args.lote} linhas")
+        picos = {}
+        for modo in ("inteiro", "lotes"):
+            with contexto.Pool(1) as pool:
+                status, pico, rss, tempo = pool.apply(medir, (modo, caminho, args.lote))
+            picos[modo] = pico
+            print(f"  {modo:<8} {status:<8} pico tracemalloc {pico / 2 ** 20:8.1f} MB   RSS +{rss / 2 ** 20:7.1f} MB   {tempo:6.2f}s")
+        print(f"  redução do pico: {picos['inteiro'] / picos['lotes']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
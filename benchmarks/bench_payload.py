@@ -0,0 +1,100 @@
+"""Benchmark: montagem e serialização do payload de Prestadores.
+
+Compara o caminho antigo (to_dict + varredura de NaN por registro + json da
+biblioteca padrão, como o `requests.post(json=...)` fazia) com
+`registros_prestadores` + `json_bytes` (orjson quando instalado), e mostra o
+custo do gzip opcional.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.bench_payload --linhas 5000 10000 25000 50000
+"""
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend.processor import COLUNAS_NUM, registros_prestadores
+from backend.serializacao import corpo_envio, json_bytes, orjson
+
+
+def gerar_saida(linhas, seed=42):
+    # mesmo formato do DataFrame `saida` de montar_payload, com alguns vazios
+    rng = np.random.default_rng(seed)
+    valor = rng.uniform(1000, 20000, linhas).round(2)
+    valor[rng.random(linhas) < 0.02] = np.nan
+    cns = pd.Series(rng.integers(700000000000000, 799999999999999, linhas).astype(str), dtype="str")
+    cns[rng.random(linhas) < 0.05] = np.nan
+    return pd.DataFrame({
+        "Id": 0,
+        "Nome": [f"Prestador {i}" for i in range(linhas)],
+        "NomeSocial": [f"Prestador {i}" for i in range(linhas)],
+        "CPF": rng.integers(10**10, 10**11 - 1, linhas).astype(str),
+        "DataNascimento": "1990-01-01T00:00:00",
+        "AutoDeclaracaoGenero": rng.integers(1, 4, linhas),
+        "AutoDeclaracaoRacial": rng.integers(1, 6, linhas),
+        "CargoId": rng.integers(1, 6000, linhas),
+        "NumConselhoClasse": rng.integers(1000, 999999, linhas).astype(str),
+        "CnsDoProfissional": cns,
+        "CargaHorariaSemanalId": rng.integers(1, 4, linhas),
+        "TurnoTrabalho": rng.integers(1, 6, linhas),
+        "UnidadeId": rng.integers(1, 2000, linhas),
+        "LinhaServicoId": rng.integers(1, 100, linhas),
+        "ValorPorProfissional": valor,
+        "TipoCoordenadoria": 2,
+        "TipoAtividade": 1,
+        "Especificacao": "",
+    })
+
+
+def legado(saida):
+    prestadores_lista = saida.to_dict(orient="records")
+    for prestador in prestadores_lista:
+        for key, value in list(prestador.items()):
+            if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+                if key in ["ValorPorProfissional"]:
+                    prestador[key] = 0.0
+                elif key in COLUNAS_NUM:
+                    prestador[key] = 0
+                else:
+                    prestador[key] = ""
+    return json.dumps({"Prestadores": prestadores_lista}, allow_nan=False).encode("utf-8")
+
+
+def novo(saida):
+    return json_bytes({"Prestadores": registros_prestadores(saida)})
+
+
+def _medir(fn, *args, repeticoes=3):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        resultado = fn(*args)
+        melhor = min(melhor, time.perf_counter() - t0)
+    return melhor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, nargs="+", default=[5000, 10000, 25000, 50000])
+    args = parser.parse_args()
+
+    print(f"Encoder: {'orjson' if orjson is not None else 'json (stdlib)'}")
+    print(f"{'linhas':>8} {'legado':>10} {'novo':>10} {'speedup':>8} {'gzip':>10} {'bytes':>11} {'gzip bytes':>11}")
+    for linhas in args.linhas:
+        saida = gerar_saida(linhas)
+        t_legado, corpo_legado = _medir(legado, saida)
+        t_novo, corpo_novo = _medir(novo, saida)
+        if json.loads(corpo_legado) != json.loads(corpo_novo):
+            raise SystemExit(f"Payload divergente com {linhas} linhas")
+        t_gzip, (comprimido, _) = _medir(corpo_envio, corpo_novo, True)
+        print(
+            f"{linhas:>8} {t_legado * 1000:>8.1f}ms {t_novo * 1000:>8.1f}ms {t_legado / t_novo:>7.1f}x "
+            f"{t_gzip * 1000:>8.1f}ms {len(corpo_novo):>11} {len(comprimido):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Teste de carga ponta a ponta de `/api/processar` (ou `/api/jobs`).
+
+Gera N planilhas distintas com `benchmarks.gerador` (ou a partir de um
+layout real, com `--base`), cada uma com seu Nº Nota Fiscal para que a
+idempotência não junte os envios, dispara os uploads com C clientes simultâneos e mostra as latências
+p50/p95/p99 e a vazão em jobs/s.
+
+Com `--iniciar`, sobe o SICAP falso (benchmarks/sicap_falso.py) e o backend
+apontado para ele; sem isso, usa o backend que já estiver em `--url`.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.carga --iniciar --uploads 40 --concorrencia 8 --linhas 2000
+    python -m benchmarks.carga --url http://127.0.0.1:8000 --rota jobs
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from openpyxl import Workbook, load_workbook
+
+from backend.reader import ABA_EMPRESA, ABA_PRESTADORES
+from benchmarks.gerador import gerar_planilha
+
+COLUNA_NF = "Nº Nota Fiscal"
+
+
+def _linhas_aba(book, aba):
+    rows = list(book[aba].iter_rows(values_only=True))
+    return rows[0], [r for r in rows[1:] if any(v is not None for v in r)]
+
+
+def gerar_planilhas(base, quantidade, linhas, destino):
+    """Grava `quantidade` cópias de `base` com NF distintas; 610 com `linhas` linhas."""
+    origem = load_workbook(base, read_only=True)
+    cab_emp, empresa = _linhas_aba(origem, ABA_EMPRESA)
+    cab_prest, prestadores = _linhas_aba(origem, ABA_PRESTADORES)
+    origem.close()
+    linhas = linhas or len(prestadores)
+    corpo_610 = [prestadores[i % len(prestadores)] for i in range(linhas)]
+    col_nf = list(cab_emp).index(COLUNA_NF)
+
+    caminhos = []
+    for n in range(quantidade):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(ABA_EMPRESA)
+        ws.append(cab_emp)
+        for i, row in enumerate(empresa):
+            row = list(row)
+            if i == 0:
+                row[col_nf] = 900000 + n
+            ws.append(row)
+        ws = wb.create_sheet(ABA_PRESTADORES)
+        ws.append(cab_prest)
+        for row in corpo_610:
+            ws.append(row)
+        caminho = os.path.join(destino, f"carga_{n:05d}.xlsx")
+        wb.save(caminho)
+        caminhos.append(caminho)
+    return caminhos
+
+
+def _aguardar_no_ar(url, processo, limite=30):
+    fim = time.time() + limite
+    while time.time() < fim:
+        if processo.poll() is not None:
+            raise SystemExit(f"Processo terminou ao subir ({url}).")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} não respondeu em {limite}s.")
+
+
+def iniciar_servidores(args):
+    """Sobe o SICAP falso e o backend apontado para ele; devolve os processos."""
+    url_falso = f"http://127.0.0.1:{args.porta_sicap}"
+    falso = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.sicap_falso", "--porta", str(args.porta_sicap),
+        "--latencia-envio", str(args.latencia_envio), "--erro-500", str(args.erro_500),
+        "--erro-503", str(args.erro_503),
+    ])
+    _aguardar_no_ar(f"{url_falso}/v1/_estatisticas", falso)
+
+    porta = args.url.rsplit(":", 1)[-1].strip("/")
+    env = {**os.environ, "PORT": porta, "SICAP_API_BASE_URL": f"{url_falso}/v1"}
+    backend = subprocess.Popen([sys.executable, "run.py"], env=env, stdout=subprocess.DEVNULL)
+    _aguardar_no_ar(f"{args.url}/health", backend)
+    return [falso, backend]
+
+
+def enviar(sessao, args, caminho):
+    """Um upload; devolve (latência em s, status HTTP, status do resultado)."""
+    dados = {"usuario": args.usuario, "senha": args.senha, "prestacao_id": args.prestacao_id}
+    inicio = time.perf_counter()
+    with open(caminho, "rb") as f:
+        r = sessao.post(f"{args.url}/api/{args.rota}", data=dados,
+                        files={"file": (os.path.basename(caminho), f)}, timeout=600)
+    resultado = r.json() if r.headers.get("content-type", "").startswith("application/json") else {}
+
+    if args.rota == "jobs" and r.status_code == 202:
+        job_url = f"{args.url}/api/jobs/{resultado['job_id']}"
+        while resultado.get("status") != "concluido":
+            time.sleep(args.intervalo)
+            resultado = sessao.get(job_url, timeout=30).json()
+        resultado = resultado.get("resultado") or {}
+    return time.perf_counter() - inicio, r.status_code, resultado.get("status", "?")
+
+
+def relatorio(latencias, codigos, status, duracao):
+    latencias = np.array(latencias) * 1000
+    p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+    print(f"\nuploads:     {len(latencias)} em {duracao:.2f}s")
+    print(f"vazão:       {len(latencias) / duracao:.2f} jobs/s")
+    print(f"latência:    p50 {p50:.0f}ms  p95 {p95:.0f}ms  p99 {p99:.0f}ms  máx {latencias.max():.0f}ms")
+    print(f"HTTP:        {dict(sorted(codigos.items()))}")
+    print(f"resultados:  {dict(status)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rota", choices=("processar", "jobs"), default="processar")
+    parser.add_argument("--uploads", type=int, default=40)
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--linhas", type=int, default=150, help="linhas da aba 610 (0 = as do arquivo base)")
+    parser.add_argument("--base", help="planilha real usada como layout (padrão: planilhas sintéticas)")
+    parser.add_argument("--usuario", default="carga")
+    parser.add_argument("--senha", default="carga")
+    parser.add_argument("--prestacao-id", default="921")
+    parser.add_argument("--intervalo", type=float, default=0.2, help="polling de /api/jobs/{id}, em s")
+    parser.add_argument("--iniciar", action="store_true", help="subir SICAP falso e backend")
+    parser.add_argument("--porta-sicap", type=int, default=8765)
+    parser.add_argument("--latencia-envio", type=float, default=300.0, help="ms, com --iniciar")
+    parser.add_argument("--erro-500", type=float, default=0.0, help="com --iniciar")
+    parser.add_argument("--erro-503", type=float, default=0.0, help="com --iniciar")
+    args = parser.parse_args()
+
+    processos = []
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        if args.base:
+            caminhos = gerar_planilhas(args.base, args.uploads, args.linhas, tmp)
+        else:
+            caminhos = [
+                gerar_planilha(os.path.join(tmp, f"carga_{n:05d}.xlsx"), args.linhas or 150, seed=n,
+                               nota_fiscal=900000 + n)
+                for n in range(args.uploads)
+            ]
+        print(f"{len(caminhos)} planilhas geradas em {time.perf_counter() - t0:.1f}s")
+        try:
+            if args.iniciar:
+                processos = iniciar_servidores(args)
+
+            sessoes = {}
+
+            def _enviar(caminho):
+                # uma sessão HTTP por thread cliente
+                sessao = sessoes.setdefault(threading.get_ident(), requests.Session())
+                return enviar(sessao, args, caminho)
+
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(args.concorrencia) as pool:
+                resultados = list(pool.map(_enviar, caminhos))
+            duracao = time.perf_counter() - inicio
+        finally:
+            for processo in reversed(processos):
+                processo.terminate()
+                processo.wait(10)
+
+    relatorio(
+        [r[0] for r in resultados],
+        Counter(r[1] for r in resultados),
+        Counter(r[2] for r in resultados),
+        duracao,
+    )
+
+
+if __name__ == "__main__":
+    main()
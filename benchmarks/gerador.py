@@ -0,0 +1,206 @@
+"""Gerador de planilhas 600/610 sintéticas para benchmarks e testes de carga.
+
+Mesmo layout das planilhas reais de `backend/uploads` (cabeçalhos com os
+espaços sobrando, tipos misturados nas colunas de CPF, data e valor) e o
+vocabulário de `Utils/mapeamentos.json`, escrito com as variações que aparecem
+na prática: caixa, acentos, espaços extras. CPFs e CNS saem com dígitos
+verificadores válidos, a menos que `invalidos` peça o contrário.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.gerador --linhas 100 20000 500000 --destino /tmp/planilhas
+"""
+import argparse
+import json
+import os
+import time
+import unicodedata
+from datetime import datetime
+
+import numpy as np
+from openpyxl import Workbook
+
+from backend.processor import ARQUIVO_JSON_MAPEAMENTOS
+from backend.reader import ABA_EMPRESA, ABA_PRESTADORES
+
+CABECALHO_600 = [
+    "REG", "CNPJ Empresa", "Razao Social Empresa", "Valor Bruto NF", "Nº Nota Fiscal", "PIS NF",
+    "COFINS NF", "CSLL NF", "PCC NF", "IRRF NF", "ISS NF", "INSS Retido NF", "Valor Liquido",
+    "Informações Complementares",
+]
+CABECALHO_610 = [
+    "Período", "REGISTRO", "Nº NOTA FISCAL", "CNPJ Empresa", "Nome Completo", "Nome Social",
+    "CPF Funcionário", "Data Nascimento", "Autodeclaração de Gênero", "Autodeclaração Racial",
+    "Categoria Profissional", "Função", "Plantão Mensal", "Tipo de Coordenadoria", "Tipo de Atividade",
+    "Nº Conselho de Classe", "Cns Do Profissional ", "Carga Horária Semanal/Plantão",
+    "Déficit de Carga Horária ", "Turno de Trabalho", "Unidade ", "Linha de Serviço",
+    "Valor por Profissional ",
+]
+# coluna da 610 -> categoria de mapeamentos.json de onde vem o vocabulário
+VOCABULARIO = {
+    "Autodeclaração de Gênero": "AutoDeclaracaoGenero",
+    "Autodeclaração Racial": "AutoDeclaracaoRacial",
+    "Categoria Profissional": "CargoId",
+    "Carga Horária Semanal/Plantão": "CargaHorariaSemanalId",
+    "Turno de Trabalho": "TurnoTrabalho",
+    "Unidade ": "Unidade",
+    "Linha de Serviço": "LinhasDeServico",
+}
+PRENOMES = [
+    "Ana", "Alice", "Beatriz", "Bruno", "Camila", "Carlos", "Daniela", "Eduardo", "Fernanda", "Gabriel",
+    "Giovanna", "Helena", "Isabella", "João", "Júlia", "Lucas", "Marcos", "Mariana", "Otávio", "Patrícia",
+    "Rafael", "Sérgio", "Tânia", "Vinícius",
+]
+SOBRENOMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Ferreira", "Costa", "Rodrigues", "Almeida",
+    "Nascimento", "Araújo", "Carvalho", "Gonçalves", "Fávaro", "Camargo", "de Andrade", "Escobar", "Leme",
+]
+CNPJ = "23.604.686/0001-25"
+
+
+def _sem_acentos(texto):
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+
+def variantes(chave):
+    """Grafias de `chave` que o mapeamento precisa reconhecer."""
+    return sorted({
+        chave,
+        chave.title(),
+        chave.lower(),
+        _sem_acentos(chave),
+        _sem_acentos(chave).title(),
+        f"{chave} ",
+        f" {chave.title()}  ",
+    })
+
+
+def _vocabulario(mapas, categoria, nao_mapeados, rng):
+    chaves = list(mapas.get(categoria, {}))
+    escritas = np.array([v for chave in chaves for v in variantes(chave)], dtype=object)
+    if not nao_mapeados:
+        return escritas, None
+    inventadas = np.array([f"{categoria.upper()} INEXISTENTE {i}" for i in range(5)], dtype=object)
+    return escritas, inventadas
+
+
+def _digitos_cpf(base):
+    # base: matriz (n, 9) de dígitos -> matriz (n, 11) com os verificadores
+    d1 = (base @ np.arange(10, 1, -1)) * 10 % 11 % 10
+    com_d1 = np.column_stack([base, d1])
+    d2 = (com_d1 @ np.arange(11, 1, -1)) * 10 % 11 % 10
+    return np.column_stack([com_d1, d2])
+
+
+def _digitos_cns(rng, n):
+    # CNS provisório (prefixo 7): soma ponderada de 15..1 múltipla de 11
+    corpo = rng.integers(0, 10, (n, 14))
+    while True:
+        corpo[:, 0] = 7
+        ultimo = (11 - (corpo @ np.arange(15, 1, -1)) % 11) % 11
+        sem_digito = ultimo == 10
+        if not sem_digito.any():
+            return np.column_stack([corpo, ultimo])
+        # nenhum dígito fecha a soma: sorteia essas linhas de novo
+        corpo[sem_digito] = rng.integers(0, 10, (sem_digito.sum(), 14))
+
+
+def _como_texto(digitos):
+    return ["".join(map(str, linha)) for linha in digitos]
+
+
+def linhas_prestadores(linhas, mapas, seed=42, nota_fiscal=10, invalidos=0.0, nao_mapeados=0.0):
+    """Linhas da aba 610 (listas prontas para `ws.append`)."""
+    rng = np.random.default_rng(seed)
+
+    nomes = [
+        f"{PRENOMES[a]} {SOBRENOMES[b]} {SOBRENOMES[c]}"
+        for a, b, c in zip(
+            rng.integers(0, len(PRENOMES), linhas),
+            rng.integers(0, len(SOBRENOMES), linhas),
+            rng.integers(0, len(SOBRENOMES), linhas),
+        )
+    ]
+
+    cpf_dig = _digitos_cpf(rng.integers(0, 10, (linhas, 9)))
+    trocar = rng.random(linhas) < invalidos
+    cpf_dig[trocar, 10] = (cpf_dig[trocar, 10] + 1) % 10
+    cpfs = _como_texto(cpf_dig)
+    # metade como número (o Excel perde o zero à esquerda), metade como texto
+    cpf_numerico = rng.random(linhas) < 0.5
+
+    cns_dig = _digitos_cns(rng, linhas)
+    trocar = rng.random(linhas) < invalidos
+    cns_dig[trocar, 14] = (cns_dig[trocar, 14] + 1) % 10
+    cns = [int(c) for c in _como_texto(cns_dig)]
+    cns_vazio = rng.random(linhas) < 0.05
+
+    nascimento = np.datetime64("1960-01-01") + rng.integers(0, 365 * 40, linhas).astype("timedelta64[D]")
+    data_texto = rng.random(linhas) < 0.5
+
+    valores = rng.uniform(1000, 30000, linhas).round(2)
+    valor_texto = rng.random(linhas) < 0.2
+
+    categorias = {}
+    for coluna, categoria in VOCABULARIO.items():
+        escritas, inventadas = _vocabulario(mapas, categoria, nao_mapeados, rng)
+        sorteio = escritas[rng.integers(0, len(escritas), linhas)]
+        if inventadas is not None:
+            fora = rng.random(linhas) < nao_mapeados
+            sorteio[fora] = inventadas[rng.integers(0, len(inventadas), fora.sum())]
+        categorias[coluna] = sorteio
+
+    conselho = rng.integers(100000, 999999, linhas)
+    for i in range(linhas):
+        data = nascimento[i].astype(datetime)
+        valor = valores[i]
+        yield [
+            "01/09 a 30/09", 610, nota_fiscal, CNPJ, nomes[i], nomes[i],
+            int(cpfs[i]) if cpf_numerico[i] else cpfs[i],
+            data.strftime("%d/%m/%Y\t") if data_texto[i] else datetime(data.year, data.month, data.day),
+            categorias["Autodeclaração de Gênero"][i], categorias["Autodeclaração Racial"][i],
+            categorias["Categoria Profissional"][i], None, None, "CRS", "Assistencial",
+            int(conselho[i]), None if cns_vazio[i] else cns[i],
+            categorias["Carga Horária Semanal/Plantão"][i], None,
+            categorias["Turno de Trabalho"][i], categorias["Unidade "][i], categorias["Linha de Serviço"][i],
+            f"R$ {valor:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".") if valor_texto[i] else float(valor),
+        ]
+
+
+def gerar_planilha(caminho, linhas, seed=42, nota_fiscal=10, invalidos=0.0, nao_mapeados=0.0, mapas=None):
+    """Grava uma pasta de trabalho 600/610 com `linhas` prestadores em `caminho`."""
+    if mapas is None:
+        with open(ARQUIVO_JSON_MAPEAMENTOS, "r", encoding="utf-8") as f:
+            mapas = json.load(f)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(ABA_EMPRESA)
+    ws.append(CABECALHO_600)
+    ws.append([600, CNPJ, "PERSONALMED SERVICOS MEDICOS LTDA", 231499.75, nota_fiscal,
+               None, None, None, None, None, None, None, 217262.51, None])
+    ws = wb.create_sheet(ABA_PRESTADORES)
+    ws.append(CABECALHO_610)
+    for linha in linhas_prestadores(linhas, mapas, seed, nota_fiscal, invalidos, nao_mapeados):
+        ws.append(linha)
+    wb.save(caminho)
+    return caminho
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, nargs="+", default=[100, 1000, 20000])
+    parser.add_argument("--destino", default=".")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--invalidos", type=float, default=0.0, help="fração de CPF/CNS com dígito errado")
+    parser.add_argument("--nao-mapeados", type=float, default=0.0, help="fração de categorias fora do vocabulário")
+    args = parser.parse_args()
+
+    os.makedirs(args.destino, exist_ok=True)
+    for linhas in args.linhas:
+        caminho = os.path.join(args.destino, f"sintetica_{linhas}.xlsx")
+        t0 = time.perf_counter()
+        gerar_planilha(caminho, linhas, args.seed, invalidos=args.invalidos, nao_mapeados=args.nao_mapeados)
+        print(f"{caminho}: {linhas} linhas, {os.path.getsize(caminho) / 1024:.0f} KB "
+              f"em {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Implementações originais, linha a linha, que os benchmarks (e os testes)
+usam como referência para as versões vetorizadas do backend.
+
+- `mapear`: comparado com `backend.mapping.MappingIndex.mapear`.
+- `is_valid_cpf`: comparado com `backend.documentos.cpfs_invalidos`.
+"""
+import re
+
+import pandas as pd
+
+from backend.mapping import normalizar_texto
+
+
+def mapear(valor, categoria, mapas):
+    val = normalizar_texto(valor)
+    mapa_categoria = mapas.get(categoria, {})
+
+    if categoria == "LinhaServicoId":
+        extra = mapas.get("LinhasDeServico", {})
+        if extra:
+            merged = dict(mapa_categoria)
+            merged.update(extra)
+            mapa_categoria = merged
+    try:
+        if categoria in ("LinhaServicoId", "Unidade"):
+            if isinstance(valor, (int, float)) and not pd.isna(valor):
+                return int(valor)
+            if isinstance(valor, str) and valor.strip().isdigit():
+                return int(valor.strip())
+    except Exception:
+        pass
+
+    mapa_normalizado = {normalizar_texto(k): v for k, v in mapa_categoria.items()}
+    if val in mapa_normalizado:
+        return mapa_normalizado[val]
+
+    if categoria == "CargoId":
+        for chave_orig, id_cargo in mapa_categoria.items():
+            chave_norm = normalizar_texto(chave_orig)
+            if chave_norm in val or val in chave_norm:
+                return id_cargo
+
+    if categoria == "Unidade":
+        for chave_orig, id_un in mapa_categoria.items():
+            chave_norm = normalizar_texto(chave_orig)
+            if chave_norm and (chave_norm in val or val in chave_norm):
+                return id_un
+        words_val = set(re.findall(r'\w+', val))
+        for chave_orig, id_un in mapa_categoria.items():
+            chave_norm = normalizar_texto(chave_orig)
+            words_ch = set(re.findall(r'\w+', chave_norm))
+            if words_ch and words_ch.issubset(words_val):
+                return id_un
+
+    return None
+
+
+def _only_digits(s: str) -> str:
+    return re.sub(r'\D', '', str(s or ''))
+
+
+def is_valid_cpf(cpf: str) -> bool:
+    s = _only_digits(cpf)
+    if len(s) != 11:
+        return False
+    if s == s[0] * 11:
+        return False
+    def _calc(digs):
+        ssum = sum(int(a) * b for a, b in zip(digs, range(len(digs)+1, 1, -1)))
+        rem = (ssum * 10) % 11
+        return rem if rem < 10 else 0
+    try:
+        d1 = _calc(s[:9])
+        d2 = _calc(s[:9] + str(d1))
+        return int(s[9]) == d1 and int(s[10]) == d2
+    except Exception:
+        return False
@@ -0,0 +1,217 @@
+"""SICAP falso para testes de carga e de resiliência.
+
+Implementa `Autenticacao/Login` e `FolhaPagamentoPessoaJuridica` com latência
+configurável, injeção de erros (500/503/timeout) e validação do payload da
+folha no formato que `montar_payload` gera. Nada é gravado: as contagens ficam
+em `GET /v1/_estatisticas`.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.sicap_falso --porta 8765 --latencia-envio 300 --erro-503 0.02
+    SICAP_API_BASE_URL=http://127.0.0.1:8765/v1 python run.py
+"""
+import argparse
+import asyncio
+import base64
+import gzip
+import json
+import random
+import secrets
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+CAMPOS_EMPRESA = {
+    "PrestacaoContaId": (str, int),
+    "RazaoSocialEmpresa": (str,),
+    "CnpjEmpresa": (str, int),
+    "ValorBrutoNf": (int, float),
+    "NumNotaFiscal": (str,),
+    "ValorLiquido": (int, float),
+    "Prestadores": (list,),
+}
+CAMPOS_PRESTADOR = {
+    "Nome": (str,),
+    "NomeSocial": (str,),
+    "CPF": (str,),
+    "DataNascimento": (str,),
+    "AutoDeclaracaoGenero": (int,),
+    "AutoDeclaracaoRacial": (int,),
+    "CargoId": (int,),
+    "NumConselhoClasse": (str,),
+    "CnsDoProfissional": (str,),
+    "CargaHorariaSemanalId": (int,),
+    "TurnoTrabalho": (int,),
+    "UnidadeId": (int,),
+    "LinhaServicoId": (int,),
+    "ValorPorProfissional": (int, float),
+    "TipoCoordenadoria": (int,),
+    "TipoAtividade": (int,),
+}
+# erros de validação devolvidos por envio (como uma API real, não todos)
+MAX_ERROS = 20
+
+
+@dataclass
+class Config:
+    latencia_login: float = 50.0      # ms
+    latencia_envio: float = 300.0     # ms
+    jitter: float = 0.2               # fração da latência, para mais ou para menos
+    erro_500: float = 0.0             # probabilidade por chamada
+    erro_503: float = 0.0
+    timeout: float = 0.0              # probabilidade de "pendurar" a resposta
+    duracao_timeout: float = 150.0    # s, acima do SICAP_TIMEOUT_ENVIO padrão
+    ttl_token: int = 600              # s
+    validar: bool = True
+
+
+def _token(ttl):
+    # JWT sem assinatura válida, mas com `exp`, que é o que o TokenCache lê
+    def _b64(dados):
+        return base64.urlsafe_b64encode(json.dumps(dados).encode()).decode().rstrip("=")
+
+    corpo = {"sub": "carga", "exp": int(time.time()) + ttl, "jti": secrets.token_hex(8)}
+    return f"{_b64({'alg': 'none', 'typ': 'JWT'})}.{_b64(corpo)}.x"
+
+
+def _tipo_ok(valor, tipos):
+    # bool é int para o Python, mas não para o SICAP
+    return isinstance(valor, tipos) and not isinstance(valor, bool)
+
+
+def validar_folha(payload) -> list:
+    """Erros de formato da folha, no máximo `MAX_ERROS`."""
+    if not isinstance(payload, dict):
+        return ["Corpo deve ser um objeto JSON."]
+    erros = []
+    for campo, tipos in CAMPOS_EMPRESA.items():
+        if campo not in payload:
+            erros.append(f"Campo obrigatório ausente: {campo}")
+        elif not _tipo_ok(payload[campo], tipos):
+            erros.append(f"Tipo inválido em {campo}: {type(payload[campo]).__name__}")
+    for i, prestador in enumerate(payload.get("Prestadores") or []):
+        if len(erros) >= MAX_ERROS:
+            break
+        if not isinstance(prestador, dict):
+            erros.append(f"Prestadores[{i}] deve ser um objeto.")
+            continue
+        for campo, tipos in CAMPOS_PRESTADOR.items():
+            if not _tipo_ok(prestador.get(campo), tipos):
+                erros.append(f"Prestadores[{i}].{campo} ausente ou inválido.")
+        cpf = prestador.get("CPF")
+        if isinstance(cpf, str) and not (len(cpf) == 11 and cpf.isdigit()):
+            erros.append(f"Prestadores[{i}].CPF deve ter 11 dígitos.")
+    return erros[:MAX_ERROS]
+
+
+def criar_app(config: Config) -> FastAPI:
+    app = FastAPI(title="SICAP falso")
+    tokens = {}
+    contagem = Counter()
+
+    async def _latencia(media_ms):
+        atraso = media_ms * (1 + random.uniform(-config.jitter, config.jitter))
+        await asyncio.sleep(max(0.0, atraso) / 1000)
+
+    async def _falha_injetada(rota):
+        sorteio = random.random()
+        if sorteio < config.timeout:
+            contagem[f"{rota}_timeout"] += 1
+            await asyncio.sleep(config.duracao_timeout)
+        sorteio -= config.timeout
+        if sorteio < config.erro_503:
+            contagem[f"{rota}_503"] += 1
+            return JSONResponse({"mensagem": "Serviço indisponível"}, 503, headers={"Retry-After": "1"})
+        sorteio -= config.erro_503
+        if sorteio < config.erro_500:
+            contagem[f"{rota}_500"] += 1
+            return JSONResponse({"mensagem": "Erro interno"}, 500)
+        return None
+
+    @app.post("/v1/Autenticacao/Login")
+    async def login(request: Request):
+        contagem["login"] += 1
+        await _latencia(config.latencia_login)
+        falha = await _falha_injetada("login")
+        if falha:
+            return falha
+        try:
+            dados = await request.json()
+        except ValueError:
+            dados = None
+        if not isinstance(dados, dict) or not dados.get("login") or not dados.get("senha"):
+            return JSONResponse({"mensagem": "Informe login e senha."}, 400)
+        token = _token(config.ttl_token)
+        tokens[token] = time.time() + config.ttl_token
+        return {"token": token}
+
+    @app.post("/v1/FolhaPagamentoPessoaJuridica")
+    async def folha(request: Request):
+        contagem["envio"] += 1
+        corpo = await request.body()
+        token = request.headers.get("authorization", "").removeprefix("Bearer ")
+        if tokens.get(token, 0) < time.time():
+            contagem["envio_401"] += 1
+            return JSONResponse({"mensagem": "Token inválido ou expirado."}, 401)
+
+        await _latencia(config.latencia_envio)
+        falha = await _falha_injetada("envio")
+        if falha:
+            return falha
+
+        try:
+            if request.headers.get("content-encoding") == "gzip":
+                corpo = gzip.decompress(corpo)
+            payload = json.loads(corpo)
+        except (OSError, ValueError):
+            contagem["envio_400"] += 1
+            return JSONResponse({"mensagem": "JSON inválido."}, 400)
+        if config.validar:
+            erros = await asyncio.to_thread(validar_folha, payload)
+            if erros:
+                contagem["envio_400"] += 1
+                return JSONResponse({"mensagem": "Payload inválido.", "erros": erros}, 400)
+
+        contagem["envio_ok"] += 1
+        contagem["prestadores"] += len(payload["Prestadores"])
+        return {"id": contagem["envio_ok"], "NumNotaFiscal": payload["NumNotaFiscal"],
+                "prestadores": len(payload["Prestadores"])}
+
+    @app.get("/v1/_estatisticas")
+    async def estatisticas():
+        return dict(contagem)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia-login", type=float, default=Config.latencia_login, help="ms")
+    parser.add_argument("--latencia-envio", type=float, default=Config.latencia_envio, help="ms")
+    parser.add_argument("--jitter", type=float, default=Config.jitter)
+    parser.add_argument("--erro-500", type=float, default=0.0, help="probabilidade por chamada")
+    parser.add_argument("--erro-503", type=float, default=0.0, help="probabilidade por chamada")
+    parser.add_argument("--timeout", type=float, default=0.0, help="probabilidade de não responder")
+    parser.add_argument("--sem-validacao", action="store_true")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = Config(
+        latencia_login=args.latencia_login,
+        latencia_envio=args.latencia_envio,
+        jitter=args.jitter,
+        erro_500=args.erro_500,
+        erro_503=args.erro_503,
+        timeout=args.timeout,
+        validar=not args.sem_validacao,
+    )
+    uvicorn.run(criar_app(config), host=args.host, port=args.porta, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,487 +1,434 @@
 import argparse
+import glob
 import json
-import unicodedata
+import os
 import re
+import shutil
+import signal
 import sys
-from pathlib import Path
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime
-import shutil
-import math
+from pathlib import Path
 
-import pandas as pd
-import requests
+from backend.cliente_sicap import CIRCUITO_ESPERA
+from backend.lote import LOTE_ENVIOS, LOTE_WORKERS, consolidar
+from backend.processor import (
+    MAPEAMENTOS, TOKENS, enviar_com_token, erro_interno, interpretar_resposta,
+    montar_payload, sanitize_filename,
+)
+from backend.vigia import VIGIA_INTERVALO, Vigia
+from backend.workers import PoolProcessamento
 
 # === CONFIGURAÇÕES (mesmas dos scripts originais) ===
 ARQUIVO_EXCEL_DEFAULT = "PersonalMed - PSM Santana (out.25).xlsx"
-ARQUIVO_JSON_MAPEAMENTOS = "Utils\\mapeamentos.json"
-
-# API
-API_BASE_URL = "https://sicap.prefeitura.sp.gov.br/v1"
-LOGIN_ENDPOINT = f"{API_BASE_URL}/Autenticacao/Login"
-FOLHA_PJ_ENDPOINT = f"{API_BASE_URL}/FolhaPagamentoPessoaJuridica"
+PASTA_ENVIADOS = "Enviados"
+PASTA_REJEITADOS = "Rejeitados"
 
 # Credenciais (reaproveitadas do repo)
 USUARIO = "amanda.kawauchi"
 SENHA = "Am280309#"
 
-def normalizar_texto(texto):
-    if pd.isna(texto):
-        return ""
-    texto = str(texto).strip().upper()
-    texto = unicodedata.normalize("NFKD", texto)
-    texto = "".join(c for c in texto if not unicodedata.combining(c))
-    return texto
-
-def _normalize_col_name(s):
-    return re.sub(r'[^a-z0-9]', '', str(s).lower())
-
-def find_column(df, example):
-    cols_norm = { _normalize_col_name(c): c for c in df.columns }
-    target_norm = _normalize_col_name(example)
-    if target_norm in cols_norm:
-        return cols_norm[target_norm]
-    words = re.findall(r'\w+', target_norm)
-    for norm, orig in cols_norm.items():
-        if all(w in norm for w in words):
-            return orig
-    for norm, orig in cols_norm.items():
-        if 'cns' in norm:
-            return orig
-    return None
+MESES = ["jan", "fev", "mar", "abr", "mai", "jun", "jul", "ago", "set", "out", "nov", "dez"]
 
-def sanitize_filename(s: str) -> str:
-    if s is None:
-        return ""
-    s = str(s)
-    s = re.sub(r"[\\/]+", "-", s)
-    s = re.sub(r'[:\*\?"<>|]', '', s)
-    s = re.sub(r'\s+', ' ', s).strip()
-    return s
-
-def parse_money(valor):
-    if pd.isna(valor):
-        return 0.0
-    if isinstance(valor, (int, float)):
-        return float(valor)
-    if isinstance(valor, str):
-        valor = valor.replace("R$", "").strip()
-        if "," in valor and "." in valor:
-            if valor.rindex(",") > valor.rindex("."):
-                valor = valor.replace(".", "").replace(",", ".")
-            else:
-                valor = valor.replace(",", "")
-        elif "," in valor:
-            valor = valor.replace(",", ".")
-        return float(valor)
-    return float(valor)
-
-def mapear(valor, categoria, mapas):
-    val = normalizar_texto(valor)
-    mapa_categoria = mapas.get(categoria, {})
-
-    if categoria == "LinhaServicoId":
-        extra = mapas.get("LinhasDeServico", {})
-        if extra:
-            merged = dict(mapa_categoria)
-            merged.update(extra)
-            mapa_categoria = merged
-    try:
-        if categoria in ("LinhaServicoId", "Unidade"):
-            if isinstance(valor, (int, float)) and not pd.isna(valor):
-                return int(valor)
-            if isinstance(valor, str) and valor.strip().isdigit():
-                return int(valor.strip())
-    except Exception:
-        pass
-
-    mapa_normalizado = {normalizar_texto(k): v for k, v in mapa_categoria.items()}
-    if val in mapa_normalizado:
-        return mapa_normalizado[val]
-
-    if categoria == "CargoId":
-        for chave_orig, id_cargo in mapa_categoria.items():
-            chave_norm = normalizar_texto(chave_orig)
-            if chave_norm in val or val in chave_norm:
-                return id_cargo
-
-    if categoria == "Unidade":
-        for chave_orig, id_un in mapa_categoria.items():
-            chave_norm = normalizar_texto(chave_orig)
-            if chave_norm and (chave_norm in val or val in chave_norm):
-                return id_un
-        words_val = set(re.findall(r'\w+', val))
-        for chave_orig, id_un in mapa_categoria.items():
-            chave_norm = normalizar_texto(chave_orig)
-            words_ch = set(re.findall(r'\w+', chave_norm))
-            if words_ch and words_ch.issubset(words_val):
-                return id_un
+# O processamento (leitura, mapeamento, validação, login e envio) é o mesmo do
+# backend: backend/processor.py. Aqui ficam só a escolha dos arquivos, o
+# paralelismo e os relatórios de terminal.
 
+def detectar_competencia(caminho):
+    # "(set.25)" / "(out.25)" ou "(2026-01)" no nome do arquivo -> ("set", "2025")
+    nome = Path(caminho).name
+    m = re.search(r"\(([A-Za-z]{3})[\.)](\d{2,4})?", nome)
+    if m:
+        ano = m.group(2)
+        if ano and len(ano) == 2:
+            ano = f"20{ano}"
+        return m.group(1).lower(), ano
+    m = re.search(r"\((\d{4})-(\d{2})\)", nome)
+    if m and 1 <= int(m.group(2)) <= 12:
+        return MESES[int(m.group(2)) - 1], m.group(1)
+    return None, None
+
+def prestacao_do_mes(mes, ano):
+    # mapeamentos.json guarda o PrestacaoContaId por ano e mês ({"2025": {"set": 748}})
+    mapa = MAPEAMENTOS.instantaneo().categoria("PrestacaoContaId") or {}
+    if ano and isinstance(mapa.get(ano), dict):
+        return mapa[ano].get(mes) or None
+    if isinstance(mapa.get(mes), (int, str)):
+        return mapa[mes] or None
+    # sem ano no nome: usa o ano mais recente que tenha o mês
+    for chave in sorted(mapa, reverse=True):
+        if isinstance(mapa[chave], dict) and mapa[chave].get(mes):
+            return mapa[chave][mes]
     return None
 
-def _only_digits(s: str) -> str:
-    return re.sub(r'\D', '', str(s or ''))
-
-def is_valid_cpf(cpf: str) -> bool:
-    s = _only_digits(cpf)
-    if len(s) != 11:
-        return False
-    if s == s[0] * 11:
-        return False
-    def _calc(digs):
-        ssum = sum(int(a) * b for a, b in zip(digs, range(len(digs)+1, 1, -1)))
-        rem = (ssum * 10) % 11
-        return rem if rem < 10 else 0
+def listar_planilhas(args):
+    if args.dir or args.glob:
+        padrao = os.path.join(args.dir, args.glob or "*.xlsx") if args.dir else args.glob
+        arquivos = sorted(p for p in glob.glob(padrao) if p.lower().endswith((".xlsx", ".xls")))
+        return [a for a in arquivos if not Path(a).name.startswith("~$")]
+    return [str(args.excel or ARQUIVO_EXCEL_DEFAULT)]
+
+def preparar(caminho, prestacao_manual=None, cancelado=None):
+    # roda no pool de processos: competência + montar_payload completo
+    mes, ano = detectar_competencia(caminho)
+    prestacao_id = prestacao_manual or (prestacao_do_mes(mes, ano) if mes else None)
+    if not prestacao_id:
+        motivo = "Mês não detectado no nome do arquivo" if not mes else f"Mês '{mes}/{ano or '?'}' sem PrestacaoContaId"
+        return {
+            "status": "erro",
+            "mensagem": f"{motivo}; informe --id.",
+            "detalhes": {"mes": mes, "ano": ano},
+        }
+    resultado = montar_payload(
+        caminho, mes, ano, prestacao_id, cancelado=cancelado, nome_arquivo=caminho, completo=True
+    )
+    resultado["prestacao_id"] = prestacao_id
+    return resultado
+
+def _destino_unico(dest: Path) -> Path:
+    if not dest.exists():
+        return dest
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return dest.with_name(f"{dest.stem}_{ts}{dest.suffix}")
+
+def _nome_json(caminho):
+    mes, _ = detectar_competencia(caminho)
+    return f"sicap_enviar_{sanitize_filename(Path(caminho).stem)}_{mes or 'sem_mes'}.json"
+
+def _gravar_json(payload, destino: Path):
+    with open(destino, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2, default=str)
+    return destino
+
+def _mensagens_api(o):
+    msgs = []
+    if isinstance(o, dict):
+        for k, v in o.items():
+            if isinstance(v, (str, int, float)):
+                msgs.append(f"{k}: {v}")
+            else:
+                msgs.extend(_mensagens_api(v))
+    elif isinstance(o, list):
+        for it in o:
+            msgs.extend(_mensagens_api(it))
+    elif o is not None:
+        msgs.append(str(o))
+    return msgs
+
+def _voce_quis_dizer(sugestoes, valor):
+    opcoes = (sugestoes or {}).get(valor) or []
+    if not opcoes:
+        return ""
+    return " -> você quis dizer " + ", ".join(f"'{o['nome']}' (ID {o['id']}, {o['similaridade']:.0%})" for o in opcoes) + "?"
+
+def texto_erro(arquivo, resultado):
+    # bloco para copiar e encaminhar ao responsável pela planilha
+    detalhes = resultado.get("detalhes") or {}
+    header = f"ERRO - Arquivo: {arquivo}"
+    if detalhes.get("nota_fiscal"):
+        header += f" | NumNotaFiscal: {detalhes['nota_fiscal']}"
+    linhas = ["=" * len(header), header, "=" * len(header), str(resultado.get("mensagem"))]
+    if detalhes.get("pedido_enviado"):
+        linhas.append(
+            "ATENÇÃO: o SICAP pode ter recebido esta folha. Confira no SICAP se ela foi "
+            "gravada antes de reenviar a planilha."
+        )
+
+    for problema in detalhes.get("problemas") or []:
+        linhas.append(f" - {problema}")
+    sugestoes = detalhes.get("sugestoes") or {}
+    for unidade in detalhes.get("unidades_sem_mapa") or []:
+        linhas.append(f"   unidade sem mapeamento: '{unidade}'{_voce_quis_dizer(sugestoes.get('Unidade'), unidade)}")
+    for cargo in (sugestoes.get("CargoId") or {}):
+        linhas.append(f"   cargo sem mapeamento: '{cargo}'{_voce_quis_dizer(sugestoes['CargoId'], cargo)}")
+    for campo in detalhes.get("colunas_faltantes") or []:
+        linhas.append(f"   coluna não encontrada: {campo}")
+
+    por_problema = {}
+    for linha in detalhes.get("linhas") or []:
+        por_problema.setdefault(linha["problema"], []).append(linha)
+    for problema, ocorrencias in por_problema.items():
+        linhas.append(f"\n- {problema}: {len(ocorrencias)} ocorrência(s)")
+        for l in ocorrencias[:50]:
+            linhas.append(f"   linha {l['linha']}: valor '{l['valor']}'")
+
+    if "resposta_api" in detalhes:
+        mensagens = _mensagens_api(detalhes["resposta_api"])
+        linhas.append("\nMensagens de erro retornadas pela API:")
+        for m in mensagens or [json.dumps(detalhes["resposta_api"], ensure_ascii=False)]:
+            linhas.append(f" -  {m}")
+    elif detalhes.get("erro_tecnico") or detalhes.get("erro"):
+        linhas.append(f"Detalhe técnico: {detalhes.get('erro_tecnico') or detalhes.get('erro')}")
+    return "\n".join(linhas) + "\n"
+
+def imprimir_erro(arquivo, resultado):
+    print("\n" + texto_erro(arquivo, resultado), end="")
+
+def enviar_planilha(caminho, preparado, args):
+    # thread de envio: token compartilhado (TokenCache) e cliente SICAP com backoff
+    inicio = time.time()
     try:
-        d1 = _calc(s[:9])
-        d2 = _calc(s[:9] + str(d1))
-        return int(s[9]) == d1 and int(s[10]) == d2
-    except Exception:
-        return False
-
-def fazer_login():
-    print(" Fazendo login na API SICAP...")
-    payload = {"login": USUARIO, "senha": SENHA}
-    headers = {"Content-Type": "application/json"}
-    r = requests.post(LOGIN_ENDPOINT, json=payload, headers=headers)
-    r.raise_for_status()
-    data = r.json()
-    token = data.get("token") or data.get("Token") or data.get("access_token") or data.get("accessToken")
-    if not token:
-        raise ValueError("Token não encontrado na resposta da API")
-    print(" Login realizado com sucesso!")
-    return token
-
-def enviar_folha_pj(token, payload):
-    print("\n Enviando folha de pagamento para SICAP...")
-    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
-    # envia e captura resposta mesmo em caso de erro (status >=400)
-    r = requests.post(FOLHA_PJ_ENDPOINT, json=payload, headers=headers)
-    api_num = None
-    resultado = None
+        payload = preparado["payload"]
+        r = enviar_com_token(args.usuario, args.senha, payload)
+        resultado = interpretar_resposta(r, payload, inicio)
+    except Exception as e:
+        return erro_interno(e)
+    if resultado["status"] != "sucesso":
+        return resultado
+
+    enviados = Path(args.enviados)
+    enviados.mkdir(parents=True, exist_ok=True)
+    origem = Path(caminho)
+    if origem.exists():
+        destino = _destino_unico(enviados / origem.name)
+        shutil.move(str(origem), str(destino))
+        resultado["detalhes"]["movido_para"] = str(destino)
+    if args.save_on_success:
+        destino_json = _destino_unico(enviados / _nome_json(caminho))
+        resultado["detalhes"]["json"] = str(_gravar_json(payload, destino_json))
+    return resultado
+
+def processar(arquivos, args):
+    """Lê/valida as planilhas em paralelo e envia as válidas assim que ficam prontas."""
+    resultados = {}
+    pool = None
+    if len(arquivos) > 1:
+        workers = min(args.workers, len(arquivos))
+        pool = PoolProcessamento(modo="process", workers=workers, max_jobs=len(arquivos))
+        print(f"Lendo {len(arquivos)} planilha(s) com {workers} processo(s)...")
+
+    def _preparar(caminho):
+        if pool is None:
+            # um arquivo só: sem subir processos
+            future = Future()
+            future.set_result(preparar(caminho, args.id))
+            return future
+        future, _ = pool.submeter(preparar, caminho, args.id)
+        return future
+
+    envios = ThreadPoolExecutor(max_workers=args.envios, thread_name_prefix="envio")
     try:
-        resultado = r.json()
-    except ValueError:
-        resultado = None
-
-    # imprime resposta bruta para debugging (JSON ou texto)
-    if resultado is not None:
+        preparando = {_preparar(c): c for c in arquivos}
+        login = None
+        enviando = {}
+        for future in as_completed(preparando):
+            caminho = preparando[future]
+            try:
+                preparado = future.result()
+            except Exception as e:
+                preparado = erro_interno(e)
+            if preparado["status"] != "valido":
+                resultados[caminho] = preparado
+                print(f"[rejeitada] {caminho}: {preparado['mensagem']}")
+                continue
+
+            if args.dry_run:
+                destino = _gravar_json(preparado["payload"], Path(_nome_json(caminho)))
+                resultados[caminho] = {
+                    "status": "sucesso",
+                    "mensagem": f"JSON gerado em {destino}, sem envio (--dry-run).",
+                    "detalhes": {"prestadores": preparado["detalhes"]["prestadores"]},
+                }
+                print(f"[dry-run]   {caminho}: {destino}")
+                continue
+
+            if login is None:
+                # um único login para o lote inteiro; os envios reaproveitam o token
+                print(" Fazendo login na API SICAP...")
+                try:
+                    TOKENS.obter(args.usuario, args.senha)
+                    login = True
+                    print(" Login realizado com sucesso!")
+                except Exception as e:
+                    login = e
+                    print(f" Falha no login: {e}")
+            if login is not True:
+                resultados[caminho] = {"status": "erro", "mensagem": f"Falha no login: {login}"}
+                continue
+            print(f"[enviando]  {caminho} ({preparado['detalhes']['prestadores']} prestadores)")
+            enviando[envios.submit(enviar_planilha, caminho, preparado, args)] = caminho
+
+        for future in as_completed(enviando):
+            caminho = enviando[future]
+            resultados[caminho] = future.result()
+            status = "enviada" if resultados[caminho]["status"] == "sucesso" else "erro"
+            print(f"[{status}]{' ' * (10 - len(status))}{caminho}: {resultados[caminho]['mensagem']}")
+    finally:
+        envios.shutdown(wait=True)
+        if pool is not None:
+            pool.encerrar()
+    return [(c, resultados[c]) for c in arquivos]
+
+def relatorio(resultados, inicio, dry_run=False):
+    arquivos = [
+        {"arquivo": c, "status": r.get("status"), "mensagem": r.get("mensagem"), "detalhes": r.get("detalhes")}
+        for c, r in resultados
+    ]
+    consolidado = consolidar(arquivos, inicio)
+
+    for caminho, resultado in resultados:
+        if resultado.get("status") != "sucesso":
+            imprimir_erro(caminho, resultado)
+
+    print("\n" + "=" * 72)
+    print("RELATÓRIO")
+    print("=" * 72)
+    for caminho, resultado in resultados:
+        detalhes = resultado.get("detalhes") or {}
+        prestadores = detalhes.get("prestadores_enviados", detalhes.get("prestadores", ""))
+        print(f"{resultado.get('status', '?'):<8} {prestadores!s:>6}  {Path(caminho).name}")
+        if detalhes.get("movido_para"):
+            print(f"{'':16}movida para {detalhes['movido_para']}")
+    print("-" * 72)
+    print(f"{consolidado['mensagem']} Tempo total: {consolidado['detalhes']['tempo']}")
+    if dry_run:
+        print("--dry-run ativo: nenhuma planilha foi enviada ao SICAP.")
+    return consolidado
+
+def rejeitar(caminho, resultado, pasta):
+    # planilha vai para Rejeitados/ com o relatório de erro ao lado (<nome>.erro.txt)
+    rejeitados = Path(pasta)
+    rejeitados.mkdir(parents=True, exist_ok=True)
+    destino = _destino_unico(rejeitados / Path(caminho).name)
+    shutil.move(str(caminho), str(destino))
+    relatorio_erro = destino.with_name(f"{destino.name}.erro.txt")
+    relatorio_erro.write_text(
+        f"{datetime.now():%d/%m/%Y %H:%M:%S}\n" + texto_erro(Path(caminho).name, resultado), encoding="utf-8"
+    )
+    return destino, relatorio_erro
+
+def _transitorio(resultado):
+    # SICAP fora do ar ou circuito aberto e a folha certamente não saiu: a
+    # planilha fica na pasta e é tentada de novo. Timeout ou 5xx depois do
+    # envio vão para Rejeitados/ (reenviar poderia duplicar a folha).
+    return (resultado.get("detalhes") or {}).get("pedido_enviado") is False
+
+def _log(mensagem):
+    print(f"[{datetime.now():%H:%M:%S}] {mensagem}", flush=True)
+
+def vigiar(args):
+    """Modo serviço: processa cada planilha que chega em `args.watch`.
+
+    O pool de processos sobe uma vez (pandas e mapeamentos já carregados), e
+    cada planilha paga só o próprio processamento. Enviadas vão para
+    --enviados; recusadas (planilha ou SICAP) vão para --rejeitados com o
+    relatório de erro. Com o SICAP indisponível a planilha continua na pasta e
+    é tentada de novo depois de SICAP_CIRCUITO_ESPERA segundos.
+    """
+    vigia = Vigia(args.watch)
+    args.enviados = args.enviados or os.path.join(args.watch, PASTA_ENVIADOS)
+    args.rejeitados = args.rejeitados or os.path.join(args.watch, PASTA_REJEITADOS)
+    pool = PoolProcessamento(modo="process", workers=args.workers, max_jobs=args.workers * 4)
+    # os processos do pool herdam SIG_IGN: Ctrl+C/SIGTERM no grupo não os derruba
+    # no meio de uma planilha; quem encerra o pool é o processo principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    pool.iniciar()
+    # threads que acompanham cada planilha; os envios ao SICAP são limitados à parte
+    coordenacao = ThreadPoolExecutor(max_workers=pool.max_jobs, thread_name_prefix="planilha")
+    vagas_envio = threading.Semaphore(args.envios)
+    parar = threading.Event()
+    em_andamento = set()
+
+    def _encerrar(signum, _frame):
+        _log(f"Sinal {signal.Signals(signum).name}: terminando as planilhas em andamento...")
+        parar.set()
+
+    signal.signal(signal.SIGINT, _encerrar)
+    signal.signal(signal.SIGTERM, _encerrar)
+
+    def tratar(caminho):
+        nome = Path(caminho).name
+        inicio = time.time()
         try:
-            print(f"Resposta da API: {json.dumps(resultado, indent=2, ensure_ascii=False)}")
-        except Exception:
-            print(f"Resposta da API (json parse ok, but print failed): {resultado}")
-        if isinstance(resultado, dict) and resultado.get("NumNotaFiscal"):
-            api_num = resultado.get("NumNotaFiscal")
-    else:
-        txt = r.text.strip()
-        if txt:
-            print(f"Resposta da API (texto): {txt}")
-
-    # se houve erro HTTP, exiba também o código para ajudar no diagnóstico
-    sent_num = payload.get("NumNotaFiscal")
-    total_prest = len(payload.get("Prestadores", []))
-    if r.status_code >= 400:
-        print(f"ERRO HTTP {r.status_code} ao enviar (ver resposta acima).\nTotal de prestadores no payload: {total_prest}\nNumNotaFiscal (payload): {sent_num}")
-    else:
-        if api_num is not None:
-            print(f"NumNotaFiscal retornado pela API: {api_num}")
+            future, _ = pool.submeter(preparar, caminho, args.id)
+            resultado = future.result()
+            if resultado["status"] == "valido" and args.dry_run:
+                destino = _gravar_json(resultado["payload"], Path(_nome_json(caminho)))
+                _log(f"[dry-run]   {nome}: {destino}")
+                return
+            if resultado["status"] == "valido":
+                TOKENS.obter(args.usuario, args.senha)
+                with vagas_envio:
+                    resultado = enviar_planilha(caminho, resultado, args)
+        except Exception as e:
+            resultado = erro_interno(e)
+
+        if resultado["status"] == "sucesso":
+            _log(f"[enviada]   {nome}: {resultado['mensagem']} ({time.time() - inicio:.1f}s)")
+        elif _transitorio(resultado):
+            vigia.adiar(caminho, CIRCUITO_ESPERA)
+            _log(f"[adiada]    {nome}: {resultado['mensagem']} (nova tentativa em {CIRCUITO_ESPERA:.0f}s)")
         else:
-            print(f"NumNotaFiscal (do payload): {sent_num}")
-        print(f"Total de prestadores enviados: {total_prest}")
+            destino, relatorio_erro = rejeitar(caminho, resultado, args.rejeitados)
+            _log(f"[rejeitada] {nome}: {resultado['mensagem']} -> {relatorio_erro}")
+
+    def concluir(future, caminho):
+        em_andamento.discard(caminho)
+        if future.exception() is not None:
+            _log(f"[erro]      {Path(caminho).name}: {future.exception()}")
 
-    return r
+    _log(f"Vigiando {vigia.pasta} ({vigia.modo}, {args.workers} processo(s), {args.envios} envio(s) simultâneo(s))")
+    _log(f"Enviadas -> {args.enviados}; rejeitadas -> {args.rejeitados}")
+    try:
+        while not parar.is_set():
+            # espera curta para o sinal de parada ser atendido logo
+            for caminho in vigia.aguardar(timeout=1.0):
+                if len(em_andamento) >= pool.max_jobs:
+                    vigia.adiar(caminho, VIGIA_INTERVALO)
+                    continue
+                _log(f"[recebida]  {Path(caminho).name}")
+                em_andamento.add(caminho)
+                coordenacao.submit(tratar, caminho).add_done_callback(lambda f, c=caminho: concluir(f, c))
+    finally:
+        coordenacao.shutdown(wait=True)
+        pool.encerrar()
+        vigia.fechar()
+        _log("Serviço encerrado.")
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--excel", help="Caminho para a planilha Excel (opcional)")
+    parser.add_argument("--dir", help="Pasta com as planilhas a enviar (todas as .xlsx, ou as de --glob)")
+    parser.add_argument("--glob", help="Padrão de arquivos, ex.: 'Planilhas/*(out.25).xlsx'")
     parser.add_argument("--id", help="ID da Prestação de Contas manual (ignora mapeamento)")
     parser.add_argument("--dry-run", action="store_true", help="Gerar JSON apenas, sem enviar")
     parser.add_argument("--save-on-success", action="store_true", help="Salvar JSON e mover planilha para Enviados apenas se o envio for bem-sucedido")
+    parser.add_argument("--workers", type=int, default=LOTE_WORKERS, help="Processos de leitura no modo pasta")
+    parser.add_argument("--envios", type=int, default=LOTE_ENVIOS, help="Envios simultâneos ao SICAP")
+    parser.add_argument("--enviados", help=f"Pasta para onde vão as planilhas enviadas (padrão: {PASTA_ENVIADOS}, ou dentro da pasta de --watch)")
+    parser.add_argument("--watch", metavar="PASTA", help="Modo serviço: vigia a pasta e envia cada planilha que chegar")
+    parser.add_argument("--rejeitados", help=f"Com --watch: pasta das planilhas recusadas (padrão: <PASTA>/{PASTA_REJEITADOS})")
+    parser.add_argument("--usuario", default=os.environ.get("SICAP_USUARIO", USUARIO))
+    parser.add_argument("--senha", default=os.environ.get("SICAP_SENHA", SENHA))
     args = parser.parse_args()
 
-    excel_path = args.excel or ARQUIVO_EXCEL_DEFAULT
-    excel_path = str(excel_path)
-    if not Path(excel_path).exists():
-        print(f"Arquivo Excel não encontrado: {excel_path}")
-        sys.exit(1)
-
-    with open(ARQUIVO_JSON_MAPEAMENTOS, "r", encoding="utf-8") as f:
-        MAPAS = json.load(f)
+    if args.watch:
+        if not Path(args.watch).is_dir():
+            print(f"Pasta não encontrada: {args.watch}")
+            sys.exit(1)
+        vigiar(args)
+        return
+    args.enviados = args.enviados or PASTA_ENVIADOS
 
-    m = re.search(r"\(([A-Za-z]{3})[\.)]", excel_path)
-    if m:
-        mes_ref = m.group(1).lower()
-        print(f"Mês detectado automaticamente a partir do nome do arquivo: '{mes_ref}'")
-    else:
-        print("Não foi possível detectar mês no nome do arquivo. Passe --excel com padrão (xxx.yy) ou ajuste o nome.")
+    arquivos = listar_planilhas(args)
+    if not arquivos:
+        print(f"Nenhuma planilha encontrada em: {args.glob or args.dir}")
         sys.exit(1)
-
-    prestacao_id = args.id
-    if prestacao_id:
-        print(f"Usando ID de Prestação manual: {prestacao_id}")
-    else:
-        prestacao_id = MAPAS["PrestacaoContaId"].get(mes_ref)
-        if prestacao_id is None:
-            raise ValueError(f"Mês '{mes_ref}' não encontrado no JSON de mapeamentos e nenhum --id foi informado.")
-        print(f"ID detectado automaticamente: {prestacao_id}")
-
-    ABA_EMPRESA = "600"
-    ABA_PRESTADORES = "610"
-    df_emp = pd.read_excel(excel_path, sheet_name=ABA_EMPRESA)
-    df = pd.read_excel(excel_path, sheet_name=ABA_PRESTADORES)
-
-    empresa = {
-        "Id": 4623,
-        "ParceriaId": 31,
-        "PrestacaoContaId": prestacao_id,
-        "RazaoSocialEmpresa": df_emp.loc[0, "Razao Social Empresa"],
-        "CnpjEmpresa": df_emp.loc[0, "CNPJ Empresa"],
-        "ValorBrutoNf": parse_money(df_emp.loc[0, "Valor Bruto NF"]),
-        "NumNotaFiscal": str(int(float(df_emp.loc[0, "Nº Nota Fiscal"]))),
-        "ValorLiquido": parse_money(df_emp.loc[0, "Valor Liquido"])
-    }
-
-    expected = {
-        "Nome": "Nome Completo",
-        "NomeSocial": "Nome Social",
-        "CPF": "CPF Funcionário",
-        "DataNascimento": "Data Nascimento",
-        "AutoDeclaracaoGenero": "Autodeclaração de Gênero",
-        "AutoDeclaracaoRacial": "Autodeclaração Racial",
-        "CargoId": "Categoria Profissional",
-        "NumConselhoClasse": "Nº Conselho de Classe",
-        "CnsDoProfissional": "Cns Do Profissional",
-        "CargaHorariaSemanalId": "Carga Horária Semanal/Plantão",
-        "TurnoTrabalho": "Turno de Trabalho",
-        "Unidade": "Unidade",
-        "LinhaServicoId": "Linha de Serviço",
-        "ValorPorProfissional": "Valor por Profissional",
-        "TipoCoordenadoria": "Tipo de Coordenadoria",
-        "TipoAtividade": "Tipo de Atividade"
-    }
-
-    cols = {}
-    for key, example in expected.items():
-        col = find_column(df, example)
-        if not col:
-            raise KeyError(f"Coluna esperada '{example}' (para '{key}') não encontrada. Colunas disponíveis: {', '.join(map(str, df.columns))}")
-        cols[key] = col
-
-    const_tipo_coordenadoria = mapear("SEMPRE", "TipoCoordenadoria", MAPAS) or 0
-    const_tipo_atividade = mapear("SEMPRE", "TipoAtividade", MAPAS) or 0
-
-    primeira_unidade = df[cols["Unidade"]].iloc[0]
-    nome_unidade = primeira_unidade.replace("PSM ", "").replace(" - LAURO RIBAS BRAGA", "").strip()
-    nome_unidade_safe = sanitize_filename(nome_unidade) or mes_ref
-    saida_json_name = f"sicap_enviar_{nome_unidade_safe}_{mes_ref}.json"
-
-    saida = pd.DataFrame({
-        "Id": 0,
-        "Nome": df[cols["Nome"]].astype(str).str.strip(),
-        "NomeSocial": df[cols["NomeSocial"]].astype(str).str.strip(),
-        "CPF": df[cols["CPF"]].astype(str).str.replace(r'\D', '', regex=True).str.zfill(11),
-        "DataNascimento": pd.to_datetime(df[cols["DataNascimento"]], errors="coerce", dayfirst=True).apply(lambda x: x.strftime("%Y-%m-%dT00:00:00") if pd.notna(x) else "1900-01-01T00:00:00"),
-        "AutoDeclaracaoGenero": df[cols["AutoDeclaracaoGenero"]].apply(lambda x: mapear(x, "AutoDeclaracaoGenero", MAPAS)),
-        "AutoDeclaracaoRacial": df[cols["AutoDeclaracaoRacial"]].apply(lambda x: mapear(x, "AutoDeclaracaoRacial", MAPAS)),
-        "CargoId": df[cols["CargoId"]].apply(lambda x: mapear(x, "CargoId", MAPAS)),
-        "NumConselhoClasse": df[cols["NumConselhoClasse"]].astype(str).str.strip(),
-        "CnsDoProfissional": df[cols["CnsDoProfissional"]].astype(str).str.strip(),
-        "CargaHorariaSemanalId": df[cols["CargaHorariaSemanalId"]].apply(lambda x: mapear(x, "CargaHorariaSemanalId", MAPAS)),
-        "TurnoTrabalho": df[cols["TurnoTrabalho"]].apply(lambda x: mapear(x, "TurnoTrabalho", MAPAS)),
-        "UnidadeId": df[cols["Unidade"]].apply(lambda x: mapear(x, "Unidade", MAPAS)),
-        "LinhaServicoId": df[cols["LinhaServicoId"]].apply(lambda x: mapear(x, "LinhaServicoId", MAPAS)),
-        "ValorPorProfissional": df[cols["ValorPorProfissional"]].apply(parse_money),
-        "TipoCoordenadoria": [const_tipo_coordenadoria] * len(df),
-        "TipoAtividade": [const_tipo_atividade] * len(df),
-        "Especificacao": ""
-    })
-
-    colunas_num = [
-        "AutoDeclaracaoGenero", "AutoDeclaracaoRacial", "CargoId",
-        "CargaHorariaSemanalId", "TurnoTrabalho", "UnidadeId",
-        "LinhaServicoId", "TipoCoordenadoria", "TipoAtividade"
-    ]
-    for col in colunas_num:
-        saida[col] = pd.to_numeric(saida[col], errors="coerce").fillna(0).astype(int)
-
-    orig_unidades = df[cols["Unidade"]].astype(str).fillna("").str.strip()
-    unmapped = sorted(set(orig_unidades[saida["UnidadeId"] == 0].unique()))
-    unmapped = [u for u in unmapped if u != "" and u.upper() != "NAN"]
-    if unmapped:
-        print("\n🚨 ERRO: Há unidades sem mapeamento (UnidadeId = 0). Atualize Utils/mapeamentos.json")
-        for u in unmapped[:50]:
-            print(f"   - '{u}'")
+    faltando = [a for a in arquivos if not Path(a).exists()]
+    if faltando:
+        print(f"Arquivo Excel não encontrado: {', '.join(faltando)}")
         sys.exit(1)
+    if args.id:
+        print(f"Usando ID de Prestação manual: {args.id}")
 
-    # validações extras antes do envio: CargoId, LinhaServicoId, CPF
-    problemas = []
-
-    # cargos sem id
-    mask_cargo0 = saida['CargoId'] == 0
-    if mask_cargo0.any():
-        indices = list(saida[mask_cargo0].index)
-        linhas = []
-        for i in indices:
-            excel_row = i + 2
-            nome = df.at[i, cols['Nome']]
-            orig_cargo = df.at[i, cols['CargoId']]
-            linhas.append((excel_row, nome, orig_cargo))
-        problemas.append(('CargoId ausente', linhas))
-
-    # linha de serviço sem id
-    mask_linha0 = saida['LinhaServicoId'] == 0
-    if mask_linha0.any():
-        indices = list(saida[mask_linha0].index)
-        linhas = []
-        for i in indices:
-            excel_row = i + 2
-            nome = df.at[i, cols['Nome']]
-            orig_val = df.at[i, cols['LinhaServicoId']]
-            linhas.append((excel_row, nome, orig_val))
-        problemas.append(('LinhaServicoId ausente', linhas))
-
-    # CPF inválido — validar usando CPF já normalizado/zero-filled em `saida`
-    mask_cpf_inv = []
-    cpf_series = saida['CPF'].astype(str).fillna("")
-    for i, raw in cpf_series.items():
-        if not is_valid_cpf(raw):
-            mask_cpf_inv.append(i)
-    if mask_cpf_inv:
-        linhas = []
-        for i in mask_cpf_inv:
-            excel_row = i + 2
-            nome = df.at[i, cols['Nome']]
-            raw_orig = df.at[i, cols['CPF']]
-            cleaned = saida.at[i, 'CPF']
-            linhas.append((excel_row, nome, f"{raw_orig} -> {cleaned}"))
-        problemas.append(('CPF inválido', linhas))
-
-    if problemas:
-        header = f"ERROS DE VALIDAÇÃO ANTES DO ENVIO - Arquivo: {excel_path}"
-        print('\n' + '='*len(header))
-        print(header)
-        print('='*len(header))
-        for tipo, linhas in problemas:
-            print(f"\n- {tipo}: {len(linhas)} ocorrência(s)")
-            for r, nome, val in linhas[:50]:
-                print(f"   linha {r}: {nome} | valor: '{val}'")
-        print('\nCopie e cole o bloco acima para o responsável corrigir a planilha.')
+    inicio = time.time()
+    resultados = processar(arquivos, args)
+    consolidado = relatorio(resultados, inicio, args.dry_run)
+    if consolidado["status"] != "sucesso":
         sys.exit(1)
 
-    prestadores_lista = saida.to_dict(orient="records")
-    for prestador in prestadores_lista:
-        for key, value in list(prestador.items()):
-            if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
-                if key in ["ValorPorProfissional"]:
-                    prestador[key] = 0.0
-                elif key in colunas_num:
-                    prestador[key] = 0
-                else:
-                    prestador[key] = ""
-
-    payload = {**empresa, "Prestadores": prestadores_lista}
-    for key, value in list(payload.items()):
-        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
-            if key in ["ValorBrutoNf", "ValorLiquido"]:
-                payload[key] = 0.0
-            else:
-                payload[key] = ""
-
-    payload["SourceArquivo"] = excel_path
-
-    out_path = Path(saida_json_name)
-
-    print(f"Total de prestadores: {len(prestadores_lista)}")
-
-    # Opções de salvamento: por padrão envia em memória e NÃO salva o JSON
-    # para compatibilidade com solicitações que não queiram arquivos.
-    # --dry-run: gera o JSON e não envia (útil para inspeção)
-    # --save-on-success: salva o JSON e move a planilha para Enviados apenas se o envio for bem-sucedido
-    if args.dry_run:
-        # grava o JSON para inspeção quando em dry-run
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
-        print(f"--dry-run ativo: JSON gerado em {out_path}, sem envio.")
-        return
-
-    token = fazer_login()
-    resp = enviar_folha_pj(token, payload)
-    if resp is not None and resp.ok:
-        enviados_dir = Path("Enviados")
-        enviados_dir.mkdir(parents=True, exist_ok=True)
-
-        def _unique_target(dest: Path) -> Path:
-            if not dest.exists():
-                return dest
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            return dest.with_name(f"{dest.stem}_{ts}{dest.suffix}")
-
-        # mover sempre a planilha após envio bem-sucedido
-        src_x = Path(payload.get("SourceArquivo"))
-        if src_x.exists():
-            tgt_x = enviados_dir / src_x.name
-            tgt_x = _unique_target(tgt_x)
-            shutil.move(str(src_x), str(tgt_x))
-            print(f"Planilha movida para: {tgt_x}")
-        else:
-            print(f"Planilha não encontrada para mover: {payload.get('SourceArquivo')}")
-
-        # somente salvar o JSON se solicitado
-        if args.save_on_success:
-            # grava JSON apenas após sucesso
-            with open(out_path, "w", encoding="utf-8") as f:
-                json.dump(payload, f, ensure_ascii=False, indent=2)
-
-            tgt_json = enviados_dir / out_path.name
-            tgt_json = _unique_target(tgt_json)
-            shutil.move(str(out_path), str(tgt_json))
-            print(f"Arquivo JSON movido para: {tgt_json}")
-    else:
-        # resumo amigável e copiable para encaminhar ao responsável
-        resp_text = None
-        resp_json = None
-        try:
-            resp_json = resp.json()
-        except Exception:
-            resp_text = resp.text
-
-        header = f"ERRO NO ENVIO - Arquivo: {excel_path} | NumNotaFiscal: {payload.get('NumNotaFiscal')}"
-        print('\n' + '='*len(header))
-        print(header)
-        print('='*len(header))
-
-        print(f"HTTP status: {resp.status_code}")
-        print(f"Total de prestadores no payload: {len(payload.get('Prestadores', []))}")
-
-        if resp_json is not None:
-            # tenta extrair mensagens/erros do JSON
-            def _collect_messages(o):
-                msgs = []
-                if isinstance(o, dict):
-                    for k, v in o.items():
-                        if isinstance(v, (str, int, float)):
-                            msgs.append(f"{k}: {v}")
-                        else:
-                            msgs.extend(_collect_messages(v))
-                elif isinstance(o, list):
-                    for it in o:
-                        msgs.extend(_collect_messages(it))
-                else:
-                    msgs.append(str(o))
-                return msgs
-
-            messages = _collect_messages(resp_json)
-            if messages:
-                print("\nMensagens de erro retornadas pela API:")
-                for m in messages:
-                    print(" - ", m)
-            else:
-                print("Resposta JSON sem mensagens legíveis; veja a resposta completa abaixo:")
-                print(json.dumps(resp_json, ensure_ascii=False, indent=2))
-        else:
-            print("Resposta da API (texto):")
-            print(resp_text)
-
-        print('\nCopie e cole o bloco acima para o responsável corrigir a planilha ou diagnosticar o erro.')
-
 if __name__ == '__main__':
     main()
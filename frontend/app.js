@@ -15,7 +15,18 @@ document.addEventListener('DOMContentLoaded', () => {
     const userInput = document.getElementById('sicap-user');
     const passInput = document.getElementById('sicap-pass');
 
+    const validarInput = document.getElementById('somente-validar');
+
     let isFileValid = false;
+    let selectedFiles = [];
+
+    // No modo validação não há login: usuário e senha deixam de ser obrigatórios
+    validarInput.addEventListener('change', () => {
+        const validar = validarInput.checked;
+        userInput.required = !validar;
+        passInput.required = !validar;
+        submitBtn.textContent = validar ? 'Validar planilha' : 'Enviar para SICAP';
+    });
 
     // Drag & Drop
     ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
@@ -69,27 +80,38 @@ document.addEventListener('DOMContentLoaded', () => {
 
     function handleFiles(files) {
         if (files.length > 0) {
-            const file = files[0];
-            if (validateFile(file)) {
-                fileNameDisplay.textContent = file.name;
-                fileLabel.textContent = "Arquivo selecionado:";
+            const lista = Array.from(files);
+            if (lista.every(validateFile)) {
+                // guardado aqui porque arquivos soltos no drop não entram em fileInput.files
+                selectedFiles = lista;
+                fileNameDisplay.innerHTML = '';
+                lista.forEach(f => {
+                    const linha = document.createElement('div');
+                    linha.textContent = f.name;
+                    fileNameDisplay.appendChild(linha);
+                });
+                fileLabel.textContent = lista.length > 1
+                    ? `${lista.length} arquivos selecionados:`
+                    : "Arquivo selecionado:";
                 document.querySelector('.file-info').style.display = 'block';
                 isFileValid = true;
                 checkFormValidity();
                 submitBtn.classList.add('pulse');
+                if (!validarInput.checked) verificarSicap();
             }
         }
     }
 
     function validateFile(file) {
-        const validExtensions = ['.xlsx', '.xls'];
+        const validExtensions = ['.xlsx', '.xls', '.zip'];
         const fileName = file.name.toLowerCase();
         const isValid = validExtensions.some(ext => fileName.endsWith(ext));
 
         if (!isValid) {
-            showStatus('Apenas arquivos .xlsx ou .xls são permitidos.', 'error');
+            showStatus(`Arquivo não permitido: ${file.name}. Use .xlsx, .xls ou .zip.`, 'error');
             fileInput.value = ''; // Clear input
             fileNameDisplay.textContent = '';
+            selectedFiles = [];
             isFileValid = false;
             checkFormValidity();
             return false;
@@ -98,6 +120,11 @@ document.addEventListener('DOMContentLoaded', () => {
         return true;
     }
 
+    // Uma planilha só vai para /api/jobs; várias ou um .zip, para /api/lotes
+    function ehLote(files) {
+        return files.length > 1 || files[0].name.toLowerCase().endsWith('.zip');
+    }
+
     function getSelectedRadio(name) {
         const radios = document.getElementsByName(name);
         for (let r of radios) {
@@ -110,15 +137,24 @@ document.addEventListener('DOMContentLoaded', () => {
     form.addEventListener('submit', async (e) => {
         e.preventDefault(); // Impede reload, mas navegador entende como submissão
 
-        const file = fileInput.files[0];
+        const files = selectedFiles;
         const user = userInput.value.trim();
         const pass = passInput.value.trim();
         const prestacaoIdManual = document.getElementById('prestacao-id').value.trim();
 
-        if (!file) {
+        if (files.length === 0) {
             showStatus('Selecione um arquivo Excel.', 'error');
             return;
         }
+        if (validarInput.checked) {
+            if (!prestacaoIdManual) {
+                showStatus('Informe o ID da Prestação de Contas.', 'error');
+                return;
+            }
+            await validarArquivos(files, prestacaoIdManual);
+            return;
+        }
+
         // Validação HTML5 'required' já deve ter cuidado de user/pass/id, mas checamos por segurança
         if (!user || !pass || !prestacaoIdManual) {
             showStatus('Preencha todas as informações obrigatórias (Usuário, Senha e ID).', 'error');
@@ -128,39 +164,42 @@ document.addEventListener('DOMContentLoaded', () => {
         // Reset UI
         submitBtn.disabled = true;
         submitBtn.classList.remove('pulse');
-        showStatus('Autenticando e enviando... Isso pode levar alguns minutos.', 'loading');
+        const lote = ehLote(files);
+        showStatus(lote ? 'Enviando planilhas ao servidor...' : 'Enviando planilha ao servidor...', 'loading');
 
         const formData = new FormData();
-        formData.append('file', file);
+        if (lote) {
+            files.forEach(f => formData.append('files', f));
+        } else {
+            formData.append('file', files[0]);
+        }
         formData.append('usuario', user);
         formData.append('senha', pass);
         // mes e ano não são mais necessários para o envio manual
         formData.append('prestacao_id', prestacaoIdManual);
 
         try {
-            const response = await fetch(`${API_BASE_URL}/api/processar`, {
+            // Cria o job e acompanha o progresso, sem prender uma requisição longa
+            const response = await fetch(`${API_BASE_URL}${lote ? '/api/lotes' : '/api/jobs'}`, {
                 method: 'POST',
                 body: formData
             });
 
-            let result;
-            const textResponse = await response.text();
-
-            // Log de diagnóstico — ver no DevTools (F12 > Console)
-            console.log('[SICAP] Status:', response.status);
-            console.log('[SICAP] Resposta bruta:', textResponse);
-
-            if (!textResponse || textResponse.trim() === '') {
-                throw new Error(`Resposta vazia do servidor (Status ${response.status}). Verifique os logs do Render.`);
+            const criado = await lerJson(response);
+            if (!response.ok || !criado.job_id) {
+                const msg = criado.mensagem || `Falha ao criar o processamento (Status ${response.status}).`;
+                showStatus(msg, 'error');
+                return;
             }
 
-            try {
-                result = JSON.parse(textResponse);
-            } catch (jsonErr) {
-                throw new Error(`Resposta inválida (Status ${response.status}): ${textResponse.substring(0, 200)}`);
-            }
+            console.log('[SICAP] Job criado:', criado.job_id);
+            const job = await acompanharJob(criado.job_id);
+            const result = job.resultado || {};
 
-            if (response.ok && result.status === 'sucesso') {
+            if (lote && result.detalhes && result.detalhes.arquivos) {
+                showStatus(relatorioLote(result), result.status === 'sucesso' ? 'success' : 'error');
+                console.log('Detalhes:', result.detalhes);
+            } else if (result.status === 'sucesso') {
                 showStatus(result.mensagem, 'success');
                 console.log('Detalhes:', result.detalhes);
 
@@ -183,7 +222,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 const msg = result.mensagem || 'Erro desconhecido';
                 const detalhes = result.detalhes ? JSON.stringify(result.detalhes, null, 2) : '';
                 showStatus(`${msg} ${detalhes}`, 'error');
-                console.error('Detalhes erro:', result);
+                console.error('Detalhes erro:', job);
             }
 
         } catch (error) {
@@ -194,6 +233,167 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Avisa antes do upload se o servidor está com o circuito do SICAP aberto
+    async function verificarSicap() {
+        try {
+            const response = await fetch(`${API_BASE_URL}/health`);
+            const saude = await response.json();
+            if (saude.sicap && saude.sicap.estado === 'aberto') {
+                const espera = Math.ceil(saude.sicap.reabre_em || 0);
+                showStatus(`O SICAP está instável no momento. Novas tentativas de envio serão liberadas em ${espera}s; a validação continua disponível.`, 'error');
+            }
+        } catch (e) {
+            console.warn('[SICAP] Não foi possível consultar /health:', e);
+        }
+    }
+
+    verificarSicap();
+
+    // Validação sem envio: uma chamada a /api/validar por planilha
+    async function validarArquivos(files, prestacaoId) {
+        const planilhas = files.filter(f => !f.name.toLowerCase().endsWith('.zip'));
+        if (planilhas.length !== files.length) {
+            showStatus('Para validar, selecione as planilhas .xlsx (arquivos .zip não são aceitos neste modo).', 'error');
+            return;
+        }
+
+        submitBtn.disabled = true;
+        showStatus(planilhas.length > 1 ? 'Validando planilhas...' : 'Validando planilha...', 'loading');
+
+        try {
+            const resultados = await Promise.all(planilhas.map(async (file) => {
+                const formData = new FormData();
+                formData.append('file', file);
+                formData.append('prestacao_id', prestacaoId);
+                const response = await fetch(`${API_BASE_URL}/api/validar`, {
+                    method: 'POST',
+                    body: formData
+                });
+                return { nome: file.name, result: await lerJson(response) };
+            }));
+
+            const todasValidas = resultados.every(r => r.result.status === 'valido');
+            showStatus(resultados.map(r => relatorioValidacao(r.nome, r.result)).join('\n\n'), todasValidas ? 'success' : 'error');
+            resultados.forEach(r => {
+                if (r.result.payload) statusArea.appendChild(linkPayload(r.nome, r.result.payload));
+            });
+        } catch (error) {
+            console.error('Erro:', error);
+            showStatus(error.message || 'Falha ao conectar com o servidor.', 'error');
+        } finally {
+            submitBtn.disabled = false;
+        }
+    }
+
+    function relatorioValidacao(nome, result) {
+        const detalhes = result.detalhes || {};
+        const linhas = [`${result.status === 'valido' ? '✔' : '✖'} ${nome} — ${result.mensagem || 'Erro desconhecido'}`];
+        if (detalhes.linhas) {
+            detalhes.linhas.slice(0, 200).forEach(l => {
+                linhas.push(`   linha ${l.linha} | ${l.campo}: '${l.valor}' — ${l.problema}`);
+            });
+            if (detalhes.linhas.length > 200) {
+                linhas.push(`   ... e mais ${detalhes.linhas.length - 200} linha(s) (veja o JSON completo no console).`);
+            }
+        } else if (result.status !== 'valido') {
+            linhas.push(JSON.stringify(detalhes, null, 2));
+        }
+        console.log('[SICAP] Validação:', nome, result);
+        return linhas.join('\n');
+    }
+
+    function linkPayload(nome, payload) {
+        const blob = new Blob([JSON.stringify(payload, null, 2)], { type: 'application/json' });
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(blob);
+        link.download = nome.replace(/\.xlsx?$/i, '') + '_payload.json';
+        link.textContent = `Baixar payload JSON (${nome})`;
+        link.style.display = 'block';
+        link.style.marginTop = '0.75rem';
+        return link;
+    }
+
+    const ETAPAS = {
+        leitura: 'Lendo planilha...',
+        mapeamento: 'Mapeando unidades, cargos e linhas de serviço...',
+        validacao: 'Validando dados...',
+        login: 'Autenticando no SICAP...',
+        envio: 'Enviando folha ao SICAP... Isso pode levar alguns minutos.'
+    };
+
+    async function lerJson(response) {
+        const textResponse = await response.text();
+
+        // Log de diagnóstico — ver no DevTools (F12 > Console)
+        console.log('[SICAP] Status:', response.status);
+        console.log('[SICAP] Resposta bruta:', textResponse);
+
+        if (!textResponse || textResponse.trim() === '') {
+            throw new Error(`Resposta vazia do servidor (Status ${response.status}). Verifique os logs do Render.`);
+        }
+        try {
+            return JSON.parse(textResponse);
+        } catch (jsonErr) {
+            throw new Error(`Resposta inválida (Status ${response.status}): ${textResponse.substring(0, 200)}`);
+        }
+    }
+
+    function mostrarEtapa(etapa, arquivo) {
+        const msg = ETAPAS[etapa] || 'Processando...';
+        showStatus(arquivo ? `${arquivo}: ${msg}` : msg, 'loading');
+    }
+
+    function relatorioLote(result) {
+        const linhas = result.detalhes.arquivos.map(a =>
+            `${a.status === 'sucesso' ? '✔' : '✖'} ${a.arquivo} — ${a.mensagem || 'Erro desconhecido'}`
+        );
+        return `${result.mensagem}\n\n${linhas.join('\n')}`;
+    }
+
+    // Acompanha o job por SSE; se o stream cair, consulta o status periodicamente
+    function acompanharJob(jobId) {
+        return new Promise((resolve, reject) => {
+            const consultar = async () => {
+                try {
+                    const response = await fetch(`${API_BASE_URL}/api/jobs/${jobId}`);
+                    const job = await lerJson(response);
+                    if (!response.ok) {
+                        reject(new Error(job.mensagem || `Falha ao consultar o processamento (Status ${response.status}).`));
+                        return;
+                    }
+                    if (job.status === 'concluido' || job.status === 'interrompido') {
+                        resolve(job);
+                        return;
+                    }
+                    if (job.etapa) mostrarEtapa(job.etapa);
+                    setTimeout(consultar, 2000);
+                } catch (err) {
+                    reject(err);
+                }
+            };
+
+            if (!window.EventSource) {
+                consultar();
+                return;
+            }
+
+            const stream = new EventSource(`${API_BASE_URL}/api/jobs/${jobId}/eventos`);
+            stream.addEventListener('etapa', (e) => {
+                const item = JSON.parse(e.data);
+                mostrarEtapa(item.etapa, item.arquivo);
+            });
+            stream.addEventListener('fim', (e) => {
+                stream.close();
+                resolve(JSON.parse(e.data));
+            });
+            stream.onerror = () => {
+                console.warn('[SICAP] Stream de progresso interrompido; consultando status.');
+                stream.close();
+                consultar();
+            };
+        });
+    }
+
     function showStatus(msg, type) {
         statusArea.style.display = 'block';
         statusArea.className = '';
@@ -0,0 +1,132 @@
+"""Configuração do gunicorn para produção (ver Procfile).
+
+Vários processos uvicorn atrás do gunicorn: um upload pesado (pandas, CPU)
+ocupa só o seu worker, e os outros continuam atendendo. A aplicação é
+carregada no processo mestre antes do fork (`preload_app`), junto com
+openpyxl, calamine e o índice dos mapeamentos; os workers herdam essas
+páginas por copy-on-write em vez de carregar cada um a sua cópia.
+
+O que precisa valer entre workers fica fora da memória de cada um: jobs e
+idempotência (reserva do upload em andamento e sucessos recentes) no banco
+SQLite dos jobs, e contadores/histogramas de /metrics no modo multiprocesso
+do prometheus_client (PROMETHEUS_MULTIPROC_DIR), somados na coleta.
+
+No SIGTERM (deploy, escala para baixo), cada worker para de aceitar
+conexões, termina as requisições abertas e espera os jobs e lotes em
+andamento (SICAP_DRENAR_SEGUNDOS) antes de sair.
+
+Configuração via ambiente:
+  PORT                    porta HTTP (padrão 8000)
+  WEB_CONCURRENCY         quantidade de workers (padrão: calculada por CPU e memória)
+  SICAP_WORKER_MB         memória reservada por worker no cálculo automático
+  SICAP_DRENAR_SEGUNDOS   tempo para concluir o que está em andamento no encerramento
+  PROMETHEUS_MULTIPROC_DIR  diretório das métricas dos workers (padrão /tmp/sicap_metricas);
+                            esvaziado a cada início do gunicorn
+
+Uso (na raiz do repositório):
+    gunicorn backend.main:app -c gunicorn.conf.py
+"""
+import gc
+import logging
+import math
+import os
+import shutil
+
+try:
+    import uvicorn_worker  # noqa: F401
+    worker_class = "uvicorn_worker.UvicornWorker"
+except ImportError:
+    worker_class = "uvicorn.workers.UvicornWorker"
+
+# Memória de um worker processando a maior planilha esperada; ver
+# benchmarks/bench_memoria.py (100 mil linhas na aba inteira: ~+500 MB de RSS)
+WORKER_MB = int(os.environ.get("SICAP_WORKER_MB", "512"))
+DRENAR_SEGUNDOS = float(os.environ.get("SICAP_DRENAR_SEGUNDOS", "150"))
+
+# lido pelo prometheus_client, importado depois deste arquivo (preload_app);
+# o diretório precisa existir e começar vazio, sem as séries da execução anterior
+METRICAS_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/sicap_metricas")
+shutil.rmtree(METRICAS_DIR, ignore_errors=True)
+os.makedirs(METRICAS_DIR, exist_ok=True)
+
+
+def _cpus():
+    # CPUs disponíveis para o processo: afinidade e cota do cgroup (contêiner)
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            cota, periodo = f.read().split()
+        if cota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(cota) / int(periodo))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def _memoria():
+    # limite do cgroup (v2 ou v1) ou memória física, em bytes; None se desconhecida
+    for arquivo in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(arquivo) as f:
+                valor = f.read().strip()
+        except OSError:
+            continue
+        if valor.isdigit() and int(valor) < 2 ** 60:
+            return int(valor)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def calcular_workers():
+    """Um worker por CPU mais um (o envio ao SICAP espera rede), limitado
+    pela memória: cada worker pode precisar de SICAP_WORKER_MB."""
+    workers = _cpus() + 1
+    memoria = _memoria()
+    if memoria:
+        workers = min(workers, memoria // (WORKER_MB * 1024 * 1024))
+    return max(1, workers)
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "0")) or calcular_workers()
+preload_app = True
+# SIGTERM -> SIGKILL: drenagem mais uma folga para o encerramento do pool
+graceful_timeout = int(DRENAR_SEGUNDOS) + 10
+# o processamento roda no pool do worker; o event loop continua respondendo
+timeout = 60
+keepalive = 5
+accesslog = "-"
+
+
+def when_ready(server):
+    # processo mestre, aplicação já importada e antes do primeiro fork
+    from backend.main import preparar_mestre
+    preparar_mestre()
+    # o que foi carregado até aqui sai da coleta de lixo: a varredura do gc
+    # nos workers escreveria nesses objetos e desfaria o compartilhamento
+    gc.freeze()
+    server.log.info(f"Aplicação pré-carregada; iniciando {server.num_workers} worker(s) {worker_class}")
+
+
+def child_exit(server, worker):
+    # worker morto (crash, SIGKILL após graceful_timeout): os jobs que eram
+    # dele não vão terminar, e as reservas de idempotência dele são liberadas
+    # (quem esperava em outro worker recebe o erro e pode reenviar)
+    from prometheus_client import multiprocess
+
+    from backend.main import IDEMPOTENCIA, JOBS
+    # gauges "live" do worker saem da coleta; contadores e histogramas ficam
+    multiprocess.mark_process_dead(worker.pid)
+    try:
+        interrompidos = JOBS.interromper(pid=worker.pid)
+        IDEMPOTENCIA.liberar(pid=worker.pid)
+    except Exception as e:
+        logging.warning(f"Falha ao marcar jobs do worker {worker.pid}: {e}")
+        return
+    if interrompidos:
+        server.log.warning(f"Worker {worker.pid} saiu com {interrompidos} job(s) em andamento; marcados como interrompidos")
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from backend.documentos import cns_invalidos, cpfs_invalidos, linhas_excel
+from benchmarks.gerador import _como_texto, _digitos_cns, _digitos_cpf
+from benchmarks.referencia import is_valid_cpf
+
+
+def _cns_valido(valor):
+    # regra do CNS célula a célula: 15 dígitos, prefixo 1/2/7/8/9, soma ponderada múltipla de 11
+    digitos = "".join(c for c in str(valor) if c.isdigit())
+    if len(digitos) != 15 or digitos[0] not in "12789":
+        return False
+    return sum(int(d) * p for d, p in zip(digitos, range(15, 0, -1))) % 11 == 0
+
+
+def _cpfs(n, seed=7):
+    rng = np.random.default_rng(seed)
+    cpfs = _como_texto(_digitos_cpf(rng.integers(0, 10, (n, 9))))
+    # metade com o último dígito trocado
+    return [c[:10] + str((int(c[10]) + 1) % 10) if i % 2 else c for i, c in enumerate(cpfs)]
+
+
+def test_cpfs_invalidos_igual_ao_original():
+    valores = _cpfs(400) + [
+        "529.982.247-25", "52998224725", 52998224725, 2998224725, "11111111111", "00000000000",
+        "123", "", None, float("nan"), "5299822472a5", "529982247250",
+    ]
+    esperado = np.array([not is_valid_cpf(v) for v in valores])
+    np.testing.assert_array_equal(cpfs_invalidos(pd.Series(valores, dtype=object)), esperado)
+
+
+def test_cns_invalidos():
+    rng = np.random.default_rng(3)
+    validos = _como_texto(_digitos_cns(rng, 50))
+    errados = [c[:14] + str((int(c[14]) + 1) % 10) for c in validos]
+    valores = validos + errados + [int(validos[0]), float(validos[1]), "709 8020 6956 0792", "309802069560792", "123"]
+    esperado = np.array([not _cns_valido(v if not isinstance(v, float) else int(v)) for v in valores])
+    np.testing.assert_array_equal(cns_invalidos(pd.Series(valores, dtype=object)), esperado)
+
+
+def test_cns_vazio():
+    serie = pd.Series([None, "", "  ", float("nan")], dtype=object)
+    assert not cns_invalidos(serie).any()
+    assert cns_invalidos(serie, aceitar_vazio=False).all()
+    # coluna numérica com células vazias vira float
+    valido = int(_como_texto(_digitos_cns(np.random.default_rng(1), 1))[0])
+    assert not cns_invalidos(pd.Series([float(valido), np.nan])).any()
+
+
+def test_linhas_excel():
+    assert linhas_excel([False, True, True], pd.RangeIndex(10, 13)) == [13, 14]
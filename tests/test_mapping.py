@@ -0,0 +1,41 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.mapping import MappingIndex
+from backend.processor import ARQUIVO_JSON_MAPEAMENTOS
+from benchmarks.bench_mapeamento import CATEGORIAS, gerar_colunas
+from benchmarks.referencia import mapear
+
+
+@pytest.fixture(scope="module")
+def mapas():
+    with open(ARQUIVO_JSON_MAPEAMENTOS, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def indice(mapas):
+    return MappingIndex(mapas)
+
+
+# células que não são texto comum: números, dígitos em texto, vazios, tipos misturados
+CASOS_ESPECIAIS = [None, math.nan, "", "   ", 0, 1, 1.0, True, 12.7, "42", " 42 ", "4 2", "x", "SEMPRE", "sempre"]
+
+
+@pytest.mark.parametrize("categoria", sorted(set(CATEGORIAS) | {"SEMPRE", "inexistente"}))
+def test_mapear_igual_ao_original(mapas, indice, categoria):
+    valores = gerar_colunas(mapas, 300).get(categoria, []) + CASOS_ESPECIAIS
+    for valor in valores:
+        assert indice.mapear(valor, categoria) == mapear(valor, categoria, mapas), valor
+
+
+def test_mapear_coluna_igual_ao_original(mapas, indice):
+    # 1, 1.0 e True não podem cair no mesmo valor distinto
+    serie = pd.Series(gerar_colunas(mapas, 200)["Unidade"] + [1, 1.0, True, "1", None], dtype=object)
+    ids, _, _ = indice.mapear_coluna(serie, "Unidade")
+    esperado = [mapear(v, "Unidade", mapas) or 0 for v in serie]
+    np.testing.assert_array_equal(ids, esperado)
@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+
+from backend.processor import COLUNAS_610
+from backend.reader import PlanilhaEmLotes, backends_disponiveis, ler_planilha
+from benchmarks.gerador import gerar_planilha
+
+
+@pytest.fixture(scope="module")
+def planilha(tmp_path_factory):
+    return gerar_planilha(str(tmp_path_factory.mktemp("planilhas") / "sintetica.xlsx"), 50, invalidos=0.1)
+
+
+@pytest.mark.parametrize("backend", backends_disponiveis())
+@pytest.mark.parametrize("tamanho_lote", [7, 50, 1000])
+def test_lotes_iguais_a_planilha_inteira(planilha, backend, tamanho_lote):
+    inteira = ler_planilha(planilha, COLUNAS_610, backend=backend)
+    with PlanilhaEmLotes(planilha, COLUNAS_610, tamanho_lote, backend=backend) as lotes:
+        assert lotes.colunas == inteira.colunas
+        pd.testing.assert_frame_equal(lotes.empresa, inteira.empresa)
+        partes = list(lotes.lotes())
+    assert all(len(parte) <= tamanho_lote for parte in partes)
+    pd.testing.assert_frame_equal(pd.concat(partes), inteira.prestadores)
@@ -0,0 +1,44 @@
+import gzip
+
+import pytest
+
+from backend.serializacao import CorpoEmPartes, json_bytes
+
+REGISTROS = [
+    {"Nome": f"Prestador {i} ção", "CPF": f"{i:011d}", "Valor": i * 1.5, "Ativo": i % 2 == 0, "Extra": None}
+    for i in range(25)
+]
+
+
+def _corpo(inicio, fim, lotes, comprimir=False):
+    corpo = CorpoEmPartes(inicio, comprimir=comprimir, spool_max=256)
+    for lote in lotes:
+        corpo.adicionar(lote)
+    return corpo.fechar(fim)
+
+
+@pytest.mark.parametrize("inicio, fim", [
+    ({"Empresa": {"Cnpj": "23604686000125"}, "Mes": "set"}, {"Total": 25}),
+    ({}, {}),
+    ({"Empresa": None}, {}),
+    ({}, {"Total": 0}),
+])
+@pytest.mark.parametrize("tamanho", [1, 7, 25])
+def test_corpo_igual_a_json_bytes(inicio, fim, tamanho):
+    lotes = [REGISTROS[i:i + tamanho] for i in range(0, len(REGISTROS), tamanho)] + [[]]
+    corpo = _corpo(inicio, fim, lotes)
+    esperado = json_bytes({**inicio, "Prestadores": REGISTROS, **fim})
+    assert bytes(corpo) == esperado
+    assert b"".join(corpo) == esperado
+    assert len(corpo) == len(esperado) == corpo.bytes_json
+    assert corpo.registros == len(REGISTROS)
+
+
+def test_corpo_sem_registros():
+    assert bytes(_corpo({"Mes": "set"}, {}, [[]])) == json_bytes({"Mes": "set", "Prestadores": []})
+
+
+def test_corpo_comprimido():
+    corpo = _corpo({"Mes": "set"}, {"Total": 25}, [REGISTROS[:10], REGISTROS[10:]], comprimir=True)
+    assert corpo.cabecalhos == {"Content-Encoding": "gzip"}
+    assert gzip.decompress(bytes(corpo)) == json_bytes({"Mes": "set", "Prestadores": REGISTROS, "Total": 25})